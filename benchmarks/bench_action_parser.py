@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+动作解析器微基准
+
+对 benchmarks/data/ui_tars_outputs.jsonl 中的ui-tars输出语料（source 为 synthetic 的是手写样例，
+其余是用 --harvest 从真实任务日志收集的输出）：
+1. 校验 parse_action_to_structure_output 的解析结果与期望一致
+2. 统计单次解析耗时
+
+用法:
+    python benchmarks/bench_action_parser.py [--iterations 2000]
+    python benchmarks/bench_action_parser.py --harvest task_xxx/task_log_xxx.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import io
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modular.utils import parse_action_to_structure_output, _smart_resize_cached
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ui_tars_outputs.jsonl")
+FACTOR = 28
+
+def load_corpus(path: str = CORPUS_PATH):
+    """加载语料，忽略空行和 # 开头的注释行"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip() and not line.startswith("#")]
+
+def _quiet_parse(entry):
+    """解析时屏蔽解析器的打印输出"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return parse_action_to_structure_output(entry["text"], FACTOR, entry["origin_h"], entry["origin_w"])
+
+def _to_expected(parsed):
+    """将解析结果转换为语料中的期望格式"""
+    return [
+        {"error": True} if "error" in action else
+        {"action_type": action["action_type"], "action_inputs": action["action_inputs"]}
+        for action in parsed
+    ]
+
+def _same(a, b) -> bool:
+    """比较期望与实际结果，浮点数允许误差"""
+    if isinstance(a, float) or isinstance(b, float):
+        return isinstance(a, (int, float)) and isinstance(b, (int, float)) and abs(a - b) < 1e-6
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_same(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    return a == b
+
+def check_correctness(corpus) -> int:
+    """校验语料，返回不一致的条数"""
+    failures = 0
+    for i, entry in enumerate(corpus):
+        actual = _to_expected(_quiet_parse(entry))
+        if not _same(entry["expected"], actual):
+            failures += 1
+            print(f"[MISMATCH] #{i}: {entry['text'][:60]!r}")
+            print(f"  expected: {entry['expected']}")
+            print(f"  actual:   {actual}")
+    synthetic = sum(1 for entry in corpus if entry.get("source") == "synthetic")
+    print(f"正确性: {len(corpus) - failures}/{len(corpus)} 条一致"
+          f"（合成样例 {synthetic} 条，真实日志 {len(corpus) - synthetic} 条）")
+    return failures
+
+def run_benchmark(corpus, iterations: int):
+    """统计解析耗时"""
+    _smart_resize_cached.cache_clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for entry in corpus:
+                parse_action_to_structure_output(entry["text"], FACTOR, entry["origin_h"], entry["origin_w"])
+        elapsed = time.perf_counter() - start
+    total = iterations * len(corpus)
+    print(f"解析 {total} 次，共 {elapsed:.3f}s，平均 {elapsed / total * 1e6:.2f}µs/次")
+    print(f"smart_resize 缓存: {_smart_resize_cached.cache_info()}")
+
+def harvest(log_paths, origin_w: int, origin_h: int):
+    """从TaskLogger日志中收集ui-tars原始输出，追加到语料（期望值为当前解析结果，需人工复核）"""
+    existing = {entry["text"] for entry in load_corpus()}
+    added = 0
+    with open(CORPUS_PATH, "a", encoding="utf-8") as f:
+        for log_path in log_paths:
+            with open(log_path, "r", encoding="utf-8") as log_file:
+                log_data = json.load(log_file)
+            for call in log_data.get("model_calls", []):
+                text = call.get("output_data", {}).get("response")
+                if call.get("call_type") != "ui_tars" or not text or text in existing:
+                    continue
+                entry = {"source": os.path.basename(log_path), "text": text,
+                         "origin_w": origin_w, "origin_h": origin_h}
+                entry["expected"] = _to_expected(_quiet_parse(entry))
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                existing.add(text)
+                added += 1
+    print(f"新增 {added} 条语料到 {CORPUS_PATH}")
+
+def main():
+    parser = argparse.ArgumentParser(description="动作解析器微基准")
+    parser.add_argument("--iterations", type=int, default=2000, help="每条语料的解析次数")
+    parser.add_argument("--harvest", nargs="+", help="从TaskLogger JSON日志中收集语料")
+    parser.add_argument("--origin-w", type=int, default=1080, help="收集语料时使用的截图宽度")
+    parser.add_argument("--origin-h", type=int, default=2400, help="收集语料时使用的截图高度")
+    args = parser.parse_args()
+
+    if args.harvest:
+        harvest(args.harvest, args.origin_w, args.origin_h)
+        return
+
+    corpus = load_corpus()
+    failures = check_correctness(corpus)
+    run_benchmark(corpus, args.iterations)
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+多截图反思请求基准：逐张发送 vs 缩略图拼图
+
+对同一组截图比较两种请求构造方式的图片字节数（base64后）、构造耗时，以及按给定上行带宽
+估算的上传耗时。拼图模式下最新截图仍以原图发送。截图来自任务文件夹（TaskLogger 保存的
+screenshot_*.jpg），未指定时合成手机界面尺寸的截图。需要 numpy 和 PIL。
+
+用法:
+    python benchmarks/bench_contact_sheet.py [--task-folder task_xxx] [--frames 30] [--repeat 5] [--bandwidth-mbps 20]
+"""
+
+import os
+import io
+import sys
+import glob
+import time
+import random
+import argparse
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+
+from modular.contact_sheet import screenshot_parts, parts_bytes
+
+def synthetic_screenshots(count: int, size=(1080, 2400), seed: int = 0):
+    """合成带状态栏、列表项和按钮的界面截图，相邻帧有少量变化"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    frames = []
+    for i in range(count):
+        img = Image.new("RGB", size, (245, 245, 245))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((0, 0, size[0], 90), fill=(30, 30, 30))
+        page = i // 4
+        for row in range(12):
+            top = 140 + row * 170
+            color = ((page * 40 + row * 13) % 255, (row * 29) % 255, (page * 70) % 255)
+            draw.rectangle((40, top, 180, top + 140), fill=color)
+            draw.rectangle((220, top + 30, 220 + rng.randint(300, 780), top + 60), fill=(90, 90, 90))
+            draw.rectangle((220, top + 85, 220 + rng.randint(200, 600), top + 105), fill=(160, 160, 160))
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        frames.append(buffer.getvalue())
+    return frames
+
+def load_task_screenshots(task_folder: str):
+    """读取任务文件夹中保存的截图"""
+    frames = []
+    for path in sorted(glob.glob(os.path.join(task_folder, "screenshot_*.jpg"))):
+        with open(path, "rb") as f:
+            frames.append(f.read())
+    return frames
+
+def time_build(frames, contact_sheet: bool, repeat: int):
+    """返回 (中位构造耗时秒, 图片字节数, 图片数)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parts, used_sheet = screenshot_parts(frames[:-1], frames[-1], contact_sheet=contact_sheet)
+        timings.append(time.perf_counter() - start)
+    if contact_sheet and not used_sheet:
+        raise RuntimeError("拼图失败，请确认已安装 numpy 和 PIL")
+    return statistics.median(timings), parts_bytes(parts), len(parts)
+
+def main():
+    parser = argparse.ArgumentParser(description="多截图反思请求基准：逐张发送 vs 缩略图拼图")
+    parser.add_argument("--task-folder", default=None, help="TaskLogger 生成的任务文件夹，默认合成截图")
+    parser.add_argument("--frames", type=int, default=30, help="合成截图数量")
+    parser.add_argument("--repeat", type=int, default=5, help="每种方式的构造次数")
+    parser.add_argument("--bandwidth-mbps", type=float, default=20.0, help="估算上传耗时使用的上行带宽")
+    args = parser.parse_args()
+
+    frames = load_task_screenshots(args.task_folder) if args.task_folder else synthetic_screenshots(args.frames)
+    if len(frames) < 2:
+        print("截图不足2张")
+        sys.exit(1)
+    print(f"截图: {len(frames)} 张（{sum(len(f) for f in frames) / 1024:.0f}KB）")
+
+    results = {}
+    for label, contact_sheet in (("逐张发送", False), ("缩略图拼图", True)):
+        build_time, image_bytes, images = time_build(frames, contact_sheet, args.repeat)
+        upload_time = image_bytes * 8 / (args.bandwidth_mbps * 1_000_000)
+        results[label] = (build_time, image_bytes, upload_time)
+        print(f"  {label}: {images} 张图片，{image_bytes / 1024:.0f}KB，构造 {build_time * 1000:.1f}ms，"
+              f"上传约 {upload_time * 1000:.0f}ms（{args.bandwidth_mbps:g}Mbps）")
+
+    base, sheet = results["逐张发送"], results["缩略图拼图"]
+    print(f"请求图片字节减少 {1 - sheet[1] / base[1]:.1%}，"
+          f"构造+上传耗时 {(base[0] + base[2]) * 1000:.0f}ms -> {(sheet[0] + sheet[2]) * 1000:.0f}ms")
+
+if __name__ == "__main__":
+    main()
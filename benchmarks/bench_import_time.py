@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+modular包导入耗时基准
+
+每个场景在独立的子进程中运行（避免模块缓存影响），取多次运行的中位数。
+
+用法:
+    python benchmarks/bench_import_time.py [--repeat 5]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 场景名 -> 要计时的代码
+SCENARIOS = {
+    "import modular": "import modular",
+    "modular.Config": "import modular; modular.Config",
+    "frontend imports": "from modular import run_gui_task, decompose_task_to_subtasks, TaskLogger, TaskBudget",
+    "knowledge_manager": "import modular; modular.get_knowledge_manager()",
+    "full init": ("import modular; modular.get_model_manager(); modular.get_knowledge_manager(); "
+                  "modular.get_mobile_agent(); modular.get_planning_manager(); modular.get_reflection_manager()"),
+}
+
+_RUNNER = """
+import io, json, sys, time, contextlib
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    exec({code!r})
+elapsed = time.perf_counter() - start
+heavy = [m for m in ("openai", "PIL", "numpy", "requests") if m in sys.modules]
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy}}))
+"""
+
+def run_scenario(code: str, repeat: int):
+    """在子进程中运行场景，返回(中位耗时秒, 已加载的重依赖)；失败时返回(None, 错误信息)"""
+    timings = []
+    heavy = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", _RUNNER.format(root=REPO_ROOT, code=code)],
+            capture_output=True, text=True, cwd=REPO_ROOT
+        )
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1] if result.stderr else "unknown error"
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(data["elapsed"])
+        heavy = data["heavy"]
+    return statistics.median(timings), heavy
+
+def main():
+    parser = argparse.ArgumentParser(description="modular包导入耗时基准")
+    parser.add_argument("--repeat", type=int, default=5, help="每个场景运行次数")
+    args = parser.parse_args()
+
+    print(f"{'场景':<20}{'中位耗时':>12}  已加载的重依赖")
+    for name, code in SCENARIOS.items():
+        elapsed, info = run_scenario(code, args.repeat)
+        if elapsed is None:
+            print(f"{name:<20}{'失败':>12}  {info}")
+        else:
+            print(f"{name:<20}{elapsed * 1000:>10.1f}ms  {', '.join(info) or '-'}")
+
+if __name__ == "__main__":
+    main()
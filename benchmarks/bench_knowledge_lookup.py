@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+知识库路径查找基准
+
+生成指定规模的合成知识树（默认10^5个节点），对比：
+1. 递归搜索 _find_path_with_notes + _path_to_sentence（每次查找遍历整棵树）
+2. 路径索引 get_path_sentence（查找开销只与路径长度有关）
+并校验两者结果一致。同时校验仓库自带 knowledge.json 中的所有功能。
+
+用法:
+    python benchmarks/bench_knowledge_lookup.py [--nodes 100000] [--branching 8] [--samples 100]
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import random
+import argparse
+import tempfile
+import contextlib
+from collections import deque
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from modular.knowledge import KnowledgeManager
+
+def build_synthetic_tree(num_nodes: int, branching: int, seed: int = 0):
+    """按广度优先生成合成知识树：根为app，中间层为菜单/页面，叶子为功能"""
+    rng = random.Random(seed)
+    root = {"name": "合成app", "type": "app", "children": []}
+    queue = deque([root])
+    count = 1
+    while queue and count < num_nodes:
+        parent = queue.popleft()
+        for _ in range(rng.randint(1, branching)):
+            if count >= num_nodes:
+                break
+            kind = rng.choice(["menu", "page", "page", "feature"])
+            # 部分菜单名称为空，与真实知识库一致
+            name = "" if kind == "menu" and rng.random() < 0.3 else f"{kind}{count}"
+            child = {"name": name, "type": kind}
+            if rng.random() < 0.2:
+                child["note"] = f"位置提示{count}"
+            if kind != "feature":
+                child["children"] = []
+                queue.append(child)
+            parent["children"].append(child)
+            count += 1
+    return root, count
+
+def load_manager(path: str) -> KnowledgeManager:
+    """加载知识库时屏蔽打印输出"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return KnowledgeManager(path, knowledge_dir="")
+
+def old_lookup(km: KnowledgeManager, target: str):
+    path = km._find_path_with_notes(km.data, target)
+    return km._path_to_sentence(path) if path else None
+
+def check_targets(km: KnowledgeManager, targets) -> int:
+    """校验索引查找与递归搜索的结果，返回不一致的条数"""
+    failures = 0
+    for target in targets:
+        if old_lookup(km, target) != km.get_path_sentence(target) or \
+                km._find_path_with_notes(km.data, target) != km.find_path(target):
+            failures += 1
+            print(f"[MISMATCH] {target!r}")
+    return failures
+
+def time_lookups(fn, targets):
+    start = time.perf_counter()
+    for target in targets:
+        fn(target)
+    return (time.perf_counter() - start) / len(targets)
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库路径查找基准")
+    parser.add_argument("--nodes", type=int, default=100_000, help="合成知识树节点数")
+    parser.add_argument("--branching", type=int, default=8, help="每个节点的最大子节点数")
+    parser.add_argument("--samples", type=int, default=100, help="查找的目标数量")
+    args = parser.parse_args()
+
+    # 仓库自带知识库：所有功能逐一校验
+    km = load_manager(os.path.join(REPO_ROOT, "knowledge.json"))
+    features = {f for fs in km.knowledge_base.values() for f in fs if f}
+    failures = check_targets(km, features)
+    print(f"knowledge.json: {len(features) - failures}/{len(features)} 个功能结果一致")
+
+    # 合成知识树
+    tree, count = build_synthetic_tree(args.nodes, args.branching)
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+        json.dump(tree, f, ensure_ascii=False)
+        tree_path = f.name
+    try:
+        start = time.perf_counter()
+        km = load_manager(tree_path)
+        load_time = time.perf_counter() - start
+        start = time.perf_counter()
+        km._build_shard(tree_path, 0.0, km.data)
+        index_time = time.perf_counter() - start
+        names = [name for name in km._state.shards[tree_path].name_index if name]
+    finally:
+        os.remove(tree_path)
+
+    targets = random.Random(1).sample(names, min(args.samples, len(names)))
+    failures += check_targets(km, targets)
+
+    old_avg = time_lookups(lambda t: old_lookup(km, t), targets)
+    new_avg = time_lookups(km.get_path_sentence, targets)
+    print(f"合成知识树: {count} 个节点，加载 {load_time * 1000:.1f}ms（其中构建索引 {index_time * 1000:.1f}ms）")
+    print(f"递归搜索: {old_avg * 1e3:.3f}ms/次")
+    print(f"路径索引: {new_avg * 1e6:.2f}µs/次（加速 {old_avg / new_avg:.0f}x）")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+知识库启动耗时基准
+
+对比 KnowledgeManager 加载知识文件的两条路径：
+1. 解析JSON并构建所有索引
+2. 读取编译好的二进制快照（python -m modular.knowledge compile）
+同时校验两者的索引一致，以及知识文件修改后快照会被判定为过期。
+
+用法:
+    python benchmarks/bench_knowledge_startup.py [--nodes 100000] [--repeat 5]
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from modular.knowledge import KnowledgeManager
+from bench_knowledge_lookup import build_synthetic_tree
+
+def load_manager(path: str) -> KnowledgeManager:
+    """加载知识库时屏蔽打印输出"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return KnowledgeManager(path, knowledge_dir="")
+
+def time_load(path: str, repeat: int):
+    """返回(中位加载耗时秒, 最后一次加载的分片)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        km = load_manager(path)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), km._state.shards[path]
+
+def same_index(a, b) -> bool:
+    """比较两个分片的索引"""
+    return (a.data == b.data and a.knowledge_base == b.knowledge_base and a.name_index == b.name_index
+            and a.app_index == b.app_index and a.parents == b.parents and a.steps == b.steps
+            and a.feature_owners == b.feature_owners and a.matcher.patterns == b.matcher.patterns
+            and all(a.matcher.find_all(p) == b.matcher.find_all(p) for p in a.matcher.patterns[:1000]))
+
+def bench_file(label: str, json_path: str, repeat: int) -> bool:
+    """对一个知识文件对比两条加载路径，返回结果是否正确"""
+    snapshot = KnowledgeManager.snapshot_path(json_path)
+    if os.path.exists(snapshot):
+        os.remove(snapshot)
+    json_time, json_shard = time_load(json_path, repeat)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        load_manager(json_path).compile_snapshot(json_path)
+    snapshot_time, snapshot_shard = time_load(json_path, repeat)
+    ok = same_index(json_shard, snapshot_shard)
+
+    print(f"{label}: JSON {os.path.getsize(json_path) / 1024:.0f}KB，快照 {os.path.getsize(snapshot) / 1024:.0f}KB")
+    print(f"  解析JSON并构建索引: {json_time * 1000:.1f}ms")
+    print(f"  读取快照:           {snapshot_time * 1000:.1f}ms（加速 {json_time / snapshot_time:.1f}x）")
+    print(f"  索引一致: {'是' if ok else '否'}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库启动耗时基准")
+    parser.add_argument("--nodes", type=int, default=100_000, help="合成知识树节点数")
+    parser.add_argument("--branching", type=int, default=8, help="每个节点的最大子节点数")
+    parser.add_argument("--repeat", type=int, default=5, help="每条路径的加载次数")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        # 仓库自带知识库（复制到临时目录，避免在仓库中留下快照）
+        repo_copy = os.path.join(work_dir, "knowledge.json")
+        shutil.copy(os.path.join(REPO_ROOT, "knowledge.json"), repo_copy)
+        ok = bench_file("knowledge.json", repo_copy, args.repeat)
+
+        tree, count = build_synthetic_tree(args.nodes, args.branching)
+        synthetic = os.path.join(work_dir, "synthetic.json")
+        with open(synthetic, "w", encoding="utf-8") as f:
+            json.dump(tree, f, ensure_ascii=False)
+        ok = bench_file(f"合成知识树({count}个节点)", synthetic, args.repeat) and ok
+
+        # 修改知识文件后快照应失效
+        with open(repo_copy, "a", encoding="utf-8") as f:
+            f.write("\n")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            KnowledgeManager(repo_copy, knowledge_dir="")
+        stale_detected = "已过期" in output.getvalue()
+        print(f"知识文件修改后快照失效: {'是' if stale_detected else '否'}")
+        ok = ok and stale_detected
+    finally:
+        shutil.rmtree(work_dir)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,7 @@ project_root = Path(__file__).parent
 sys.path.append(str(project_root))
 
 # 导入模块化的Mobile Agent
-from modular import run_gui_task, decompose_task_to_subtasks, TaskLogger
+from modular import run_gui_task, decompose_task_to_subtasks, get_planning_manager, get_reflection_manager, TaskLogger, TaskBudget, BUDGET_EXHAUSTED
 
 app = Flask(__name__)
 CORS(app)  # 启用跨域支持
@@ -37,6 +37,7 @@ execution_status = {
 class TaskExecutor:
     def __init__(self):
         self.current_task_logger = None
+        self.current_budget = None
         self.should_stop = False
         self.task_knowledge = None
         
@@ -51,6 +52,8 @@ class TaskExecutor:
             
             # 创建任务日志记录器
             self.current_task_logger = TaskLogger(instruction)
+            # 创建任务预算
+            self.current_budget = TaskBudget.from_config(task_logger=self.current_task_logger)
             
             # 任务分解
             execution_status['status'] = 'decomposing'
@@ -62,7 +65,8 @@ class TaskExecutor:
             
             subtask_list = decompose_task_to_subtasks(
                 user_instruction=instruction, 
-                task_logger=self.current_task_logger
+                task_logger=self.current_task_logger,
+                budget=self.current_budget
             )
             
             if not subtask_list:
@@ -102,8 +106,9 @@ class TaskExecutor:
             completed_subtasks = []
             failed_subtasks = []
             actual_completed_subtasks = []
+            budget_exhausted = False
             
-            while regeneration_cycle < max_regeneration_cycles and not self.should_stop:
+            while regeneration_cycle < max_regeneration_cycles and not self.should_stop and not budget_exhausted:
                 if not subtask_list:
                     yield json.dumps({
                         'type': 'log',
@@ -139,6 +144,7 @@ class TaskExecutor:
                     }) + '\n'
                     
                     # 执行子任务
+                    subtask_start_time = time.time()
                     result = run_gui_task(
                         instruction=subtask.get("description", ""),
                         model_type="qwen25vl",
@@ -148,7 +154,8 @@ class TaskExecutor:
                         completed_subtasks=completed_subtasks,
                         all_subtasks=subtask_list,
                         task_logger=self.current_task_logger,
-                        task_knowledge=self.task_knowledge
+                        task_knowledge=self.task_knowledge,
+                        budget=self.current_budget
                     )
                     
                     # 发送截图更新
@@ -162,14 +169,36 @@ class TaskExecutor:
                         # 子任务成功完成
                         completed_subtasks.append(subtask.get("description", ""))
                         actual_completed_subtasks.append(subtask)
+                        self.current_task_logger.log_subtask_completion(
+                            subtask_id=subtask.get("subtask_id", i + 1),
+                            subtask_description=subtask.get("description", ""),
+                            completion_time=time.time() - subtask_start_time,
+                            success=True
+                        )
                         yield json.dumps({
                             'type': 'log',
                             'message': f'子任务 {i + 1} 执行成功',
                             'level': 'success'
                         }) + '\n'
+                    elif result == BUDGET_EXHAUSTED:
+                        # 预算耗尽，停止执行
+                        failed_subtasks.append(subtask)
+                        budget_exhausted = True
+                        yield json.dumps({
+                            'type': 'log',
+                            'message': f'任务预算已耗尽，停止执行: {self.current_budget.get_summary()}',
+                            'level': 'error'
+                        }) + '\n'
+                        break
                     elif result == "FAILED":
                         # 子任务执行失败
                         failed_subtasks.append(subtask)
+                        self.current_task_logger.log_subtask_completion(
+                            subtask_id=subtask.get("subtask_id", i + 1),
+                            subtask_description=subtask.get("description", ""),
+                            completion_time=time.time() - subtask_start_time,
+                            success=False
+                        )
                         yield json.dumps({
                             'type': 'log',
                             'message': f'子任务 {i + 1} 执行失败',
@@ -199,7 +228,26 @@ class TaskExecutor:
                     break
             
             # 任务完成
-            execution_status['status'] = 'completed'
+            self.current_task_logger.log_budget_event("final", self.current_budget.get_summary())
+            if budget_exhausted:
+                final_status = BUDGET_EXHAUSTED
+            elif self.should_stop:
+                final_status = "STOPPED"
+            else:
+                final_status = "COMPLETED"
+            if final_status != "STOPPED":
+                # 报告计划执行结果：顺利完成时写入新计划，否则从计划缓存中删除
+                get_planning_manager().report_plan_outcome(
+                    instruction, final_status == "COMPLETED" and not failed_subtasks, self.current_task_logger
+                )
+            self.current_task_logger.log_task_completion(
+                final_status,
+                [t.get("description", "") for t in actual_completed_subtasks],
+                [t.get("description", "") for t in failed_subtasks]
+            )
+            get_reflection_manager().join_pending()
+            self.current_task_logger.save_log()
+            execution_status['status'] = 'budget_exhausted' if budget_exhausted else 'completed'
             yield json.dumps({
                 'type': 'log',
                 'message': f'任务执行完成。成功: {len(actual_completed_subtasks)}, 失败: {len(failed_subtasks)}',
@@ -210,7 +258,8 @@ class TaskExecutor:
                 'type': 'completion',
                 'completed': len(actual_completed_subtasks),
                 'failed': len(failed_subtasks),
-                'total': len(actual_completed_subtasks) + len(failed_subtasks)
+                'total': len(actual_completed_subtasks) + len(failed_subtasks),
+                'budget': self.current_budget.get_summary()
             }) + '\n'
             
         except Exception as e:
@@ -1,28 +1,124 @@
 """
 Mobile Agent 模块化包
+
+子模块和全局实例均为惰性加载：首次访问某个名称时才导入对应子模块，
+全局管理器实例（model_manager、knowledge_manager等）在首次使用时才创建。
 """
 
+import importlib
+
 __version__ = "2.0.0"
 __author__ = "Mobile Agent Team"
 
-from .config import *
-from .utils import *
-from .knowledge import *
-from .logger import *
-from .models import *
-from .actions import *
-from .reflection import *
-from .planning import *
-from .agent import *
+# 公开名称 -> 所在子模块
+_LAZY_ATTRS = {
+    # config
+    'Config': 'config',
+    # utils
+    'lazy_singleton': 'utils',
+    'smart_resize': 'utils',
+    'ParsedAction': 'utils',
+    'ActionParseError': 'utils',
+    'parse_action': 'utils',
+    'parse_actions': 'utils',
+    'parse_action_to_structure_output': 'utils',
+    'convert_point_to_coordinates': 'utils',
+    'calculate_image_similarity': 'utils',
+    'compute_image_hash': 'utils',
+    'hash_distance': 'utils',
+    'target_name': 'utils',
+    'check_screenshot_service_health': 'utils',
+    # knowledge
+    'KnowledgeManager': 'knowledge',
+    'get_knowledge_manager': 'knowledge',
+    'knowledge_manager': 'knowledge',
+    # logger
+    'TaskLogger': 'logger',
+    # budget
+    'TaskBudget': 'budget',
+    'BUDGET_EXHAUSTED': 'budget',
+    # models
+    'ModelManager': 'models',
+    'get_model_manager': 'models',
+    'model_manager': 'models',
+    # actions
+    'ActionExecutor': 'actions',
+    'get_action_executor': 'actions',
+    'action_executor': 'actions',
+    # action_repair
+    'ActionRepairer': 'action_repair',
+    'action_repairer': 'action_repair',
+    'get_action_repairer': 'action_repair',
+    'validate_parsed_actions': 'action_repair',
+    # routing
+    'OperateModelRouter': 'routing',
+    'RoutingSignals': 'routing',
+    'get_operate_router': 'routing',
+    # replay
+    'TrajectoryCache': 'replay',
+    'get_trajectory_cache': 'replay',
+    # app_launcher
+    'AppResolver': 'app_launcher',
+    'get_app_resolver': 'app_launcher',
+    'parse_launch_target': 'app_launcher',
+    # launcher_cache
+    'LauncherIconCache': 'launcher_cache',
+    'get_launcher_icon_cache': 'launcher_cache',
+    # keyframes
+    'select_keyframes': 'keyframes',
+    # contact_sheet
+    'build_contact_sheets': 'contact_sheet',
+    # reflection_gate
+    'ReflectionGate': 'reflection_gate',
+    # reflection_cache
+    'ReflectionCache': 'reflection_cache',
+    'get_reflection_cache': 'reflection_cache',
+    # plan_cache
+    'PlanCache': 'plan_cache',
+    'get_plan_cache': 'plan_cache',
+    # plan_parser
+    'PlanParser': 'plan_parser',
+    'PlanParseError': 'plan_parser',
+    'get_plan_parser': 'plan_parser',
+    # reflection
+    'ReflectionManager': 'reflection',
+    'get_reflection_manager': 'reflection',
+    'reflection_manager': 'reflection',
+    # planning
+    'PlanningManager': 'planning',
+    'get_planning_manager': 'planning',
+    'planning_manager': 'planning',
+    # agent
+    'MobileAgent': 'agent',
+    'get_mobile_agent': 'agent',
+    'mobile_agent': 'agent',
+    'run_gui_task': 'agent',
+    'decompose_task_to_subtasks': 'agent',
+}
 
 __all__ = [
     'Config',
-    'TaskLogger', 
+    'TaskLogger',
+    'TaskBudget',
+    'BUDGET_EXHAUSTED',
     'KnowledgeManager',
     'ActionExecutor',
+    'ActionRepairer',
     'ReflectionManager',
     'PlanningManager',
     'MobileAgent',
     'run_gui_task',
     'decompose_task_to_subtasks'
-] 
\ No newline at end of file
+]
+
+def __getattr__(name):
+    """首次访问时导入子模块并缓存该名称"""
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
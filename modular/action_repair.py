@@ -0,0 +1,278 @@
+"""
+动作格式修复模块
+
+在调用格式更正模型之前，先用确定性规则修复ui-tars输出中的常见格式问题：
+中文标点、错误引号、缺失括号、start_point/start_box混用、裸坐标、<point>变体等。
+"""
+
+import re
+import ast
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+from .utils import lazy_singleton
+
+# 中文/全角标点到ASCII的映射（仅用于动作部分的结构字符，不影响引号内的文本内容）
+_STRUCT_PUNCT = {
+    "（": "(",
+    "）": ")",
+    "，": ",",
+    "：": ":",
+    "＝": "=",
+    "【": "[",
+    "】": "]",
+}
+_QUOTE_CHARS = "'\"‘’“”`"
+_CN_CHARS = "".join(_STRUCT_PUNCT) + "‘’“”"
+
+# 函数名别名 -> 标准动作名
+_FUNC_ALIASES = {
+    "click": "click",
+    "tap": "click",
+    "left_single": "click",
+    "left_click": "click",
+    "long_press": "long_press",
+    "longpress": "long_press",
+    "long_click": "long_press",
+    "drag": "drag",
+    "swipe": "drag",
+    "slide": "drag",
+    "type": "type",
+    "input": "type",
+    "input_text": "type",
+    "press_home": "press_home",
+    "home": "press_home",
+    "press_back": "press_back",
+    "back": "press_back",
+    "finished": "finished",
+    "finish": "finished",
+    "done": "finished",
+}
+
+_THOUGHT_LABEL = re.compile(r"(?:^|\n)\s*(?:thought|思考)\s*[:：]", re.IGNORECASE)
+_ACTION_LABEL = re.compile(r"(?:^|\n)\s*(?:action|动作)\s*[:：]", re.IGNORECASE)
+_FUNC_CALL = re.compile(r"^\s*([A-Za-z_]+)\s*[\(（]?(.*?)[\)）]?\s*$", re.DOTALL)
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_CONTENT_PREFIX = re.compile(r"^\s*(?:content|text)\s*[=＝:：]\s*", re.IGNORECASE)
+_CODE_FENCE = re.compile(r"```[a-zA-Z]*")
+_CANONICAL_POINT = re.compile(r"<point>\d+ \d+</point>")
+# 文本类动作的开头（内容以引号开始），以及结束引号加右括号
+_CONTENT_CALL = re.compile(r"^\s*(?:type|input|input_text|finished|finish|done)\s*[\(（]\s*"
+                           r"(?:(?:content|text)\s*[=＝:：]\s*)?[" + _QUOTE_CHARS + "]", re.IGNORECASE)
+_CONTENT_END = re.compile(r"[" + _QUOTE_CHARS + r"]\s*[\)）]\s*$")
+
+
+def _center(nums: List[float]) -> Tuple[int, int]:
+    """2个数为点，4个数为框，返回中心点"""
+    if len(nums) >= 4:
+        return round((nums[0] + nums[2]) / 2), round((nums[1] + nums[3]) / 2)
+    return round(nums[0]), round(nums[1])
+
+
+def _point(x: int, y: int) -> str:
+    return f"'<point>{x} {y}</point>'"
+
+
+class ActionRepairer:
+    """动作格式修复器"""
+
+    def __init__(self):
+        self.stats = {"attempts": 0, "hits": 0, "misses": 0, "fixes": {}}
+        self._lock = threading.Lock()
+
+    def _split_thought_action(self, text: str, fixes: List[str]) -> Tuple[str, str]:
+        """拆分Thought和Action部分"""
+        action_match = None
+        for action_match in _ACTION_LABEL.finditer(text):
+            pass
+        if action_match:
+            head = text[:action_match.start()]
+            action_part = text[action_match.end():]
+            if "Action:" not in text:
+                fixes.append("action_label")
+        else:
+            # 没有Action标签时，从最后一行开始找可识别的函数调用
+            lines = [line for line in text.splitlines() if line.strip()]
+            idx = len(lines) - 1
+            while idx >= 0 and not self._looks_like_call(lines[idx]):
+                idx -= 1
+            if idx < 0:
+                return "", ""
+            head = "\n".join(lines[:idx])
+            action_part = "\n".join(lines[idx:])
+            fixes.append("missing_action_label")
+
+        thought_match = _THOUGHT_LABEL.search(head)
+        thought = head[thought_match.end():] if thought_match else head
+        return thought.strip(), action_part.strip()
+
+    def _looks_like_call(self, line: str) -> bool:
+        """判断一行是否为函数调用（函数名后紧跟括号或单独成行）"""
+        match = re.match(r"^\s*([A-Za-z_]+)\s*(?:[\(（]|$)", line)
+        return bool(match) and match.group(1).lower() in _FUNC_ALIASES
+
+    @staticmethod
+    def _inside_content(action: str) -> bool:
+        """文本类动作的引号内容还没有结束（内容跨行）"""
+        return bool(_CONTENT_CALL.match(action)) and not _CONTENT_END.search(action)
+
+    def _split_actions(self, action_part: str) -> List[str]:
+        """按行拆分多个动作，续行（以及跨行的文本内容）并入上一动作"""
+        actions = []
+        for line in action_part.splitlines():
+            if actions and self._inside_content(actions[-1]):
+                actions[-1] += "\n" + line
+                continue
+            if not line.strip():
+                continue
+            if actions and not self._looks_like_call(line):
+                actions[-1] += "\n" + line
+            else:
+                actions.append(line)
+        return actions
+
+    def _repair_content(self, body: str, fixes: List[str]) -> Optional[str]:
+        """修复type/finished的content参数"""
+        body = _CONTENT_PREFIX.sub("", body.strip(), count=1)
+        if body and body[0] in _QUOTE_CHARS:
+            body = body[1:]
+        if body and body[-1] in _QUOTE_CHARS:
+            body = body[:-1]
+        escaped = re.sub(r"(?<!\\)'", r"\\'", body)
+        if escaped != body:
+            fixes.append("escape_quote")
+        if "\n" in escaped:
+            # 跨行的内容转义为 \n，保持动作在一行内
+            escaped = escaped.replace("\r\n", "\n").replace("\n", "\\n")
+            fixes.append("multiline_content")
+        return f"content='{escaped}'"
+
+    def _repair_one(self, action: str, fixes: List[str]) -> Optional[str]:
+        """修复单个动作，无法修复时返回None"""
+        action = _CODE_FENCE.sub("", action).strip()
+        match = _FUNC_CALL.match(action)
+        if not match:
+            return None
+        raw_name, body = match.group(1), match.group(2)
+        func = _FUNC_ALIASES.get(raw_name.lower())
+        if func is None:
+            return None
+        if func != raw_name:
+            fixes.append("func_alias")
+        if not re.search(r"[\)）]\s*$", action):
+            fixes.append("missing_paren")
+        if func in ("press_home", "press_back"):
+            return f"{func}()"
+
+        # 文本类动作只检查括号和首尾引号，内容中的中文标点保持原样
+        structural = action if func not in ("type", "finished") else \
+            action[len(raw_name):len(raw_name) + 2] + action[-2:] + body.strip()[:1] + body.strip()[-1:]
+        if any(ch in structural for ch in _CN_CHARS):
+            fixes.append("cn_punct")
+
+        if func in ("type", "finished"):
+            content = self._repair_content(body, fixes)
+            return f"{func}({content})" if content is not None else None
+
+        # 坐标类动作：中文标点只在这里替换，避免改动文本内容
+        for src, dst in _STRUCT_PUNCT.items():
+            body = body.replace(src, dst)
+        nums = [float(n) for n in _NUMBER.findall(body)]
+        if "<point>" not in body and "point=" not in body and "box=" not in body:
+            fixes.append("bare_coords")
+        if "box=" in body:
+            fixes.append("box_to_point")
+        if "<point>" in body and not _CANONICAL_POINT.search(body):
+            fixes.append("point_variant")
+
+        if func in ("click", "long_press"):
+            if len(nums) not in (2, 4):
+                return None
+            x, y = _center(nums)
+            return f"{func}(point={_point(x, y)})"
+
+        # drag：4个数为两个点，8个数为两个框
+        if len(nums) == 4:
+            (x1, y1), (x2, y2) = _center(nums[:2]), _center(nums[2:])
+        elif len(nums) == 8:
+            (x1, y1), (x2, y2) = _center(nums[:4]), _center(nums[4:])
+        else:
+            return None
+        return f"drag(start_point={_point(x1, y1)}, end_point={_point(x2, y2)})"
+
+    def repair(self, text: str) -> Tuple[Optional[str], List[str]]:
+        """修复ui-tars输出，返回(修复后的文本, 应用的修复列表)；无法修复时文本为None"""
+        fixes = []
+        if not text or not text.strip():
+            return None, fixes
+
+        cleaned = _CODE_FENCE.sub("", text).strip()
+        thought, action_part = self._split_thought_action(cleaned, fixes)
+        if not action_part:
+            return None, fixes
+
+        repaired_actions = []
+        for action in self._split_actions(action_part):
+            repaired = self._repair_one(action, fixes)
+            if repaired is None:
+                return None, fixes
+            try:
+                ast.parse(repaired, mode="eval")
+            except SyntaxError:
+                return None, fixes
+            repaired_actions.append(repaired)
+
+        if not repaired_actions:
+            return None, fixes
+        return f"Thought: {thought}\nAction: " + "\n".join(repaired_actions), sorted(set(fixes))
+
+    def record(self, success: bool, fixes: List[str]):
+        """记录一次修复结果"""
+        with self._lock:
+            self.stats["attempts"] += 1
+            self.stats["hits" if success else "misses"] += 1
+            if success:
+                for fix in fixes:
+                    self.stats["fixes"][fix] = self.stats["fixes"].get(fix, 0) + 1
+
+    def get_hit_rate(self) -> float:
+        """修复命中率"""
+        attempts = self.stats["attempts"]
+        return self.stats["hits"] / attempts if attempts else 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取修复统计"""
+        with self._lock:
+            return {
+                "attempts": self.stats["attempts"],
+                "hits": self.stats["hits"],
+                "misses": self.stats["misses"],
+                "hit_rate": self.get_hit_rate(),
+                "fixes": dict(self.stats["fixes"])
+            }
+
+
+def validate_parsed_actions(parsed_actions: List[Dict[str, Any]]) -> bool:
+    """检查解析结果是否可执行（坐标类动作必须有数值坐标）"""
+    if not parsed_actions:
+        return False
+    for action in parsed_actions:
+        if "error" in action or not action.get("action_type"):
+            return False
+        act_type = action["action_type"]
+        inputs = action.get("action_inputs", {})
+        if act_type in ("click", "long_press", "drag"):
+            if not isinstance(inputs.get("start_box"), list):
+                return False
+        if act_type == "drag" and not isinstance(inputs.get("end_box"), list):
+            return False
+    return True
+
+# 全局动作修复器（惰性创建）
+get_action_repairer = lazy_singleton(ActionRepairer)
+
+def __getattr__(name):
+    """兼容 `from .action_repair import action_repairer` 的旧用法，首次访问时才创建实例"""
+    if name == "action_repairer":
+        return get_action_repairer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -7,7 +7,7 @@ import requests
 from typing import Dict, Any, Optional, Tuple
 
 from .config import Config
-from .utils import check_screenshot_service_health
+from .utils import check_screenshot_service_health, lazy_singleton
 
 class ActionExecutor:
     """动作执行器"""
@@ -106,6 +106,47 @@ class ActionExecutor:
             print(f"Home failed: {e}")
             return {"error": str(e)}
     
+    def launch_app(self, package: str, activity: Optional[str] = None) -> Dict[str, Any]:
+        """用 am start 启动应用，返回结果中的 foreground 为启动后的前台应用"""
+        try:
+            r = requests.post(f"{self.base_url}/action", json={
+                "type": "launch",
+                "package": package,
+                "activity": activity
+            }, timeout=30)
+            result = r.json()
+            print(f"Launch {package}: {result}")
+            return result
+        except Exception as e:
+            print(f"Launch failed: {e}")
+            return {"error": str(e)}
+    
+    def get_foreground(self) -> Optional[Dict[str, Any]]:
+        """获取当前前台应用的包名和Activity，失败时返回None"""
+        try:
+            r = requests.get(f"{self.base_url}/foreground", timeout=Config.FOREGROUND_PROBE_TIMEOUT)
+            result = r.json()
+            if "error" in result:
+                print(f"Get foreground failed: {result['error']}")
+                return None
+            return result
+        except Exception as e:
+            print(f"Get foreground failed: {e}")
+            return None
+    
+    def get_packages(self, refresh: bool = False) -> Optional[Dict[str, Optional[str]]]:
+        """获取设备上已安装的应用：包名 -> 启动Activity，失败时返回None"""
+        try:
+            r = requests.get(f"{self.base_url}/packages", params={"refresh": int(refresh)}, timeout=30)
+            result = r.json()
+            if "error" in result:
+                print(f"Get packages failed: {result['error']}")
+                return None
+            return {item["package"]: item.get("activity") for item in result.get("packages", [])}
+        except Exception as e:
+            print(f"Get packages failed: {e}")
+            return None
+    
     def screenshot(self, step: int = 0, max_retries: int = 3, 
                   task_logger=None, description: str = "") -> Tuple[Optional[str], int, int]:
         """获取截图"""
@@ -214,5 +255,11 @@ class ActionExecutor:
         
         print("Drag functionality test completed")
 
-# 全局动作执行器实例
-action_executor = ActionExecutor() 
\ No newline at end of file
+# 全局动作执行器（惰性创建）
+get_action_executor = lazy_singleton(ActionExecutor)
+
+def __getattr__(name):
+    """兼容 `from .actions import action_executor` 的旧用法，首次访问时才创建实例"""
+    if name == "action_executor":
+        return get_action_executor()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -7,30 +7,366 @@ import base64
 from typing import Dict, List, Any, Optional
 
 from .config import Config
-from .models import model_manager
-from .actions import action_executor
-from .utils import parse_action_to_structure_output
-from .reflection import reflection_manager
-from .planning import planning_manager
+from .models import get_model_manager
+from .actions import get_action_executor
+from .utils import parse_action_to_structure_output, compute_image_hash, hash_distance, lazy_singleton
+from .reflection import get_reflection_manager
+from .planning import get_planning_manager
+from .budget import BUDGET_EXHAUSTED
+from .action_repair import get_action_repairer, validate_parsed_actions
+from .routing import SYNC, RoutingSignals, get_operate_router
+from .reflection_gate import ReflectionGate
+from .replay import get_trajectory_cache
+from .app_launcher import get_app_resolver, parse_launch_target
+from .launcher_cache import get_launcher_icon_cache
 
 class MobileAgent:
     """移动代理主类"""
     
     def __init__(self):
-        self.model_manager = model_manager
-        self.action_executor = action_executor
-        self.reflection_manager = reflection_manager
-        self.planning_manager = planning_manager
+        self._last_probe = None  # (探测时的画面哈希, 前台应用包名)
+    
+    @property
+    def action_repairer(self):
+        return get_action_repairer()
+    
+    @property
+    def model_manager(self):
+        return get_model_manager()
+    
+    @property
+    def action_executor(self):
+        return get_action_executor()
+    
+    @property
+    def reflection_manager(self):
+        return get_reflection_manager()
+    
+    @property
+    def planning_manager(self):
+        return get_planning_manager()
+    
+    @property
+    def operate_router(self):
+        return get_operate_router()
+    
+    @property
+    def trajectory_cache(self):
+        return get_trajectory_cache()
+    
+    @property
+    def app_resolver(self):
+        return get_app_resolver()
+    
+    @property
+    def launcher_icon_cache(self):
+        return get_launcher_icon_cache()
+    
+    def _repair_action_output(self, model_output: str, origin_h: int, origin_w: int,
+                              model_type: str, task_logger=None):
+        """用本地规则修复ui-tars输出，成功时返回(修复后的文本, 解析结果)，失败时返回(None, None)"""
+        repaired_output, fixes = self.action_repairer.repair(model_output)
+        parsed_actions = None
+        if repaired_output:
+            try:
+                parsed_actions = parse_action_to_structure_output(
+                    text=repaired_output,
+                    factor=Config.IMAGE_FACTOR,
+                    origin_h=origin_h,
+                    origin_w=origin_w,
+                    model_type=model_type
+                )
+            except Exception as e:
+                print(f"Repaired output parsing failed: {e}")
+            if not validate_parsed_actions(parsed_actions):
+                parsed_actions = None
+        
+        success = parsed_actions is not None
+        self.action_repairer.record(success, fixes)
+        if task_logger:
+            task_logger.log_action_repair(model_output, repaired_output, fixes, success)
+        print(f"Local action repair {'succeeded' if success else 'failed'}, fixes: {fixes}, "
+              f"hit rate: {self.action_repairer.get_hit_rate():.2%}")
+        if success:
+            return repaired_output, parsed_actions
+        return None, None
+    
+    def _perform_action(self, act_type: str, act_inputs: Dict[str, Any]) -> Optional[bool]:
+        """在设备上执行一个动作（finished除外）：执行返回True，参数无效跳过返回None，不支持的动作返回False"""
+        # 处理点击动作（tap）
+        if act_type in ["click", "tap"]:
+            start_box = act_inputs.get("start_box")
+            if isinstance(start_box, list) and len(start_box) >= 2:
+                print(start_box)
+                x = round(start_box[0])
+                y = round(start_box[1])
+                self.action_executor.tap(x, y)
+                time.sleep(1)
+
+        # 处理输入动作（type）
+        elif act_type == "type":
+            content = act_inputs.get("content", "")
+            if content:
+                self.action_executor.type_text(content)
+                time.sleep(1)
+
+        # 处理滑动动作（slide/drag）
+        elif act_type in ["slide", "drag"]:
+            start_box = act_inputs.get("start_box")
+            end_box = act_inputs.get("end_box")
+            
+            # 处理格式化模型可能产生的错误参数名
+            if start_box is None:
+                start_box = act_inputs.get("start_start_box")
+            if end_box is None:
+                end_box = act_inputs.get("end_start_box")
+            if start_box is None:
+                start_box = act_inputs.get("start_point")
+            if end_box is None:
+                end_box = act_inputs.get("end_point")
+            
+            print(f"Debug: start_box={start_box}, end_box={end_box}")
+            print(f"Debug: All act_inputs={act_inputs}")
+            
+            if start_box and end_box and len(start_box) >= 2 and len(end_box) >= 2:
+                # 处理字符串格式的坐标
+                if isinstance(start_box, str):
+                    start_box = start_box.replace("(", "").replace(")", "").split(",")
+                    start_box = [float(x.strip()) for x in start_box]
+                if isinstance(end_box, str):
+                    end_box = end_box.replace("(", "").replace(")", "").split(",")
+                    end_box = [float(x.strip()) for x in end_box]
+                
+                x1, y1 = round(start_box[0]), round(start_box[1])
+                x2, y2 = round(end_box[0]), round(end_box[1])
+                print(f"Debug: Executing slide from ({x1},{y1}) to ({x2},{y2})")
+                
+                # 检查坐标是否合理
+                if x1 < 0 or y1 < 0 or x2 < 0 or y2 < 0:
+                    print(f"Warning: Invalid coordinates detected: ({x1},{y1}) to ({x2},{y2})")
+                    return None
+                
+                if abs(x1 - x2) < 10 and abs(y1 - y2) < 10:
+                    print(f"Warning: Slide distance too small: ({x1},{y1}) to ({x2},{y2})")
+                    return None
+                
+                self.action_executor.slide(x1, y1, x2, y2)
+                time.sleep(2)
+            else:
+                print(f"Error: Invalid slide parameters - start_box: {start_box}, end_box: {end_box}")
+                return None
+
+        # 处理长按动作（long_press）
+        elif act_type == "long_press":
+            start_box = act_inputs.get("start_box")
+            if isinstance(start_box, list) and len(start_box) >= 2:
+                print(start_box)
+                x = round(start_box[0])
+                y = round(start_box[1])
+                # 使用slide实现长按（从同一点到同一点，持续时间1000ms）
+                self.action_executor.slide(x, y, x, y)
+                time.sleep(1)
+            else:
+                print(f"Error: Invalid long_press parameters - start_box: {start_box}")
+                return None
+
+        # 处理返回/主页动作
+        elif "back" in act_type:
+            self.action_executor.back()
+            time.sleep(1)
+        elif "home" in act_type:
+            self.action_executor.home()
+            time.sleep(1)
+        else:
+            return False
+        return True
+    
+    def _probe_foreground(self, frame_hash: Optional[int] = None) -> Optional[str]:
+        """探测当前前台应用的包名，关闭探测或探测失败时返回None
+
+        画面与上一次探测时相同（哈希距离不超过阈值）时前台应用不会变化，直接复用上一次的结果。
+        """
+        if not Config.FOREGROUND_PROBE_ENABLED:
+            return None
+        if frame_hash is not None and self._last_probe is not None and \
+                hash_distance(frame_hash, self._last_probe[0]) <= Config.FRAME_HASH_DISTANCE_THRESHOLD:
+            return self._last_probe[1]
+        foreground = self.action_executor.get_foreground()
+        package = foreground.get("package") if foreground else None
+        self._last_probe = (frame_hash, package) if frame_hash is not None else None
+        return package
+    
+    def _replay_trajectory(self, recording: Dict[str, Any], task_logger=None,
+                           action_history: Optional[List[Dict[str, Any]]] = None):
+        """回放录制的轨迹，每一步执行后用录制的画面哈希校验
+
+        返回(是否完成子任务, 实际执行的步骤, 校验通过的步数)，第一次偏差时立即停止
+        """
+        executed_steps = []
+        for i, step in enumerate(recording["steps"]):
+            finished = False
+            for action in step["actions"]:
+                act_type = action["action_type"]
+                act_inputs = action["action_inputs"]
+                thought = action.get("thought", "")
+                print(f"Replay action: {act_type} with inputs {act_inputs}")
+                if action_history is not None:
+                    action_history.append({
+                        "round": i + 1,
+                        "action_type": act_type,
+                        "action_inputs": act_inputs,
+                        "thought": thought,
+                        "replayed": True
+                    })
+                action_start_time = time.time()
+                if act_type == "finished":
+                    finished = True
+                    performed = True
+                else:
+                    performed = self._perform_action(act_type, act_inputs)
+                if task_logger and performed is not None:
+                    task_logger.log_action_execution(
+                        action_type=act_type,
+                        action_inputs=act_inputs,
+                        thought=thought,
+                        execution_time=time.time() - action_start_time,
+                        success=performed,
+                        error=None if performed else "Unsupported action type"
+                    )
+                if finished:
+                    break
+            executed_steps.append(dict(step, frame_hash=None, foreground=None))
+            if finished:
+                return True, executed_steps, i + 1
+
+            time.sleep(2)  # 等待操作生效
+            screenshot_path, _, _ = self.action_executor.screenshot(
+                i, task_logger=task_logger, description=f"Replay step {i + 1}")
+            frame_hash = compute_image_hash(screenshot_path) if screenshot_path else None
+            foreground = self._probe_foreground(frame_hash)
+            executed_steps[-1].update(frame_hash=frame_hash, foreground=foreground)
+            distance = hash_distance(frame_hash, step["frame_hash"])
+            if distance > Config.FRAME_HASH_DISTANCE_THRESHOLD:
+                print(f"回放第{i + 1}步后画面与录制不一致（哈希距离{distance}），交回模型执行")
+                return False, executed_steps, i
+            if foreground and step.get("foreground") and foreground != step["foreground"]:
+                print(f"回放第{i + 1}步后前台应用为{foreground}，录制时为{step['foreground']}，交回模型执行")
+                return False, executed_steps, i
+        return True, executed_steps, len(executed_steps)
+    
+    def _replay_from_cache(self, instruction: str, task_logger=None,
+                           action_history: Optional[List[Dict[str, Any]]] = None):
+        """查找并回放子任务的录制轨迹
+
+        返回(是否完成子任务, (起始画面哈希, 屏幕尺寸), 已执行的步骤)，未命中时已执行的步骤为空
+        """
+        screenshot_path, origin_w, origin_h = self.action_executor.screenshot(
+            0, task_logger=task_logger, description="Replay lookup")
+        if not screenshot_path:
+            return False, None, []
+        start = (compute_image_hash(screenshot_path), (origin_w, origin_h))
+        recording = self.trajectory_cache.lookup(instruction, *start)
+        if recording is None:
+            print("轨迹回放缓存未命中：起始画面与录制不一致")
+            if task_logger:
+                task_logger.log_replay(instruction, hit=False)
+            return False, start, []
+
+        print(f"轨迹回放缓存命中，回放 {len(recording['steps'])} 步")
+        completed, executed_steps, verified_steps = self._replay_trajectory(recording, task_logger, action_history)
+        saved_calls = self.trajectory_cache.report(instruction, recording, verified_steps, completed)
+        stats = self.trajectory_cache.get_stats()
+        print(f"轨迹回放{'完成' if completed else '在第' + str(verified_steps + 1) + '步偏差'}，"
+              f"节省 {saved_calls} 次模型调用（累计命中率 {stats['hit_rate']:.2%}，"
+              f"累计节省 {stats['model_calls_saved']} 次）")
+        if task_logger:
+            task_logger.log_replay(instruction, hit=True, recorded_steps=len(recording["steps"]),
+                                   verified_steps=verified_steps, completed=completed,
+                                   model_calls_saved=saved_calls)
+        return completed, start, executed_steps
+    
+    def _tap_cached_icon(self, app_name: str, icon, frame_hash: Optional[int], screen_size,
+                         task_logger=None, action_history: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """直接点击缓存的桌面图标；知道包名时以前台应用校验，否则点击后画面变化视为已打开应用"""
+        x, y = icon
+        thought = f"点击桌面上的“{app_name}”图标（桌面图标缓存）"
+        print(f"桌面图标缓存命中，直接点击\"{app_name}\" ({x},{y})")
+        action_start_time = time.time()
+        self.action_executor.tap(x, y)
+        time.sleep(2)  # 等待应用启动
+        screenshot_path, _, _ = self.action_executor.screenshot(
+            0, task_logger=task_logger, description="Launcher icon tap")
+        new_hash = compute_image_hash(screenshot_path) if screenshot_path else None
+        success = hash_distance(new_hash, frame_hash) > Config.FRAME_HASH_DISTANCE_THRESHOLD
+        package = self.app_resolver.app_packages().get(app_name)
+        foreground = self._probe_foreground(new_hash) if package else None
+        if foreground:
+            success = foreground == package
+        self.launcher_icon_cache.report(frame_hash, screen_size, app_name, success)
+        if action_history is not None:
+            action_history.append({
+                "round": 0,
+                "action_type": "click",
+                "action_inputs": {"start_box": [x, y]},
+                "thought": thought,
+                "replayed": True
+            })
+        if task_logger:
+            task_logger.log_action_execution(
+                action_type="click",
+                action_inputs={"start_box": [x, y]},
+                thought=thought,
+                execution_time=time.time() - action_start_time,
+                success=success,
+                error=None if success else "Screen unchanged after tapping cached icon"
+            )
+        if not success:
+            print("点击缓存的桌面图标后画面未变化，交回模型执行")
+        return success
+    
+    def _record_trajectory(self, instruction: str, start, steps: List[Dict[str, Any]],
+                           final_frame_hash: Optional[int] = None):
+        """子任务成功完成时录制本次执行的轨迹"""
+        if not Config.REPLAY_ENABLED or start is None or not steps:
+            return
+        last_step = steps[-1]
+        if last_step["frame_hash"] is None:
+            last_step["frame_hash"] = final_frame_hash
+        if last_step["frame_hash"] is None and \
+                not any(a["action_type"] == "finished" for a in last_step["actions"]):
+            return  # 最后一步既没有finished也没有画面可以校验
+        self.trajectory_cache.record(instruction, start[0], start[1], steps)
     
     def run_gui_task(self, instruction: str, model_type: str = "qwen25vl", 
                     max_rounds: int = None, is_subtask: bool = True, 
                     original_instruction: Optional[str] = None, 
                     completed_subtasks: Optional[List[str]] = None, 
                     all_subtasks: Optional[List[Dict[str, Any]]] = None, 
-                    task_logger=None, task_knowledge: Optional[str] = None):
+                    task_logger=None, task_knowledge: Optional[str] = None,
+                    budget=None):
         """执行GUI任务"""
         if max_rounds is None:
             max_rounds = Config.MAX_ROUNDS
+        if task_logger:
+            task_logger.begin_subtask(instruction)
+        
+        # 只打开应用的子任务直接通过包名启动，前台应用校验通过即完成
+        if Config.APP_LAUNCH_FAST_PATH and self.app_resolver.try_launch(instruction, task_logger):
+            return None
+        
+        launch_target = parse_launch_target(instruction)  # 只打开应用的子任务的应用名
+        if launch_target and not self.app_resolver.is_known_app(launch_target):
+            launch_target = None  # 例如"打开中国联通交话费"，不是只打开应用
+        action_history = []  # 记录执行历史
+        trajectory_start = None  # 起始画面 (哈希, 屏幕尺寸)
+        trajectory_steps = []  # 每轮执行的动作及执行后的画面哈希，成功完成时录制
+        
+        # 相同子任务在相同起始画面下录制过轨迹时直接回放，偏差时交回模型
+        if Config.REPLAY_ENABLED and self.trajectory_cache.has_recordings(instruction):
+            completed, trajectory_start, trajectory_steps = self._replay_from_cache(
+                instruction, task_logger, action_history)
+            if completed:
+                return None
             
         # 构建系统提示词
         system_prompt = Config.SYSTEM_PROMPT_TEMPLATE.format(
@@ -46,17 +382,25 @@ class MobileAgent:
         ui_tars_screenshot_files = []
         ui_tars_action_count = 0  # 记录ui-tars-agent执行的动作数量
         
-        action_history = []  # 记录执行历史
-        operate_model_type = "simple"
+        routing_signals = RoutingSignals()  # 操作模型路由信号
+        reflection_gate = ReflectionGate(instruction, max_rounds) if is_subtask and original_instruction else None
+        next_frame = None  # 反思门控在上一轮动作之后截取的画面 (路径, 宽, 高)，直接作为本轮截图
         for rounds in range(max_rounds):
-            if rounds <= 5:
-                operate_model_type = "simple"
-            else:
-                operate_model_type = "sync"
+            # 预算耗尽时停止执行
+            if budget is not None and budget.is_exhausted():
+                print("任务预算已耗尽，停止执行子任务")
+                if task_logger:
+                    task_logger.log_budget_event("exhausted", budget.get_summary())
+                return BUDGET_EXHAUSTED
             print(f"\n=== Round {rounds + 1}/{max_rounds} ===")
-            # 1. 获取截图及尺寸
-            screenshot_path, origin_w, origin_h = self.action_executor.screenshot(
-                rounds, task_logger=task_logger, description=f"Round {rounds + 1}")
+            # 1. 获取截图及尺寸（上一轮动作之后已截取并记录过画面时直接复用）
+            reused_frame = next_frame is not None
+            if reused_frame:
+                screenshot_path, origin_w, origin_h = next_frame
+                next_frame = None
+            else:
+                screenshot_path, origin_w, origin_h = self.action_executor.screenshot(
+                    rounds, task_logger=task_logger, description=f"Round {rounds + 1}")
             if not screenshot_path:
                 print("Failed to get screenshot after retries")
                 
@@ -85,6 +429,30 @@ class MobileAgent:
                     print("Service is healthy but screenshot still failed")
                     return None
 
+            # 根据画面变化、重复动作、解析失败和延迟统计选择操作模式
+            frame_hash = compute_image_hash(screenshot_path)
+            foreground = self._probe_foreground(frame_hash)
+            if not reused_frame:
+                routing_signals.record_frame(frame_hash, rounds + 1)
+                routing_signals.record_foreground(foreground)
+            if trajectory_start is None:
+                trajectory_start = (frame_hash, (origin_w, origin_h))
+            elif trajectory_steps and trajectory_steps[-1]["frame_hash"] is None:
+                trajectory_steps[-1].update(frame_hash=frame_hash, foreground=foreground)
+            
+            # 打开应用的子任务：当前画面是缓存过的桌面页面时直接点击图标
+            if launch_target:
+                icon = self.launcher_icon_cache.lookup(frame_hash, (origin_w, origin_h), launch_target)
+                if icon and self._tap_cached_icon(launch_target, icon, frame_hash, (origin_w, origin_h),
+                                                  task_logger, action_history):
+                    return None
+            operate_model_type, route_reason = self.operate_router.choose_mode(routing_signals, budget)
+            print(f"Operate model routing: {operate_model_type} ({route_reason})")
+            round_model_calls = 2 if operate_model_type == SYNC else 1
+            if task_logger:
+                task_logger.log_routing_decision(rounds + 1, operate_model_type, route_reason,
+                                                 routing_signals.summary())
+
             # 2. 编码截图并添加到对话
             with open(screenshot_path, "rb") as f:
                 base64_img = base64.b64encode(f.read()).decode('utf-8')
@@ -99,16 +467,18 @@ class MobileAgent:
             # 3. 调用模型获取动作
             try:
                 start_time = time.time()
-                model_output = self.model_manager.call_main_model(messages, temperature=0.0, model_type=operate_model_type)
+                model_output = self.model_manager.call_main_model(messages, temperature=0.0, model_type=operate_model_type,
+                                                                  budget=budget)
                 execution_time = time.time() - start_time
+                self.operate_router.record_latency(operate_model_type, execution_time)
                 print(f"Model Output:\n{model_output}")
                 
                 # 记录模型调用
                 if task_logger:
                     task_logger.log_model_call(
-                        model_name=self.model_manager.config["model_id"],
+                        model_name=self.model_manager.last_model_name(self.model_manager.config["model_id"]),
                         call_type="ui_tars",
-                        input_data={"messages": messages, "temperature": 0.0},
+                        input_data={"messages": messages, "temperature": 0.0, "operate_mode": operate_model_type},
                         output_data={"response": model_output},
                         execution_time=execution_time,
                         success=True
@@ -123,20 +493,30 @@ class MobileAgent:
                         origin_w=origin_w,
                         model_type=model_type
                     )
-                    if parsed_actions:
+                    parsed_ok = validate_parsed_actions(parsed_actions)
+                    routing_signals.record_parse(parsed_ok)
+                    if parsed_ok:
                         print("Direct parsing successful, using original output")
                         messages.append({"role": "assistant", "content": model_output})
                     else:
                         raise ValueError("No valid actions parsed")
                 except Exception as parse_error:
                     print(f"Direct parsing failed: {parse_error}")
-                    print("Calling format correction model...")
+                    # 5. 先用本地规则修复，失败时才调用格式更正模型
+                    repaired_output, repaired_actions = self._repair_action_output(
+                        model_output, origin_h, origin_w, model_type, task_logger)
+                    if repaired_actions:
+                        print("Local repair successful, skipping format correction model")
+                        parsed_actions = repaired_actions
+                        messages.append({"role": "assistant", "content": repaired_output})
+                    else:
+                        print("Calling format correction model...")
                     
-                    # 5. 解析失败时调用格式更正模型
-                    formatted_message = [
-                        {
-                            "role": "system",
-                            "content": """你是一个格式标准化助手，负责将ui-tars的输出转换为严格符合指定格式的内容。请遵循以下规则：
+                        # 6. 本地修复失败时调用格式更正模型
+                        formatted_message = [
+                            {
+                                "role": "system",
+                                "content": """你是一个格式标准化助手，负责将ui-tars的输出转换为严格符合指定格式的内容。请遵循以下规则：
 
                             ## 输出格式要求
                             必须严格按照以下结构输出，不可添加额外内容：
@@ -164,53 +544,54 @@ class MobileAgent:
                             5. 确保content中的特殊字符已正确转义（如单引号用\\'，换行用\\n）
                             6. 对于drag动作，保持start_point和end_point参数名不变
                             """
-                        },
-                        {
-                            "role": "user",
-                            "content": f"请处理以下ui-tars输出内容，转换为指定格式：{model_output}\n"
-                        }
-                    ]
+                            },
+                            {
+                                "role": "user",
+                                "content": f"请处理以下ui-tars输出内容，转换为指定格式：{model_output}\n"
+                            }
+                        ]
                     
-                    format_start_time = time.time()
-                    formatted_model_output = self.model_manager.call_format_model(formatted_message)
-                    format_execution_time = time.time() - format_start_time
-                    print(f"formatted_model_output: {formatted_model_output}")
+                        format_start_time = time.time()
+                        formatted_model_output = self.model_manager.call_format_model(formatted_message, budget=budget)
+                        round_model_calls += 1
+                        format_execution_time = time.time() - format_start_time
+                        print(f"formatted_model_output: {formatted_model_output}")
                     
-                    # 记录格式更正模型调用
-                    if task_logger:
-                        task_logger.log_model_call(
-                            model_name=self.model_manager.config["format_model"],
-                            call_type="format",
-                            input_data={"original_output": model_output, "messages": formatted_message},
-                            output_data={"formatted_output": formatted_model_output},
-                            execution_time=format_execution_time,
-                            success=True
-                        )
+                        # 记录格式更正模型调用
+                        if task_logger:
+                            task_logger.log_model_call(
+                                model_name=self.model_manager.last_model_name(),
+                                call_type="format",
+                                input_data={"original_output": model_output, "messages": formatted_message},
+                                output_data={"formatted_output": formatted_model_output},
+                                execution_time=format_execution_time,
+                                success=True
+                            )
                     
-                    # 6. 再次尝试解析更正后的输出
-                    try:
-                        parsed_actions = parse_action_to_structure_output(
-                            text=formatted_model_output,
-                            factor=Config.IMAGE_FACTOR,
-                            origin_h=origin_h,
-                            origin_w=origin_w,
-                            model_type=model_type
-                        )
-                        if parsed_actions:
-                            print("Format correction successful")
-                            messages.append({"role": "assistant", "content": formatted_model_output})
-                        else:
-                            print("Format correction failed, no valid actions parsed")
+                        # 7. 再次尝试解析更正后的输出
+                        try:
+                            parsed_actions = parse_action_to_structure_output(
+                                text=formatted_model_output,
+                                factor=Config.IMAGE_FACTOR,
+                                origin_h=origin_h,
+                                origin_w=origin_w,
+                                model_type=model_type
+                            )
+                            if validate_parsed_actions(parsed_actions):
+                                print("Format correction successful")
+                                messages.append({"role": "assistant", "content": formatted_model_output})
+                            else:
+                                print("Format correction failed, no valid actions parsed")
+                                return None
+                        except Exception as format_error:
+                            print(f"Format correction parsing failed: {format_error}")
                             return None
-                    except Exception as format_error:
-                        print(f"Format correction parsing failed: {format_error}")
-                        return None
                         
             except Exception as e:
                 print(f"Model call failed: {e}")
                 if task_logger:
                     task_logger.log_model_call(
-                        model_name=self.model_manager.config["model_id"],
+                        model_name=self.model_manager.last_model_name(self.model_manager.config["model_id"]),
                         call_type="ui_tars",
                         input_data={"messages": messages, "temperature": 0.0},
                         output_data={},
@@ -220,8 +601,10 @@ class MobileAgent:
                     )
                 return None
 
-            # 7. 执行动作
+            # 8. 执行动作
+            routing_signals.record_actions(parsed_actions)
             task_completed = False
+            round_actions = []
             for action in parsed_actions:
                 act_type = action["action_type"]
                 act_inputs = action["action_inputs"]
@@ -233,99 +616,16 @@ class MobileAgent:
                     "round": rounds + 1,
                     "action_type": act_type,
                     "action_inputs": act_inputs,
-                    "thought": thought
+                    "thought": thought,
+                    "frame_hash": frame_hash  # 执行动作时的画面
                 })
+                round_actions.append({"action_type": act_type, "action_inputs": act_inputs, "thought": thought})
                 
                 # 记录动作执行开始
                 action_start_time = time.time()
 
-                # 处理点击动作（tap）
-                if act_type in ["click", "tap"]:
-                    start_box = act_inputs.get("start_box")
-                    if isinstance(start_box, list) and len(start_box) >= 2:
-                        print(start_box)
-                        x = round(start_box[0])
-                        y = round(start_box[1])
-                        self.action_executor.tap(x, y)
-                        time.sleep(1)
-
-                # 处理输入动作（type）
-                elif act_type == "type":
-                    content = act_inputs.get("content", "")
-                    if content:
-                        self.action_executor.type_text(content)
-                        time.sleep(1)
-
-                # 处理滑动动作（slide/drag）
-                elif act_type in ["slide", "drag"]:
-                    start_box = act_inputs.get("start_box")
-                    end_box = act_inputs.get("end_box")
-                    
-                    # 处理格式化模型可能产生的错误参数名
-                    if start_box is None:
-                        start_box = act_inputs.get("start_start_box")
-                    if end_box is None:
-                        end_box = act_inputs.get("end_start_box")
-                    if start_box is None:
-                        start_box = act_inputs.get("start_point")
-                    if end_box is None:
-                        end_box = act_inputs.get("end_point")
-                    
-                    print(f"Debug: start_box={start_box}, end_box={end_box}")
-                    print(f"Debug: All act_inputs={act_inputs}")
-                    
-                    if start_box and end_box and len(start_box) >= 2 and len(end_box) >= 2:
-                        # 处理字符串格式的坐标
-                        if isinstance(start_box, str):
-                            start_box = start_box.replace("(", "").replace(")", "").split(",")
-                            start_box = [float(x.strip()) for x in start_box]
-                        if isinstance(end_box, str):
-                            end_box = end_box.replace("(", "").replace(")", "").split(",")
-                            end_box = [float(x.strip()) for x in end_box]
-                        
-                        x1, y1 = round(start_box[0]), round(start_box[1])
-                        x2, y2 = round(end_box[0]), round(end_box[1])
-                        print(f"Debug: Executing slide from ({x1},{y1}) to ({x2},{y2})")
-                        
-                        # 检查坐标是否合理
-                        if x1 < 0 or y1 < 0 or x2 < 0 or y2 < 0:
-                            print(f"Warning: Invalid coordinates detected: ({x1},{y1}) to ({x2},{y2})")
-                            continue
-                        
-                        if abs(x1 - x2) < 10 and abs(y1 - y2) < 10:
-                            print(f"Warning: Slide distance too small: ({x1},{y1}) to ({x2},{y2})")
-                            continue
-                        
-                        self.action_executor.slide(x1, y1, x2, y2)
-                        time.sleep(2)
-                    else:
-                        print(f"Error: Invalid slide parameters - start_box: {start_box}, end_box: {end_box}")
-                        continue
-
-                # 处理长按动作（long_press）
-                elif act_type == "long_press":
-                    start_box = act_inputs.get("start_box")
-                    if isinstance(start_box, list) and len(start_box) >= 2:
-                        print(start_box)
-                        x = round(start_box[0])
-                        y = round(start_box[1])
-                        # 使用slide实现长按（从同一点到同一点，持续时间1000ms）
-                        self.action_executor.slide(x, y, x, y)
-                        time.sleep(1)
-                    else:
-                        print(f"Error: Invalid long_press parameters - start_box: {start_box}")
-                        continue
-
-                # 处理返回/主页动作
-                elif "back" in act_type:
-                    self.action_executor.back()
-                    time.sleep(1)
-                elif "home" in act_type:
-                    self.action_executor.home()
-                    time.sleep(1)
-
                 # 处理完成动作
-                elif act_type == "finished":
+                if act_type == "finished":
                     print("Task completed!")
                     task_completed = True
                     # 记录动作执行完成
@@ -339,8 +639,12 @@ class MobileAgent:
                         )
                     break
 
+                performed = self._perform_action(act_type, act_inputs)
+                if performed is None:
+                    continue
+
                 # 未支持的动作
-                else:
+                if not performed:
                     print(f"Unsupported action type: {act_type}")
                     if task_logger:
                         task_logger.log_action_execution(
@@ -362,20 +666,18 @@ class MobileAgent:
                         execution_time=time.time() - action_start_time,
                         success=True
                     )
+            trajectory_steps.append({"actions": round_actions, "frame_hash": None, "foreground": None,
+                                     "model_calls": round_model_calls})
             
-            # 8. 反思模块在第5步、第10步或任务完成时进行反思
+            # 9. 反思门控根据本地信号决定是否反思（中间轮例行反思、卡住时提前反思、最后一轮反思），或任务完成时进行反思
+            action_settled = False  # 是否已经等待过本轮动作生效
             if is_subtask and original_instruction:
                 should_reflect = False
                 reflection_reason = ""
+                post_action_path = None
                 
                 # 判断是否需要进行反思
-                if rounds == 5:  # 第6步
-                    should_reflect = True
-                    reflection_reason = "第6步反思"
-                elif rounds == 9:  # 第10步（达到最大步数限制）
-                    should_reflect = True
-                    reflection_reason = "第10步反思（达到最大步数限制）"
-                elif task_completed:  # ui-tars-agent判断任务完成
+                if task_completed:  # ui-tars-agent判断任务完成
                     # 检查是否是ui-tars自己完成的（通过finished动作）
                     if any(action.get("action_type") == "finished" for action in parsed_actions):
                         should_reflect = False
@@ -383,12 +685,35 @@ class MobileAgent:
                     else:
                         should_reflect = True
                         reflection_reason = "任务完成反思"
+                else:
+                    # 等待动作生效后截取下一轮的截图并先记录，门控的画面信号才反映本轮动作的结果；
+                    # 这张截图就是下一轮的截图，不额外截图
+                    time.sleep(2)
+                    action_settled = True
+                    post_action_path, post_w, post_h = self.action_executor.screenshot(
+                        rounds + 1, task_logger=task_logger,
+                        description=f"Round {rounds + 2}" if rounds + 1 < max_rounds else "Max rounds reached")
+                    if post_action_path:
+                        post_action_hash = compute_image_hash(post_action_path)
+                        routing_signals.record_frame(post_action_hash, rounds + 2)
+                        routing_signals.record_foreground(self._probe_foreground(post_action_hash))
+                        next_frame = (post_action_path, post_w, post_h)
+                    should_reflect, reflection_reason = reflection_gate.decide(
+                        rounds, routing_signals, parsed_actions, task_logger)
+                
+                # 门控触发的反思是可选的，预算紧张时跳过
+                if should_reflect and not task_completed and budget is not None \
+                        and not budget.allow_optional_reflection():
+                    should_reflect = False
+                    print(f"预算等级为{budget.level()}，跳过{reflection_reason}")
                 
                 if should_reflect:
                     print(f"\n=== {reflection_reason} ===")
-                    # 获取当前截图
-                    screenshot_now_path, _, _ = self.action_executor.screenshot(
-                        0, task_logger=task_logger, description=f"Reflection - {reflection_reason}")
+                    # 获取当前截图（门控刚截取的动作之后的画面直接复用）
+                    screenshot_now_path = post_action_path
+                    if not screenshot_now_path:
+                        screenshot_now_path, _, _ = self.action_executor.screenshot(
+                            0, task_logger=task_logger, description=f"Reflection - {reflection_reason}")
                     if screenshot_now_path:
                         # 重命名截图为screenshot_now
                         import os
@@ -397,6 +722,8 @@ class MobileAgent:
                             os.remove(new_screenshot_path)
                         os.rename(screenshot_now_path, new_screenshot_path)
                         print(f"反思截图保存为: {new_screenshot_path}")
+                        if next_frame is not None:
+                            next_frame = (new_screenshot_path,) + next_frame[1:]
                         # 将当前截图添加到ui-tars-agent的截图文件列表
                         ui_tars_screenshot_files.append(new_screenshot_path)
                         ui_tars_action_count += 1
@@ -404,31 +731,39 @@ class MobileAgent:
                         reflection_data = self.reflection_manager.reflect_on_execution(
                             original_instruction, instruction, messages, new_screenshot_path, 
                             action_history=action_history, completed_subtasks=completed_subtasks, 
-                            all_subtasks=all_subtasks, task_logger=task_logger)
+                            all_subtasks=all_subtasks, task_logger=task_logger, budget=budget)
                     else:
                         print("无法获取反思截图，使用原截图进行反思")
                         reflection_data = self.reflection_manager.reflect_on_execution(
                             original_instruction, instruction, messages, screenshot_path, 
                             action_history=action_history, completed_subtasks=completed_subtasks, 
-                            all_subtasks=all_subtasks, task_logger=task_logger)
+                            all_subtasks=all_subtasks, task_logger=task_logger, budget=budget)
                     if reflection_data.get("subtask_completed", False):
                         print("反思判断当前子任务已完成，退出执行")
+                        self._record_trajectory(instruction, trajectory_start, trajectory_steps,
+                                                compute_image_hash(new_screenshot_path) if screenshot_now_path else None)
+                        if launch_target:
+                            self.launcher_icon_cache.learn(launch_target, action_history, (origin_w, origin_h))
                         return None
                     elif reflection_data.get("need_replanning", False):
                         print(f"反思判断需要重新规划：{reflection_data.get('replanning_reason', '未知原因')}")
                         new_subtasks = self.planning_manager.regenerate_plan(
                             original_instruction, reflection_data, completed_subtasks, 
-                            new_screenshot_path, instruction, task_logger, task_knowledge)
+                            new_screenshot_path, instruction, task_logger, task_knowledge, budget=budget,
+                            current_plan=all_subtasks)
                         if new_subtasks:
                             print(f"重新生成了 {len(new_subtasks)} 个子任务")
                             return new_subtasks
+                        elif budget is not None and budget.is_exhausted():
+                            print("任务预算已耗尽，无法重新规划")
+                            return BUDGET_EXHAUSTED
                         else:
                             print("重新生成计划失败")
                             return "FAILED"  # 返回特殊值表示失败
                     else:
                         print("反思判断子任务未完成，继续执行")
-                        # === 新增功能：第6步反思建议注入 ===
-                        if rounds == 5 and "suggestions" in reflection_data and reflection_data["suggestions"]:
+                        # === 新增功能：中间轮（及门控提前触发的）反思建议注入 ===
+                        if rounds != reflection_gate.final_round and "suggestions" in reflection_data and reflection_data["suggestions"]:
                             suggestions_text = "\n".join([f"- {s}" for s in reflection_data["suggestions"]])
                             suggestion_message = {
                                 "role": "assistant",
@@ -447,22 +782,29 @@ class MobileAgent:
             
             # 如果任务完成，直接返回
             if task_completed:
+                self._record_trajectory(instruction, trajectory_start, trajectory_steps)
+                if launch_target:
+                    self.launcher_icon_cache.learn(launch_target, action_history, (origin_w, origin_h))
                 return None
 
-            # 9. 检查是否需要反思和重新规划（达到最大轮数）
+            # 10. 检查是否需要反思和重新规划（达到最大轮数）
             if rounds == max_rounds - 1:  # 达到最大轮数
                 print("\n=== 达到最大轮数，子任务执行失败，开始反思 ===")
                 
-                # 达到最大轮数后立即截图
-                screenshot_now_path, _, _ = self.action_executor.screenshot(
-                    0, task_logger=task_logger, description="Max rounds reached")
+                # 达到最大轮数后立即截图（反思门控已截取动作之后的画面时直接复用）
+                if next_frame is not None:
+                    screenshot_now_path = next_frame[0]
+                else:
+                    screenshot_now_path, _, _ = self.action_executor.screenshot(
+                        0, task_logger=task_logger, description="Max rounds reached")
                 if screenshot_now_path:
                     # 重命名截图为screenshot_now
                     import os
                     new_screenshot_path = "screenshot_now.jpg"
-                    if os.path.exists(new_screenshot_path):
-                        os.remove(new_screenshot_path)
-                    os.rename(screenshot_now_path, new_screenshot_path)
+                    if screenshot_now_path != new_screenshot_path:
+                        if os.path.exists(new_screenshot_path):
+                            os.remove(new_screenshot_path)
+                        os.rename(screenshot_now_path, new_screenshot_path)
                     print(f"达到最大轮数后截图保存为: {new_screenshot_path}")
                     
                     # 将当前截图添加到ui-tars-agent的截图文件列表
@@ -472,21 +814,27 @@ class MobileAgent:
                     # 使用最新的截图进行反思（达到最大轮数时不需要重复检测限制）
                     reflection_data = self.reflection_manager.reflect_on_execution(
                         original_instruction or instruction, instruction, messages, new_screenshot_path, 
-                        completed_subtasks=completed_subtasks, all_subtasks=all_subtasks, task_logger=task_logger)
+                        completed_subtasks=completed_subtasks, all_subtasks=all_subtasks, task_logger=task_logger,
+                        budget=budget)
                 else:
                     print("无法获取达到最大轮数后的截图，使用原截图进行反思")
                     reflection_data = self.reflection_manager.reflect_on_execution(
                         original_instruction or instruction, instruction, messages, screenshot_path, 
-                        completed_subtasks=completed_subtasks, all_subtasks=all_subtasks, task_logger=task_logger)
+                        completed_subtasks=completed_subtasks, all_subtasks=all_subtasks, task_logger=task_logger,
+                        budget=budget)
                 
                 # 子任务执行失败，直接重新生成计划
                 print("子任务执行失败，直接重新生成计划")
                 new_subtasks = self.planning_manager.regenerate_plan(
                     original_instruction or instruction, reflection_data, completed_subtasks, 
-                    new_screenshot_path, instruction, task_logger, task_knowledge)
+                    new_screenshot_path, instruction, task_logger, task_knowledge, budget=budget,
+                    current_plan=all_subtasks)
                 if new_subtasks:
                     print(f"重新生成了 {len(new_subtasks)} 个子任务")
                     return new_subtasks
+                elif budget is not None and budget.is_exhausted():
+                    print("任务预算已耗尽，无法重新规划")
+                    return BUDGET_EXHAUSTED
                 else:
                     print("重新生成计划失败")
                     return "FAILED"  # 返回特殊值表示失败
@@ -495,20 +843,27 @@ class MobileAgent:
             if len(messages) > 10:
                 messages = [messages[0]] + messages[-9:]
 
-            time.sleep(2)  # 等待操作生效
+            if not action_settled:
+                time.sleep(2)  # 等待操作生效
 
         print(f"Reached max rounds ({max_rounds}), exit")
         return None
 
-# 全局代理实例
-mobile_agent = MobileAgent()
+# 全局代理（惰性创建）
+get_mobile_agent = lazy_singleton(MobileAgent)
+
+def __getattr__(name):
+    """兼容 `from .agent import mobile_agent` 的旧用法，首次访问时才创建实例"""
+    if name == "mobile_agent":
+        return get_mobile_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # 导出主要函数
 def run_gui_task(instruction, model_type="qwen25vl", max_rounds=None, is_subtask=True, 
                 original_instruction=None, completed_subtasks=None, all_subtasks=None, 
-                task_logger=None, task_knowledge=None):
+                task_logger=None, task_knowledge=None, budget=None):
     """执行GUI任务的主函数"""
-    return mobile_agent.run_gui_task(
+    return get_mobile_agent().run_gui_task(
         instruction=instruction,
         model_type=model_type,
         max_rounds=max_rounds,
@@ -517,9 +872,11 @@ def run_gui_task(instruction, model_type="qwen25vl", max_rounds=None, is_subtask
         completed_subtasks=completed_subtasks,
         all_subtasks=all_subtasks,
         task_logger=task_logger,
-        task_knowledge=task_knowledge
+        task_knowledge=task_knowledge,
+        budget=budget
     )
 
-def decompose_task_to_subtasks(user_instruction, task_logger=None):
+def decompose_task_to_subtasks(user_instruction, task_logger=None, budget=None):
     """任务分解主函数"""
-    return planning_manager.decompose_task_to_subtasks(user_instruction, task_logger) 
+    return get_planning_manager().decompose_task_to_subtasks(user_instruction, task_logger, budget=budget)
+
@@ -0,0 +1,124 @@
+"""
+应用启动模块
+
+子任务只是"从手机桌面打开X"时不经过视觉模型：把知识库中的应用名/别名解析为包名，
+用一次 am start 启动，再检查前台应用是否为该包。无法解析或启动后前台不一致时交回模型执行。
+"""
+
+import re
+import time
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from .config import Config
+from .actions import get_action_executor
+from .knowledge import get_knowledge_manager
+from .utils import lazy_singleton
+
+# 只打开应用的子任务，例如"从手机桌面打开中国联通app"、"打开“微信”"
+_LAUNCH_RE = re.compile(r'^(?:从手机桌面|从桌面|在手机上|在桌面上)?(?:打开|启动)(?:手机上的|桌面上的)?'
+                        r'[“"「]?(.+?)[”"」]?(?:app|APP|App|应用|软件)?[。.!！]?$')
+
+def parse_launch_target(instruction: str) -> Optional[str]:
+    """子任务只是打开某个应用时返回应用名，否则返回None"""
+    match = _LAUNCH_RE.match("".join(instruction.split()))
+    return match.group(1) if match else None
+
+class AppResolver:
+    """应用名 -> 包名/启动Activity 的解析器，缓存设备上已安装应用的索引"""
+
+    def __init__(self):
+        self.device_packages = None   # 包名 -> 启动Activity，未获取时为None
+        self.updated_at = 0.0
+        self.stats = {"attempts": 0, "launched": 0, "unresolved": 0, "failed": 0}
+        self._packages = (None, {})   # (知识库版本, 应用名及别名 -> 包名)
+        self._lock = threading.Lock()
+
+    @property
+    def action_executor(self):
+        return get_action_executor()
+
+    def app_packages(self) -> Dict[str, str]:
+        """应用名及别名 -> 包名，知识库中的 package / aliases 字段优先于 Config.APP_PACKAGES
+
+        结果按知识库版本缓存，知识文件变化后重新生成；返回的字典不要修改。
+        """
+        knowledge_manager = get_knowledge_manager()
+        version = knowledge_manager.get_version()
+        cached_version, packages = self._packages
+        if cached_version != version:
+            packages = dict(Config.APP_PACKAGES)
+            packages.update(knowledge_manager.get_app_packages())
+            self._packages = (version, packages)
+        return packages
+
+    def is_known_app(self, app_name: str) -> bool:
+        """应用名是否出现在包名配置或知识库中"""
+        return app_name in self.app_packages() or app_name in get_knowledge_manager().get_app_names()
+
+    def device_index(self, refresh: bool = False) -> Optional[Dict[str, Optional[str]]]:
+        """设备上已安装应用的索引，超过 Config.APP_INDEX_TTL 或 refresh 时重新获取"""
+        with self._lock:
+            expired = time.time() - self.updated_at >= Config.APP_INDEX_TTL
+            if refresh or expired or self.device_packages is None:
+                packages = self.action_executor.get_packages(refresh=refresh)
+                if packages is not None:
+                    self.device_packages = packages
+                    self.updated_at = time.time()
+                    print(f"已安装应用索引更新: {len(packages)} 个应用")
+            return self.device_packages
+
+    def resolve(self, app_name: str) -> Optional[Tuple[str, Optional[str]]]:
+        """返回 (包名, 启动Activity)，应用未知或未安装时返回None"""
+        package = self.app_packages().get(app_name)
+        if package is None:
+            return None
+        index = self.device_index()
+        if index is None:
+            # 无法获取应用索引时仍尝试启动，由服务端解析启动Activity
+            return package, None
+        if package not in index:
+            # 可能是之后新安装的应用，按需刷新一次
+            index = self.device_index(refresh=True) or {}
+        if package not in index:
+            print(f"应用\"{app_name}\"（{package}）未安装")
+            return None
+        return package, index[package]
+
+    def try_launch(self, instruction: str, task_logger=None) -> bool:
+        """子任务只是打开应用时直接启动并校验前台应用，成功返回True"""
+        app_name = parse_launch_target(instruction)
+        if not app_name or app_name not in self.app_packages():
+            # 不是只打开应用的子任务（例如"打开微信发朋友圈"），或者不知道应用的包名
+            return False
+        self.stats["attempts"] += 1
+        start_time = time.time()
+        target = self.resolve(app_name)
+        if target is None:
+            self.stats["unresolved"] += 1
+            print(f"应用\"{app_name}\"不在已安装应用中，交回模型执行")
+            if task_logger:
+                task_logger.log_app_launch(instruction, app_name, None, None, False, time.time() - start_time)
+            return False
+
+        package, activity = target
+        result = self.action_executor.launch_app(package, activity)
+        foreground = (result.get("foreground") or {}).get("package")
+        success = foreground == package
+        self.stats["launched" if success else "failed"] += 1
+        if success:
+            print(f"通过 am start 打开\"{app_name}\"（{package}），跳过模型调用")
+        else:
+            print(f"启动\"{app_name}\"后前台应用为 {foreground}，交回模型执行")
+        if task_logger:
+            task_logger.log_app_launch(instruction, app_name, package, foreground, success, time.time() - start_time)
+        return success
+
+    def get_stats(self) -> Dict[str, Any]:
+        """启动统计"""
+        stats = dict(self.stats)
+        stats["success_rate"] = stats["launched"] / stats["attempts"] if stats["attempts"] else 0.0
+        return stats
+
+# 全局应用解析器（惰性创建）
+get_app_resolver = lazy_singleton(AppResolver)
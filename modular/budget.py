@@ -0,0 +1,134 @@
+"""
+任务预算模块
+"""
+
+import time
+import threading
+from typing import Dict, Any, Optional
+
+from .config import Config
+
+# run_gui_task / 主循环在预算耗尽时返回的状态值
+BUDGET_EXHAUSTED = "BUDGET_EXHAUSTED"
+
+class TaskBudget:
+    """单个任务的预算（token数、模型调用次数、墙钟时间）
+
+    预算按使用比例分级降级：
+    - normal: 正常执行
+    - degraded: 跳过可选反思，操作模型不再切换到sync模式
+    - critical: 反思/规划切换到更便宜的模型
+    - exhausted: 停止执行
+    """
+
+    NORMAL = "normal"
+    DEGRADED = "degraded"
+    CRITICAL = "critical"
+    EXHAUSTED = "exhausted"
+
+    def __init__(self, max_tokens: Optional[int] = None, max_model_calls: Optional[int] = None,
+                 max_seconds: Optional[float] = None, task_logger=None):
+        """初始化预算，限制为None或0表示该维度不限制"""
+        self.max_tokens = max_tokens
+        self.max_model_calls = max_model_calls
+        self.max_seconds = max_seconds
+        self.task_logger = task_logger
+
+        self.start_time = time.time()
+        self.used_tokens = 0
+        self.model_calls = 0
+        self.calls_by_type = {}
+        self._level = self.NORMAL
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, task_logger=None) -> "TaskBudget":
+        """根据Config创建预算"""
+        return cls(
+            max_tokens=Config.TASK_BUDGET_MAX_TOKENS,
+            max_model_calls=Config.TASK_BUDGET_MAX_MODEL_CALLS,
+            max_seconds=Config.TASK_BUDGET_MAX_SECONDS,
+            task_logger=task_logger
+        )
+
+    def charge(self, tokens: int = 0, calls: int = 1, call_type: str = ""):
+        """记录一次模型调用的消耗"""
+        with self._lock:
+            self.used_tokens += max(0, int(tokens or 0))
+            self.model_calls += calls
+            if call_type:
+                self.calls_by_type[call_type] = self.calls_by_type.get(call_type, 0) + calls
+        self._update_level()
+
+    def elapsed(self) -> float:
+        """已用时间（秒）"""
+        return time.time() - self.start_time
+
+    def usage_ratio(self) -> float:
+        """返回各维度中最高的使用比例"""
+        ratios = [0.0]
+        if self.max_tokens:
+            ratios.append(self.used_tokens / self.max_tokens)
+        if self.max_model_calls:
+            ratios.append(self.model_calls / self.max_model_calls)
+        if self.max_seconds:
+            ratios.append(self.elapsed() / self.max_seconds)
+        return max(ratios)
+
+    def level(self) -> str:
+        """当前预算等级"""
+        self._update_level()
+        return self._level
+
+    def _update_level(self):
+        """根据使用比例更新等级，等级变化时写入日志"""
+        ratio = self.usage_ratio()
+        if ratio >= 1.0:
+            new_level = self.EXHAUSTED
+        elif ratio >= Config.BUDGET_CRITICAL_RATIO:
+            new_level = self.CRITICAL
+        elif ratio >= Config.BUDGET_DEGRADE_RATIO:
+            new_level = self.DEGRADED
+        else:
+            new_level = self.NORMAL
+
+        with self._lock:
+            if new_level == self._level:
+                return
+            old_level = self._level
+            self._level = new_level
+
+        print(f"预算等级变化: {old_level} -> {new_level} (使用比例 {ratio:.2f})")
+        if self.task_logger:
+            self.task_logger.log_budget_event(f"{old_level}->{new_level}", self.get_summary())
+
+    def is_exhausted(self) -> bool:
+        """预算是否已耗尽"""
+        return self.level() == self.EXHAUSTED
+
+    def allow_optional_reflection(self) -> bool:
+        """是否允许执行可选的反思"""
+        return self.level() == self.NORMAL
+
+    def allow_sync_mode(self) -> bool:
+        """是否允许操作模型使用双模型的sync模式"""
+        return self.level() == self.NORMAL
+
+    def select_model(self, default_model: str, cheap_model: str) -> str:
+        """预算紧张时返回更便宜的模型"""
+        if self.level() in (self.CRITICAL, self.EXHAUSTED):
+            return cheap_model
+        return default_model
+
+    def get_summary(self) -> Dict[str, Any]:
+        """获取预算使用摘要"""
+        return {
+            "level": self._level,
+            "used_tokens": self.used_tokens,
+            "max_tokens": self.max_tokens,
+            "model_calls": self.model_calls,
+            "max_model_calls": self.max_model_calls,
+            "elapsed_seconds": round(self.elapsed(), 2),
+            "max_seconds": self.max_seconds,
+            "calls_by_type": dict(self.calls_by_type)
+        }
@@ -76,6 +76,127 @@ finished(content='xxx') # Use escape characters \\', \\", and \\n in content par
     # 任务执行配置
     MAX_ROUNDS = 10
     MAX_REGENERATION_CYCLES = 10
+
+    # 任务预算配置（None或0表示不限制，默认不限制；例如 2_000_000 tokens / 200 次调用 / 1800 秒）
+    TASK_BUDGET_MAX_TOKENS = None
+    TASK_BUDGET_MAX_MODEL_CALLS = None
+    TASK_BUDGET_MAX_SECONDS = None
+    BUDGET_DEGRADE_RATIO = 0.6   # 超过后跳过可选反思，不再使用sync模式
+    BUDGET_CRITICAL_RATIO = 0.85  # 超过后反思/规划切换到更便宜的模型
+
+    # 操作模型路由配置（simple: 仅ui-tars；sync: plan模型思考 + ui-tars定位）
+    FRAME_HASH_DISTANCE_THRESHOLD = 5   # 感知哈希距离不超过该值视为同一画面
+    ROUTER_NO_OP_THRESHOLD = 2          # 连续无效动作（画面不变）次数
+    ROUTER_REPEAT_THRESHOLD = 2         # 连续重复相同动作次数
+    ROUTER_PARSE_FAILURE_THRESHOLD = 2  # 最近3轮内直接解析失败次数
+    ROUTER_RECOVERY_ROUNDS = 2          # sync模式下连续有进展多少轮后切回simple
+    ROUTER_MAX_SYNC_LATENCY = 60.0      # sync平均延迟超过该值时，只有强信号才切换
+
+    # 总任务完成检查的关键帧选择（去重后按数量/字节上限裁剪）
+    TOTAL_CHECK_MAX_IMAGES = 12
+    TOTAL_CHECK_MAX_BYTES = 6 * 1024 * 1024  # 截图原始字节数上限（base64前）
+
+    # 反思的缩略图拼图模式（历史截图拼成网格图，最新截图保持原图；需要numpy和PIL）
+    REFLECTION_CONTACT_SHEET = False
+    CONTACT_SHEET_COLUMNS = 4
+    CONTACT_SHEET_THUMB_WIDTH = 270     # 缩略图宽度（像素）
+    CONTACT_SHEET_MAX_TILES = 12        # 每张拼图最多的缩略图数，超过时拆成多张
+    CONTACT_SHEET_GAP = 6               # 缩略图间距（像素）
+    CONTACT_SHEET_JPEG_QUALITY = 80
+
+    # 反思门控（用本地信号代替中间轮（MAX_ROUNDS 为10时是第6轮）的固定反思，并在卡住或到达知识路径目标时提前反思）
+    REFLECTION_GATE_ENABLED = True
+    REFLECTION_GATE_NO_OP_ROUNDS = 3       # 连续无效动作次数
+    REFLECTION_GATE_REPEAT_ROUNDS = 3      # 连续相同动作次数
+    REFLECTION_GATE_PROGRESS_ROUNDS = 2    # 画面连续变化多少轮时跳过中间轮反思
+    REFLECTION_GATE_COOLDOWN_ROUNDS = 3    # 两次门控反思之间至少间隔的轮数
+    REFLECTION_GATE_MIN_ROUND = 3          # 最早从第几轮开始提前反思
+
+    # 反思结论缓存（子任务 + 已完成子任务 + 画面哈希 -> 反思结论）
+    REFLECTION_CACHE_TTL = 180.0           # 结论的有效期（秒）
+    REFLECTION_CACHE_MAX_ENTRIES = 64
+
+    # 反思级联（先用 FORMAT_MODEL_NAME 看上一张历史截图和当前截图给出带置信度的结论，必要时升级到 REFLECTION_MODEL_NAME）
+    # 默认关闭：小模型看到的历史比大模型少，开启前先用任务日志中的 reflection_cascade 统计核对结论不一致率
+    REFLECTION_CASCADE_ENABLED = False
+    REFLECTION_CASCADE_MIN_CONFIDENCE = 0.8  # 小模型置信度低于该值时升级
+
+    # 反思模型流式输出：subtask_completed / need_replanning 一输出就据此行动，其余内容在后台接收
+    REFLECTION_STREAMING = True
+    REFLECTION_STREAM_READY_TIMEOUT = 120.0  # 等待结论字段的超时（秒），超时按反思出错处理
+    REFLECTION_STREAM_JOIN_TIMEOUT = 60.0    # 保存任务日志前等待后台接收完成的超时（秒）
+
+    # 计划缓存（规范化指令 + 知识库版本 + 前台应用 -> 子任务列表，起始画面相近时复用）
+    PLAN_CACHE_ENABLED = True
+    PLAN_CACHE_FILE = "plan_cache.json"
+    PLAN_CACHE_SCREEN_DISTANCE = 12        # 起始画面哈希距离不超过该值时复用
+    PLAN_CACHE_MAX_SCREENS_PER_KEY = 3     # 每个键保留的计划数（不同起始画面）
+    PLAN_CACHE_MAX_ENTRIES = 200           # 计划总数上限，超过后淘汰最久未使用的
+
+    # 计划修补（子任务失败时只让规划模型编辑失败子任务附近的计划，失败时再完整重新生成）
+    PLAN_REPAIR_ENABLED = True
+    PLAN_REPAIR_WINDOW = 2                 # 失败子任务之后可修改的子任务数
+
+    # 候选计划（任务分解时并发请求多个不同思路的计划，本地打分，其余作为重新规划时的备选；1 表示关闭）
+    PLAN_CANDIDATES = 1
+
+    # 前台应用探测（server.py 的 /foreground 接口，用作廉价的状态键）
+    FOREGROUND_PROBE_ENABLED = True
+    FOREGROUND_PROBE_TIMEOUT = 2.0     # 探测请求超时（秒）
+    
+    # 轨迹回放缓存配置（子任务 + 起始画面 -> 录制的动作序列）
+    REPLAY_ENABLED = True
+    REPLAY_CACHE_FILE = "trajectory_cache.json"
+    REPLAY_MAX_RECORDINGS_PER_SUBTASK = 3  # 每个子任务保留的录制数（不同起始画面）
+    REPLAY_CACHE_MAX_RECORDINGS = 500      # 录制总数上限，超过后淘汰最久未使用的
+    REPLAY_MAX_DIVERGENCES = 2             # 录制连续偏差多少次后删除
+    
+    # 应用启动快速路径（"从手机桌面打开X"直接用 am start 启动）
+    APP_LAUNCH_FAST_PATH = True
+    APP_INDEX_TTL = 300.0               # 已安装应用索引的缓存时间（秒）
+    # 应用名/别名 -> 包名；知识库app节点的 package / aliases 字段会覆盖这里的配置
+    APP_PACKAGES = {
+        "中国联通": "com.sinovatech.unicom.ui",
+        "联通": "com.sinovatech.unicom.ui",
+        "微信": "com.tencent.mm",
+        "QQ": "com.tencent.mobileqq",
+        "支付宝": "com.eg.android.AlipayGphone",
+        "淘宝": "com.taobao.taobao",
+        "京东": "com.jingdong.app.mall",
+        "拼多多": "com.xunmeng.pinduoduo",
+        "美团": "com.sankuai.meituan",
+        "饿了么": "me.ele",
+        "抖音": "com.ss.android.ugc.aweme",
+        "哔哩哔哩": "tv.danmaku.bili",
+        "B站": "tv.danmaku.bili",
+        "小红书": "com.xingin.xhs",
+        "微博": "com.sina.weibo",
+        "知乎": "com.zhihu.android",
+        "高德地图": "com.autonavi.minimap",
+        "百度地图": "com.baidu.BaiduMap",
+        "网易云音乐": "com.netease.cloudmusic",
+        "携程": "ctrip.android.view",
+        "大众点评": "com.dianping.v1",
+        "铁路12306": "com.MobileTicket",
+        "12306": "com.MobileTicket",
+        "设置": "com.android.settings",
+    }
+    
+    # 桌面图标坐标缓存（按设备记录桌面页面哈希 -> 图标坐标）
+    LAUNCHER_ICON_CACHE_FILE = "launcher_icon_cache.json"
+    LAUNCHER_ICON_CACHE_MAX_PAGES = 20  # 每个设备保留的桌面页面数
+    
+    # 知识库配置
+    KNOWLEDGE_FILE = "knowledge.json"
+    KNOWLEDGE_DIR = "knowledge"         # 按应用拆分的知识目录，每个应用一个JSON文件，文件名为应用名
+    KNOWLEDGE_POLL_INTERVAL = 5.0       # 检查知识文件变化的最短间隔（秒）
+    KNOWLEDGE_SNAPSHOT_SUFFIX = ".kbin"  # 编译后的知识快照后缀（python -m modular.knowledge compile）
+    KNOWLEDGE_FUZZY_TOP_K = 3            # 模糊检索返回的候选数
+    KNOWLEDGE_FUZZY_THRESHOLD = 0.4      # 模糊检索的最低置信度
+    KNOWLEDGE_FUZZY_NOTE_WEIGHT = 0.5    # 通过备注匹配到的得分系数
+    KNOWLEDGE_FUZZY_NO_APP_WEIGHT = 0.6  # 指令中没有提到应用时的应用得分
+    KNOWLEDGE_MINER_MIN_SUPPORT = 2      # 轨迹挖掘：路径至少在多少次（不同任务的）成功执行中出现才合并
+    KNOWLEDGE_MINER_MAX_PROVENANCE = 5   # 轨迹挖掘：每个节点保留的来源记录数
     
     # 日志配置
     LOG_LEVEL = "INFO"
@@ -130,6 +251,17 @@ finished(content='xxx') # Use escape characters \\', \\", and \\n in content par
             "max_rounds": cls.MAX_ROUNDS,
             "max_regeneration_cycles": cls.MAX_REGENERATION_CYCLES
         }
+
+    @classmethod
+    def get_budget_config(cls) -> Dict[str, Any]:
+        """获取任务预算配置"""
+        return {
+            "max_tokens": cls.TASK_BUDGET_MAX_TOKENS,
+            "max_model_calls": cls.TASK_BUDGET_MAX_MODEL_CALLS,
+            "max_seconds": cls.TASK_BUDGET_MAX_SECONDS,
+            "degrade_ratio": cls.BUDGET_DEGRADE_RATIO,
+            "critical_ratio": cls.BUDGET_CRITICAL_RATIO
+        }
     
     @classmethod
     def get_image_config(cls) -> Dict[str, Any]:
@@ -0,0 +1,85 @@
+"""
+缩略图拼图模块
+
+多截图反思主要需要看到画面的先后顺序，不需要每一帧的细节。拼图模式把历史截图缩小后
+按时间顺序平铺到一张或几张网格图中（左上角标注序号），在内存中编码为JPEG，
+最新截图仍以原图发送。依赖 numpy 和 PIL，缺失时调用方回退为逐张发送。
+"""
+
+import io
+import base64
+from typing import Dict, List, Any, Optional, Tuple
+
+from .config import Config
+
+def image_part(data: bytes) -> Dict[str, Any]:
+    """图片字节 -> 消息中的 image_url 内容"""
+    base64_img = base64.b64encode(data).decode('utf-8')
+    return {"type": "image_url", "image_url": {"url": f"data:image/jpg;base64,{base64_img}"}}
+
+def build_contact_sheets(images: List[bytes], labels: Optional[List[str]] = None,
+                         columns: int = None, thumb_width: int = None,
+                         max_tiles: int = None) -> List[bytes]:
+    """把按时间排列的截图拼成若干张网格图，返回JPEG字节；labels 为每张缩略图的序号标注（ASCII）"""
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    columns = columns or Config.CONTACT_SHEET_COLUMNS
+    thumb_width = thumb_width or Config.CONTACT_SHEET_THUMB_WIDTH
+    max_tiles = max_tiles or Config.CONTACT_SHEET_MAX_TILES
+    labels = labels or [str(i + 1) for i in range(len(images))]
+
+    thumbs = []
+    for data, label in zip(images, labels):
+        with Image.open(io.BytesIO(data)) as img:
+            img = img.convert("RGB")
+            height = max(1, round(img.height * thumb_width / img.width))
+            thumb = img.resize((thumb_width, height), Image.BILINEAR)
+        draw = ImageDraw.Draw(thumb)
+        draw.rectangle((0, 0, 12 + 8 * len(label), 20), fill=(0, 0, 0))
+        draw.text((6, 4), label, fill=(255, 255, 0))
+        thumbs.append(np.asarray(thumb))
+
+    sheets = []
+    gap = Config.CONTACT_SHEET_GAP
+    for start in range(0, len(thumbs), max_tiles):
+        group = thumbs[start:start + max_tiles]
+        cols = min(columns, len(group))
+        rows = (len(group) + cols - 1) // cols
+        cell_h = max(t.shape[0] for t in group)
+        canvas = np.full((rows * cell_h + (rows - 1) * gap, cols * thumb_width + (cols - 1) * gap, 3),
+                         255, dtype=np.uint8)
+        for i, thumb in enumerate(group):
+            y, x = (i // cols) * (cell_h + gap), (i % cols) * (thumb_width + gap)
+            canvas[y:y + thumb.shape[0], x:x + thumb_width] = thumb
+        buffer = io.BytesIO()
+        Image.fromarray(canvas).save(buffer, format="JPEG", quality=Config.CONTACT_SHEET_JPEG_QUALITY)
+        sheets.append(buffer.getvalue())
+    return sheets
+
+def screenshot_parts(history: List[bytes], latest: Optional[bytes], labels: Optional[List[str]] = None,
+                     contact_sheet: bool = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """历史截图和最新截图对应的消息内容，返回 (内容列表, 是否使用了拼图)
+
+    拼图模式下历史截图拼成网格图、最新截图保持原图；未开启或拼图失败时逐张发送原图。
+    """
+    contact_sheet = Config.REFLECTION_CONTACT_SHEET if contact_sheet is None else contact_sheet
+    latest_parts = [image_part(latest)] if latest is not None else []
+    if contact_sheet and history:
+        try:
+            sheets = build_contact_sheets(history, labels)
+            return [image_part(sheet) for sheet in sheets] + latest_parts, True
+        except Exception as e:
+            print(f"截图拼图失败，逐张发送: {e}")
+    return [image_part(data) for data in history] + latest_parts, False
+
+def parts_bytes(parts: List[Dict[str, Any]]) -> int:
+    """消息内容中图片的 base64 字节数"""
+    return sum(len(part["image_url"]["url"]) for part in parts if part.get("type") == "image_url")
+
+def decode_image_part(part: Dict[str, Any]) -> Optional[bytes]:
+    """image_url 内容 -> 图片字节，不是 base64 data URL 时返回None"""
+    url = part.get("image_url", {}).get("url", "")
+    if not url.startswith("data:") or "," not in url:
+        return None
+    return base64.b64decode(url.split(",", 1)[1])
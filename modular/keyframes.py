@@ -0,0 +1,59 @@
+"""
+关键帧选择模块
+
+总任务完成检查不再上传 TaskLogger 保存的全部截图：按感知哈希去掉与上一张保留帧几乎相同的画面，
+始终保留第一帧、最后一帧和子任务切换前后的帧，再按 Config.TOTAL_CHECK_MAX_IMAGES /
+Config.TOTAL_CHECK_MAX_BYTES 裁剪，使一次检查请求的大小有上界。
+"""
+
+import os
+from typing import Dict, List, Any, Optional
+
+from .config import Config
+from .utils import compute_image_hash, hash_distance
+
+# 保护级别：裁剪时先去掉级别低的帧
+_ORDINARY, _BOUNDARY, _ENDPOINT = 0, 1, 2
+
+def select_keyframes(screenshots: List[Dict[str, Any]], max_images: Optional[int] = None,
+                     max_bytes: Optional[int] = None) -> List[Dict[str, Any]]:
+    """从按时间排列的截图记录（包含 path，可选 subtask_index）中选出关键帧，保持时间顺序
+
+    返回的每条记录附加 hash、bytes、keep_reason 字段。
+    """
+    max_images = max_images if max_images is not None else Config.TOTAL_CHECK_MAX_IMAGES
+    max_bytes = max_bytes if max_bytes is not None else Config.TOTAL_CHECK_MAX_BYTES
+
+    frames = []
+    for record in screenshots:
+        if not os.path.exists(record["path"]):
+            continue
+        frames.append(dict(record, hash=compute_image_hash(record["path"]),
+                           bytes=os.path.getsize(record["path"]), level=_ORDINARY))
+    if not frames:
+        return []
+
+    # 子任务切换前的最后一帧和切换后的第一帧
+    for previous, current in zip(frames, frames[1:]):
+        if previous.get("subtask_index") != current.get("subtask_index"):
+            previous["level"] = max(previous["level"], _BOUNDARY)
+            current["level"] = max(current["level"], _BOUNDARY)
+    frames[0]["level"] = frames[-1]["level"] = _ENDPOINT
+
+    # 去掉与上一张保留帧几乎相同的普通帧
+    kept = []
+    for frame in frames:
+        if kept and frame["level"] == _ORDINARY and \
+                hash_distance(frame["hash"], kept[-1]["hash"]) <= Config.FRAME_HASH_DISTANCE_THRESHOLD:
+            continue
+        kept.append(frame)
+
+    # 超出数量或字节上限时，每次去掉保护级别最低、与前一帧差异最小的帧（首尾帧不去掉）
+    while len(kept) > 2 and (len(kept) > max_images or sum(f["bytes"] for f in kept) > max_bytes):
+        victim = min(range(1, len(kept) - 1), key=lambda i: (kept[i]["level"], hash_distance(kept[i]["hash"], kept[i - 1]["hash"])))
+        del kept[victim]
+
+    reasons = {_ORDINARY: "changed", _BOUNDARY: "subtask_boundary", _ENDPOINT: "endpoint"}
+    for frame in kept:
+        frame["keep_reason"] = reasons[frame.pop("level")]
+    return kept
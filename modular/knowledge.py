@@ -1,37 +1,460 @@
 """
 知识管理模块
+
+知识来源有两种，可以同时使用：
+- 单个知识文件（默认 knowledge.json），启动时加载
+- 按应用拆分的知识目录（默认 knowledge/），每个应用一个 JSON 文件，文件名为应用名，
+  首次匹配到该应用时才加载
+
+每个知识文件解析后生成一个只读的 KnowledgeShard。查询时按 mtime 轮询文件变化，
+只重建变化的分片，新索引构建完成后整体替换，正在进行的查询继续使用旧索引。
+
+分片可以预先编译为二进制快照（知识文件同目录下的 .kbin 文件），快照记录了知识文件的哈希，
+加载时哈希一致才使用快照，否则回退到解析JSON：
+    python -m modular.knowledge compile
+快照只包含基本类型（marshal序列化的知识树、路径步骤，以及整数数组形式的父节点和匹配自动机表），
+读取快照不会执行任何代码；内容哈希和结构校验通过后才使用，可以由知识树快速推导的索引在加载时重建。
+快照头部单独记录了分片中应用的包名和别名，构建包名表时只读头部，不加载整个分片。
 """
 
 import json
+import gc
 import os
-from typing import Dict, List, Any, Optional
+import math
+import sys
+import time
+import marshal
+import hashlib
+import threading
+from array import array
+from typing import Dict, List, Any, Optional, Tuple
+
+from .config import Config
+from .matcher import AhoCorasick
+from .retrieval import NgramTfidfIndex
+from .utils import lazy_singleton
+
+# 快照格式：魔数 + 格式版本(2字节) + 知识文件SHA-256(32字节) + 包名表SHA-256(32字节) + 内容SHA-256(32字节)
+#          + 包名表长度(4字节) + marshal序列化的包名表 + marshal序列化的内容
+SNAPSHOT_MAGIC = b"MAKNOWLG"
+SNAPSHOT_FORMAT_VERSION = 4
+# Python 3.13 起 marshal 可以拒绝代码对象
+_MARSHAL_LOAD_KWARGS = {"allow_code": False} if sys.version_info >= (3, 13) else {}
+
+def describe_step(step: Dict[str, Any], index: int) -> str:
+    """根据节点类型选择模板"""
+    t = step["type"]
+    name = step["name"]
+    note = f"（注意：{step['note']}）" if step.get("note") else ""
+    
+    if index == 0 and t == "app":
+        return f'{index+1}、从手机桌面打开"{name}"'
+    elif t == "menu":
+        if name != "":
+            return f'{index+1}、在当前页中可以看到名称为"{name}"的菜单{note}'
+        else:
+            # 如果菜单名称为空，使用前两个子节点的名称
+            children_names = step.get("children_names", [])
+            if children_names:
+                children_text = "、".join(children_names)
+                return f'{index+1}、在当前页中可以看到一个菜单，包含了"{children_text}等项目"{note}'
+            else:
+                return f'{index+1}、在当前页中可以看到一个菜单{note}'
+    elif t == "page":
+        return f'{index+1}、点击"{name}"进入新页面{note}'
+    elif t == "feature":
+        return f'{index+1}、点击功能"{name}"{note}'
+    else:
+        return f'{index+1}、点击"{name}"{note}'
+
+def _collect_app_packages(data: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """收集知识树中app节点的 (应用名或别名, 包名)，来自 package / aliases 字段"""
+    packages = []
+    stack = [data] if data else []
+    while stack:
+        node = stack.pop()
+        if node.get("type") != "app":
+            stack.extend(node.get("children", []))
+        elif node.get("package"):
+            for name in [node["name"].replace("app", "").strip()] + list(node.get("aliases", [])):
+                packages.append((name, node["package"]))
+    return packages
+
+def _share_strings(data: Dict[str, Any]) -> Dict[str, Any]:
+    """让知识树中相同的字符串值共用一个对象，marshal 对重复出现的对象只写一次引用"""
+    memo = {}
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        items = node.items() if isinstance(node, dict) else enumerate(node)
+        for key, value in list(items):
+            if isinstance(value, str):
+                node[key] = memo.setdefault(value, value)
+            elif isinstance(value, (dict, list)):
+                stack.append(value)
+    return data
+
+class KnowledgeShard:
+    """一个知识文件解析后的只读索引，构建完成后不再修改，可在线程间共享"""
+
+    def __init__(self, source: str, mtime: float, data: Dict[str, Any]):
+        self.source = source
+        self.mtime = mtime
+        self.data = data
+        self.knowledge_base = {}
+        # 路径索引：名称 -> 节点编号（先序遍历中第一次出现的节点），每个节点记录父节点编号和路径步骤
+        self.name_index = {}
+        self.app_index = {}
+        self.parents = []
+        self.steps = []        # (name, type, note, children_names)，children_names 仅名称为空的菜单有
+        # 功能名的多模式匹配自动机，功能名 -> [(所属应用, 在该应用功能列表中的序号)]
+        self.matcher = AhoCorasick([])
+        self.feature_owners = {}
+        # 功能名和备注的模糊检索索引，附带数据为 (所属应用, 功能名)；首次模糊查询时才构建
+        self.fuzzy_index = None
+        # (应用名或别名, 包名)，同时记录在快照头部
+        self.app_packages = []
+
+    def index_chain(self, target: str, app_name: str = None) -> Optional[List[int]]:
+        """通过父节点指针得到从根到目标节点的节点编号列表，指定应用时优先在该应用内查找"""
+        node_id = self.app_index.get((app_name, target)) if app_name else None
+        if node_id is None:
+            node_id = self.name_index.get(target)
+        if node_id is None:
+            return None
+        chain = []
+        while node_id != -1:
+            chain.append(node_id)
+            node_id = self.parents[node_id]
+        chain.reverse()
+        return chain
+
+    def find_path(self, target: str, app_name: str = None) -> Optional[List[Dict[str, Any]]]:
+        """查找目标功能的路径（包含 note）"""
+        chain = self.index_chain(target, app_name)
+        if chain is None:
+            return None
+        path = []
+        for i in chain:
+            name, node_type, note, children_names = self.steps[i]
+            step = {"name": name, "type": node_type, "note": note}
+            if children_names is not None:
+                step["children_names"] = list(children_names)
+            path.append(step)
+        return path
+
+    def path_sentence(self, target: str, app_name: str = None) -> Optional[str]:
+        """返回目标功能路径的步骤描述（节点在路径中的位置即其深度）"""
+        path = self.find_path(target, app_name)
+        if path is None:
+            return None
+        return "\n".join(describe_step(step, i) for i, step in enumerate(path))
+
+class KnowledgeSnapshot:
+    """某一时刻的知识库视图：知识文件及其mtime、已加载的分片、应用名匹配自动机
+
+    只读对象，更新时整体替换，读取方取一次引用即可得到一致的视图。
+    """
+
+    def __init__(self, sources: Dict[str, float], shards: Dict[str, KnowledgeShard], primary: Optional[str]):
+        self.sources = sources
+        self.shards = shards
+        self.primary = primary
+        # 应用名 -> 包含该应用的知识文件；目录分片在加载前用文件名作为应用名
+        self.app_sources = {}
+        for source in sources:
+            if source in shards:
+                app_names = list(shards[source].knowledge_base)
+            else:
+                app_names = []
+            if source != primary:
+                app_names.insert(0, os.path.splitext(os.path.basename(source))[0])
+            for app_name in app_names:
+                if app_name and source not in self.app_sources.setdefault(app_name, []):
+                    self.app_sources[app_name].append(source)
+        self.app_order = {app_name: i for i, app_name in enumerate(self.app_sources)}
+        self.matcher = AhoCorasick(self.app_sources)
+        self.app_fuzzy_index = NgramTfidfIndex((app_name, app_name, 1.0) for app_name in self.app_sources)
+
+    def loaded_shards(self) -> List[KnowledgeShard]:
+        """按知识文件顺序返回已加载的分片"""
+        return [self.shards[source] for source in self.sources if source in self.shards]
 
 class KnowledgeManager:
     """知识管理器"""
     
-    def __init__(self, knowledge_file: str = "knowledge.json"):
-        self.knowledge_file = knowledge_file
-        self.data = None
-        self.knowledge_base = {}
+    def __init__(self, knowledge_file: str = None, knowledge_dir: str = None):
+        self.knowledge_file = knowledge_file if knowledge_file is not None else Config.KNOWLEDGE_FILE
+        self.knowledge_dir = knowledge_dir if knowledge_dir is not None else Config.KNOWLEDGE_DIR
+        self._state = KnowledgeSnapshot({}, {}, None)
+        self._write_lock = threading.Lock()
+        self._last_poll = 0.0
+        # 知识文件 -> (mtime, [(应用名或别名, 包名)])，未加载的分片从快照头部或JSON中读取
+        self._app_packages = {}
         self._load_knowledge()
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """单个知识文件的知识树"""
+        state = self._state
+        shard = state.shards.get(state.primary)
+        return shard.data if shard else {}
+
+    @property
+    def knowledge_base(self) -> Dict[str, List[str]]:
+        """所有应用的功能列表"""
+        return self.get_knowledge_base()
     
     def _load_knowledge(self):
-        """加载知识库"""
-        try:
-            if os.path.exists(self.knowledge_file):
-                with open(self.knowledge_file, "r", encoding="utf-8") as f:
-                    self.data = json.load(f)
-                self.knowledge_base = self._extract_features(self.data)
-                print("知识库加载完成")
+        """加载知识库：单个知识文件立即加载，知识目录中的分片只登记不解析"""
+        with self._write_lock:
+            sources = self._scan_sources()
+            shards = {}
+            if self.knowledge_file in sources:
+                shard = self._load_shard(self.knowledge_file, sources[self.knowledge_file])
+                if shard:
+                    shards[self.knowledge_file] = shard
+                    print("知识库加载完成")
             else:
                 print(f"知识库文件 {self.knowledge_file} 不存在")
-                self.data = {}
-                self.knowledge_base = {}
+            self._state = self._make_snapshot(sources, shards)
+            self._last_poll = time.time()
+        if len(sources) > len(shards):
+            print(f"知识目录 {self.knowledge_dir} 中登记了 {len(sources) - len(shards)} 个应用分片（首次使用时加载）")
+
+    def _make_snapshot(self, sources: Dict[str, float], shards: Dict[str, KnowledgeShard]) -> KnowledgeSnapshot:
+        primary = self.knowledge_file if self.knowledge_file in sources else None
+        return KnowledgeSnapshot(sources, shards, primary)
+
+    def _scan_sources(self) -> Dict[str, float]:
+        """列出所有知识文件及其mtime"""
+        sources = {}
+        try:
+            sources[self.knowledge_file] = os.stat(self.knowledge_file).st_mtime
+        except OSError:
+            pass
+        if self.knowledge_dir and os.path.isdir(self.knowledge_dir):
+            for entry in sorted(os.scandir(self.knowledge_dir), key=lambda e: e.name):
+                if entry.is_file() and entry.name.endswith(".json"):
+                    try:
+                        sources[entry.path] = entry.stat().st_mtime
+                    except OSError:
+                        continue
+        return sources
+
+    def _load_shard(self, source: str, mtime: float) -> Optional[KnowledgeShard]:
+        """加载一个知识文件：快照与文件哈希一致时直接使用快照，否则解析JSON并构建索引；失败时返回None"""
+        try:
+            with open(source, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha256(raw).digest()
+            shard = self._read_snapshot(source, digest)
+            if shard is not None:
+                shard.source, shard.mtime = source, mtime
+                return shard
+            data = json.loads(raw.decode("utf-8"))
         except Exception as e:
-            print(f"加载知识库失败: {e}")
-            self.data = {}
-            self.knowledge_base = {}
-    
+            print(f"加载知识库失败: {source}: {e}")
+            return None
+        return self._build_shard(source, mtime, data)
+
+    @staticmethod
+    def snapshot_path(source: str) -> str:
+        """知识文件对应的快照路径"""
+        return source + Config.KNOWLEDGE_SNAPSHOT_SUFFIX
+
+    def _read_snapshot_file(self, source: str, digest: bytes,
+                            with_payload: bool = True) -> Optional[Tuple[List[Tuple[str, str]], bytes]]:
+        """读取快照的包名表和内容（with_payload 为 False 时只读头部），
+        不存在、格式版本不同、与知识文件哈希不一致或校验失败时返回None"""
+        path = self.snapshot_path(source)
+        header_size = len(SNAPSHOT_MAGIC) + 2 + 3 * len(digest) + 4
+        try:
+            with open(path, "rb") as f:
+                header = f.read(header_size)
+                packages_size = int.from_bytes(header[header_size - 4:], "big")
+                packages_raw = f.read(packages_size)
+                payload = f.read() if with_payload else b""
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"读取知识快照失败，忽略: {path}: {e}")
+            return None
+        offset = len(SNAPSHOT_MAGIC) + 2
+        if len(header) != header_size or header[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC or \
+                int.from_bytes(header[len(SNAPSHOT_MAGIC):offset], "big") != SNAPSHOT_FORMAT_VERSION:
+            print(f"知识快照格式不匹配，忽略: {path}")
+            return None
+        file_digest, packages_digest, payload_digest = (
+            header[offset + i * len(digest):offset + (i + 1) * len(digest)] for i in range(3))
+        if file_digest != digest:
+            print(f"知识快照已过期（知识文件已修改），忽略: {path}")
+            return None
+        if packages_digest != hashlib.sha256(packages_raw).digest() or \
+                (with_payload and payload_digest != hashlib.sha256(payload).digest()):
+            print(f"知识快照内容校验失败，忽略: {path}")
+            return None
+        try:
+            packages = marshal.loads(packages_raw, **_MARSHAL_LOAD_KWARGS)
+            if not isinstance(packages, list) or not all(
+                    isinstance(entry, tuple) and len(entry) == 2 and all(isinstance(v, str) for v in entry)
+                    for entry in packages):
+                raise ValueError("包名表结构不正确")
+        except Exception as e:
+            print(f"知识快照内容不合法，忽略: {path}: {e}")
+            return None
+        return packages, payload
+
+    def _read_snapshot(self, source: str, digest: bytes) -> Optional[KnowledgeShard]:
+        """读取快照，不存在、格式版本不同、与知识文件哈希不一致或内容校验失败时返回None"""
+        snapshot = self._read_snapshot_file(source, digest)
+        if snapshot is None:
+            return None
+        packages, payload = snapshot
+        # 反序列化大量小对象时关闭GC，避免反复触发分代回收
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            shard = self._decode_shard(source, marshal.loads(payload, **_MARSHAL_LOAD_KWARGS))
+        except Exception as e:
+            print(f"知识快照内容不合法，忽略: {self.snapshot_path(source)}: {e}")
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+        shard.app_packages = packages
+        return shard
+
+    def _decode_shard(self, source: str, payload: Any) -> KnowledgeShard:
+        """由快照内容重建分片，结构不合法时抛出异常"""
+        if not isinstance(payload, dict) or not isinstance(payload.get("data"), dict) \
+                or not isinstance(payload.get("steps"), list) or not isinstance(payload.get("parents"), bytes):
+            raise ValueError("快照内容结构不正确")
+        parents = array("i")
+        parents.frombytes(payload["parents"])
+        if sys.byteorder == "big":
+            parents.byteswap()
+        steps = payload["steps"]
+        if len(parents) != len(steps):
+            raise ValueError("父节点与步骤数量不一致")
+        for node_id, (parent, step) in enumerate(zip(parents, steps)):
+            # 父节点必须在子节点之前（先序），保证沿父节点指针一定能回到根节点
+            if not -1 <= parent < node_id:
+                raise ValueError(f"节点 {node_id} 的父节点编号不合法")
+            if not isinstance(step, tuple) or len(step) != 4 or not isinstance(step[0], str):
+                raise ValueError(f"节点 {node_id} 的步骤不合法")
+
+        shard = KnowledgeShard(source, 0.0, payload["data"])
+        shard.parents = parents.tolist()
+        shard.steps = steps
+        self._index_steps(shard)
+        self._collect_feature_owners(shard)
+        shard.matcher = AhoCorasick.from_tables(list(shard.feature_owners), payload)
+        return shard
+
+    def _encode_shard(self, shard: KnowledgeShard) -> Dict[str, Any]:
+        """快照内容：知识树、路径步骤、父节点数组和匹配自动机表，其余索引在加载时重建"""
+        parents = array("i", shard.parents)
+        if sys.byteorder == "big":
+            parents.byteswap()
+        return dict(shard.matcher.export_tables(), data=shard.data, steps=shard.steps, parents=parents.tobytes())
+
+    def compile_snapshot(self, source: str) -> str:
+        """将知识文件解析并构建索引后写入快照，返回快照路径"""
+        with open(source, "rb") as f:
+            raw = f.read()
+        shard = self._build_shard(source, 0.0, _share_strings(json.loads(raw.decode("utf-8"))))
+        packages = marshal.dumps(shard.app_packages)
+        payload = marshal.dumps(self._encode_shard(shard))
+        path = self.snapshot_path(source)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(SNAPSHOT_FORMAT_VERSION.to_bytes(2, "big"))
+            f.write(hashlib.sha256(raw).digest())
+            f.write(hashlib.sha256(packages).digest())
+            f.write(hashlib.sha256(payload).digest())
+            f.write(len(packages).to_bytes(4, "big"))
+            f.write(packages)
+            f.write(payload)
+        os.replace(tmp_path, path)
+        return path
+
+    def compile_snapshots(self) -> List[str]:
+        """为所有知识文件（单个知识文件和知识目录中的分片）生成快照"""
+        return [self.compile_snapshot(source) for source in self._scan_sources()]
+
+    def _build_shard(self, source: str, mtime: float, data: Dict[str, Any]) -> KnowledgeShard:
+        """根据知识树构建分片索引"""
+        shard = KnowledgeShard(source, mtime, data)
+        shard.app_packages = _collect_app_packages(data)
+        if data:
+            # 路径索引同时生成各应用的功能列表（与 _extract_features 的结果一致）
+            self._build_path_index(shard)
+            self._build_matcher(shard)
+        return shard
+
+    def _get_shard(self, source: str) -> Optional[KnowledgeShard]:
+        """获取分片，未加载时加载并替换为包含该分片的新视图"""
+        shard = self._state.shards.get(source)
+        if shard is not None:
+            return shard
+        with self._write_lock:
+            state = self._state
+            if source in state.shards:
+                return state.shards[source]
+            if source not in state.sources:
+                return None
+            shard = self._load_shard(source, state.sources[source])
+            if shard is None:
+                return None
+            self._state = self._make_snapshot(state.sources, {**state.shards, source: shard})
+            print(f"知识分片加载完成: {source}")
+            return shard
+
+    def poll_changes(self, force: bool = False) -> bool:
+        """按mtime检查知识文件的变化，只重建变化的分片并整体替换视图；返回是否有变化
+
+        其他线程正在检查时直接返回，不等待。
+        """
+        if not force and time.time() - self._last_poll < Config.KNOWLEDGE_POLL_INTERVAL:
+            return False
+        if not self._write_lock.acquire(blocking=force):
+            return False
+        try:
+            self._last_poll = time.time()
+            state = self._state
+            sources = self._scan_sources()
+            if sources == state.sources and not force:
+                return False
+
+            shards = {}
+            for source, mtime in sources.items():
+                shard = state.shards.get(source)
+                if shard is not None and shard.mtime == mtime and not force:
+                    shards[source] = shard
+                elif shard is not None or source == self.knowledge_file:
+                    # 已加载的分片立即重建；解析失败（例如文件正在写入）时保留旧分片
+                    new_shard = self._load_shard(source, mtime)
+                    if new_shard is not None:
+                        shards[source] = new_shard
+                        print(f"知识分片已更新: {source}")
+                    elif shard is not None:
+                        shards[source] = shard
+            added = sources.keys() - state.sources.keys()
+            removed = state.sources.keys() - sources.keys()
+            if added or removed:
+                print(f"知识文件变化: 新增 {sorted(added)}，删除 {sorted(removed)}")
+            self._state = self._make_snapshot(sources, shards)
+            return True
+        finally:
+            self._write_lock.release()
+
+    def get_version(self) -> str:
+        """知识库版本：所有知识文件路径和mtime的摘要，任一文件变化后改变"""
+        sources = sorted(self._state.sources.items())
+        return hashlib.sha1(repr(sources).encode("utf-8")).hexdigest()[:12]
+
     def _extract_features(self, node: Dict[str, Any], app_name: str = None, 
                          knowledge_base: Dict[str, List[str]] = None) -> Dict[str, List[str]]:
         """提取特征"""
@@ -53,10 +476,184 @@ class KnowledgeManager:
             self._extract_features(child, app_name, knowledge_base)
 
         return knowledge_base
-    
+
+    def _build_path_index(self, shard: KnowledgeShard):
+        """构建路径索引，使查找路径的开销只与路径长度有关"""
+        # 迭代式先序遍历，与 _find_path_with_notes 的搜索顺序一致
+        stack = [(shard.data, -1)]
+        while stack:
+            node, parent = stack.pop()
+            node_id = len(shard.parents)
+            step = self._make_step(node)
+            shard.parents.append(parent)
+            shard.steps.append((step["name"], step["type"], step["note"], step.get("children_names")))
+            for child in reversed(node.get("children", [])):
+                stack.append((child, node_id))
+        self._index_steps(shard)
+
+    def _index_steps(self, shard: KnowledgeShard):
+        """由先序排列的步骤和父节点生成名称索引、应用内名称索引和各应用的功能列表"""
+        apps = []
+        for node_id, (name, node_type, _, _) in enumerate(shard.steps):
+            parent = shard.parents[node_id]
+            app_name = name.replace("app", "").strip() if node_type == "app" else \
+                (apps[parent] if parent >= 0 else None)
+            apps.append(app_name)
+            shard.name_index.setdefault(name, node_id)
+            shard.app_index.setdefault((app_name, name), node_id)
+            # 与 _extract_features 相同：应用节点开始新的功能列表，页面/菜单/功能归入所属应用
+            if node_type == "app":
+                shard.knowledge_base[app_name] = []
+            elif node_type in ("feature", "page", "menu") and app_name:
+                shard.knowledge_base[app_name].append(name)
+
+    def _collect_feature_owners(self, shard: KnowledgeShard):
+        """功能名 -> [(所属应用, 在该应用功能列表中的序号)]"""
+        for app_name, features in shard.knowledge_base.items():
+            for order, feature in enumerate(features):
+                if not feature:
+                    continue
+                owners = shard.feature_owners.setdefault(feature, [])
+                if not owners or owners[-1][0] != app_name:
+                    owners.append((app_name, order))
+
+    def _build_matcher(self, shard: KnowledgeShard):
+        """编译分片中功能名的匹配自动机"""
+        self._collect_feature_owners(shard)
+        shard.matcher = AhoCorasick(shard.feature_owners)
+
+    def _get_fuzzy_index(self, shard: KnowledgeShard) -> NgramTfidfIndex:
+        """获取分片的模糊检索索引，未构建时构建（只在逐字匹配失败时才需要）"""
+        if shard.fuzzy_index is None:
+            shard.fuzzy_index = self._build_fuzzy_index(shard)
+        return shard.fuzzy_index
+
+    def _build_fuzzy_index(self, shard: KnowledgeShard) -> NgramTfidfIndex:
+        """构建分片中功能名和备注的模糊检索索引，备注的得分按 KNOWLEDGE_FUZZY_NOTE_WEIGHT 打折"""
+        documents = []
+        for (app_name, name), node_id in shard.app_index.items():
+            if not app_name or not name or shard.steps[node_id][1] not in ("feature", "page", "menu"):
+                continue
+            documents.append((name, (app_name, name), 1.0))
+            note = shard.steps[node_id][2]
+            if note:
+                documents.append((note, (app_name, name), Config.KNOWLEDGE_FUZZY_NOTE_WEIGHT))
+        return NgramTfidfIndex(documents)
+
+    def _fuzzy_candidates(self, instruction: str) -> List[Tuple[float, str, str, KnowledgeShard]]:
+        """模糊检索：返回置信度不低于阈值的前 KNOWLEDGE_FUZZY_TOP_K 个 (置信度, 应用, 功能, 分片)
+
+        置信度 = 功能的n-gram检索得分 × sqrt(应用得分)。逐字出现的应用名得分为1，否则为n-gram检索得分；
+        指令中没有提到任何应用时，在已加载的分片中检索，应用得分为 KNOWLEDGE_FUZZY_NO_APP_WEIGHT。
+        """
+        state = self._state
+        top_k = Config.KNOWLEDGE_FUZZY_TOP_K
+        threshold = Config.KNOWLEDGE_FUZZY_THRESHOLD
+
+        app_scores = {app_name: 1.0 for app_name in state.matcher.find_all(instruction)}
+        for score, app_name in state.app_fuzzy_index.search(instruction, top_k, threshold):
+            app_scores.setdefault(app_name, score)
+
+        # 分片 -> 通过文件名匹配到该分片时的应用得分（None表示需要按分片内的应用名匹配）
+        shard_scores = {}
+        if app_scores:
+            for app_name, score in app_scores.items():
+                for source in state.app_sources[app_name]:
+                    shard = self._get_shard(source)
+                    if shard is None:
+                        continue
+                    _, shard_score = shard_scores.get(source, (shard, None))
+                    if source != state.primary:
+                        shard_score = max(shard_score or 0.0, score)
+                    shard_scores[source] = (shard, shard_score)
+        else:
+            for shard in state.loaded_shards():
+                shard_scores[shard.source] = (shard, Config.KNOWLEDGE_FUZZY_NO_APP_WEIGHT)
+
+        best = {}
+        for shard, shard_score in shard_scores.values():
+            fuzzy_index = self._get_fuzzy_index(shard)
+            for feature_score, (app_name, feature) in fuzzy_index.search(instruction, top_k * 2, threshold):
+                app_score = app_scores.get(app_name, shard_score) if app_scores else shard_score
+                if app_score is None:
+                    continue
+                score = feature_score * math.sqrt(app_score)
+                key = (app_name, feature)
+                if score >= threshold and score > best.get(key, (0.0,))[0]:
+                    best[key] = (score, app_name, feature, shard)
+        ranked = sorted(best.values(), key=lambda item: (-item[0], -len(item[2])))
+        return ranked[:top_k]
+
+    def _rank_candidates(self, instruction: str) -> List[Tuple[str, str, KnowledgeShard]]:
+        """找出指令中出现的应用名，再在对应分片中匹配功能名，返回排序后的 (应用, 功能, 分片)"""
+        state = self._state
+        found_apps = state.matcher.find_all(instruction)
+        candidates = []
+        visited = set()
+        for found_app in found_apps:
+            for source in state.app_sources[found_app]:
+                if source in visited:
+                    continue
+                visited.add(source)
+                shard = self._get_shard(source)
+                if shard is None:
+                    continue
+                # 通过文件名匹配到的目录分片，其中的应用都视为已匹配
+                via_file_name = source != state.primary
+                for feature in shard.matcher.find_all(instruction):
+                    for app_name, order in shard.feature_owners[feature]:
+                        if app_name in found_apps or via_file_name:
+                            rank = state.app_order.get(app_name, state.app_order[found_app])
+                            candidates.append(((-len(feature), -len(app_name), rank, order),
+                                               (app_name, feature, shard)))
+        candidates.sort(key=lambda item: item[0])
+        return [candidate for _, candidate in candidates]
+
+    def match_features(self, instruction: str) -> List[Tuple[str, str]]:
+        """一次扫描指令找出所有出现的应用名和功能名，返回按匹配程度排序的 (应用, 功能) 列表
+
+        排序依据：功能名越长越具体；其次应用名越长越好；再按知识库中的顺序。
+        """
+        return [(app_name, feature) for app_name, feature, _ in self._rank_candidates(instruction)]
+
+    def _make_step(self, node: Dict[str, Any]) -> Dict[str, Any]:
+        """生成路径中的一个步骤（包含 note）"""
+        step = {
+            "name": node["name"],
+            "type": node.get("type"),
+            "note": node.get("note")
+        }
+        # 如果是菜单类型且名称为空，包含前两个子节点的名称
+        if node.get("type") == "menu" and node["name"] == "":
+            step["children_names"] = [child["name"] for child in node.get("children", [])[:2]]
+        return step
+
+    def _shards_for(self, app_name: str = None) -> List[KnowledgeShard]:
+        """指定应用时返回包含该应用的分片，否则返回所有已加载的分片"""
+        state = self._state
+        if app_name and app_name in state.app_sources:
+            return [shard for shard in map(self._get_shard, state.app_sources[app_name]) if shard]
+        return state.loaded_shards()
+
+    def find_path(self, target: str, app_name: str = None) -> Optional[List[Dict[str, Any]]]:
+        """查找目标功能的路径（包含 note），不指定应用时结果与 _find_path_with_notes 一致"""
+        for shard in self._shards_for(app_name):
+            path = shard.find_path(target, app_name)
+            if path:
+                return path
+        return None
+
+    def get_path_sentence(self, target: str, app_name: str = None) -> Optional[str]:
+        """直接返回目标功能路径的步骤描述，不指定应用时结果与 _path_to_sentence 一致"""
+        for shard in self._shards_for(app_name):
+            sentence = shard.path_sentence(target, app_name)
+            if sentence:
+                return sentence
+        return None
+
     def _find_path_with_notes(self, node: Dict[str, Any], target: str, 
                              path: List[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
-        """搜索功能，返回路径（包含 note）"""
+        """递归搜索功能，返回路径（包含 note）；常规查询请使用基于索引的 find_path"""
         if path is None:
             path = []
         
@@ -89,35 +686,9 @@ class KnowledgeManager:
     
 
 
-    def _step_description(self, step: Dict[str, Any], index: int) -> str:
-        """根据节点类型选择模板"""
-        t = step["type"]
-        name = step["name"]
-        note = f"（注意：{step['note']}）" if step.get("note") else ""
-        
-        if index == 0 and t == "app":
-            return f'{index+1}、从手机桌面打开"{name}"'
-        elif t == "menu":
-            if name != "":
-                return f'{index+1}、在当前页中可以看到名称为"{name}"的菜单{note}'
-            else:
-                # 如果菜单名称为空，使用前两个子节点的名称
-                children_names = step.get("children_names", [])
-                if children_names:
-                    children_text = "、".join(children_names)
-                    return f'{index+1}、在当前页中可以看到一个菜单，包含了"{children_text}等项目"{note}'
-                else:
-                    return f'{index+1}、在当前页中可以看到一个菜单{note}'
-        elif t == "page":
-            return f'{index+1}、点击"{name}"进入新页面{note}'
-        elif t == "feature":
-            return f'{index+1}、点击功能"{name}"{note}'
-        else:
-            return f'{index+1}、点击"{name}"{note}'
-    
     def _path_to_sentence(self, path: List[Dict[str, Any]]) -> str:
         """将路径转换为句子描述"""
-        return "\n".join(self._step_description(step, i) for i, step in enumerate(path))
+        return "\n".join(describe_step(step, i) for i, step in enumerate(path))
     
     def _get_general_knowledge(self, instruction: str) -> str:
         """获取通用知识"""
@@ -133,23 +704,28 @@ class KnowledgeManager:
 
     def query_from_instruction(self, instruction: str) -> str:
         """根据指令查询相关知识"""
+        # 检查知识文件是否有变化（有间隔限制，不会每次都访问文件系统）
+        self.poll_changes()
+
         # 获取通用知识
         general_knowledge = self._get_general_knowledge(instruction)
         
-        # 遍历知识库中的应用和功能
-        for app_name, features in self.knowledge_base.items():
-            # 如果app_name在instruction中，继续检查功能
-            if app_name in instruction:
-                # 找到所有在instruction中的feature
-                matched_features = [feature for feature in features if feature and feature in instruction]
-                # 选择匹配长度最长的feature
-                if matched_features:
-                    best_feature = max(matched_features, key=len)
-                    path = self._find_path_with_notes(self.data, best_feature)
-                    if path:
-                        specific_knowledge = self._path_to_sentence(path)
-                        # 组合通用知识和具体路径
-                        return f"{general_knowledge}\n\n具体操作步骤：\n{specific_knowledge}"
+        # 按匹配程度依次尝试 (应用, 功能)
+        for app_name, feature, shard in self._rank_candidates(instruction):
+            specific_knowledge = shard.path_sentence(feature, app_name)
+            if specific_knowledge:
+                # 组合通用知识和具体路径
+                return f"{general_knowledge}\n\n具体操作步骤：\n{specific_knowledge}"
+        
+        # 没有逐字匹配时使用模糊检索，给出置信度最高的几个候选
+        sections = []
+        for score, app_name, feature, shard in self._fuzzy_candidates(instruction):
+            sentence = shard.path_sentence(feature, app_name)
+            if sentence:
+                sections.append(f'候选{len(sections) + 1}（"{app_name}"中的"{feature}"，置信度{score:.2f}）：\n{sentence}')
+        if sections:
+            candidates = "\n\n".join(sections)
+            return f"{general_knowledge}\n\n具体操作步骤（未找到完全匹配，以下为模糊匹配的候选）：\n{candidates}"
         
         # 如果没有找到具体路径，只返回通用知识
         return f"{general_knowledge}\n\n未找到匹配的具体操作步骤。"
@@ -159,12 +735,72 @@ class KnowledgeManager:
         return self.query_from_instruction(original_instruction)
     
     def get_knowledge_base(self) -> Dict[str, List[str]]:
-        """获取知识库"""
-        return self.knowledge_base
+        """获取知识库（会加载所有尚未加载的分片）"""
+        knowledge_base = {}
+        for source in self._state.sources:
+            shard = self._get_shard(source)
+            if shard:
+                for app_name, features in shard.knowledge_base.items():
+                    knowledge_base.setdefault(app_name, []).extend(features)
+        return knowledge_base
+    
+    def get_app_names(self) -> List[str]:
+        """知识库中的所有应用名（不加载分片，目录分片用文件名）"""
+        return list(self._state.app_sources)
+    
+    def get_app_packages(self) -> Dict[str, str]:
+        """应用名及别名 -> 包名，来自app节点的 package / aliases 字段（不加载分片）"""
+        state = self._state
+        packages = {}
+        for source, mtime in state.sources.items():
+            for name, package in self._shard_app_packages(state, source, mtime):
+                packages.setdefault(name, package)
+        return packages
+
+    def _shard_app_packages(self, state: KnowledgeSnapshot, source: str, mtime: float) -> List[Tuple[str, str]]:
+        """一个知识文件的包名表：已加载的分片直接使用，否则按mtime缓存从快照头部或JSON读取的结果"""
+        shard = state.shards.get(source)
+        if shard is not None and shard.mtime == mtime:
+            return shard.app_packages
+        cached = self._app_packages.get(source)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(source, "rb") as f:
+                raw = f.read()
+            snapshot = self._read_snapshot_file(source, hashlib.sha256(raw).digest(), with_payload=False)
+            # 没有可用快照时只解析JSON收集app节点，不构建索引
+            packages = snapshot[0] if snapshot is not None else _collect_app_packages(json.loads(raw.decode("utf-8")))
+        except Exception as e:
+            print(f"读取应用包名失败: {source}: {e}")
+            return []
+        self._app_packages[source] = (mtime, packages)
+        return packages
     
     def reload_knowledge(self):
-        """重新加载知识库"""
-        self._load_knowledge()
+        """重新扫描并重建所有已加载的分片，完成后整体替换"""
+        self.poll_changes(force=True)
+
+# 全局知识管理器（惰性创建，首次使用时才加载知识库）
+get_knowledge_manager = lazy_singleton(KnowledgeManager)
+
+def main(argv: List[str] = None):
+    """命令行入口: python -m modular.knowledge compile [知识文件 ...]"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "compile":
+        print("用法: python -m modular.knowledge compile [知识文件 ...]")
+        return 1
+    manager = KnowledgeManager()
+    paths = [manager.compile_snapshot(source) for source in argv[1:]] if len(argv) > 1 else manager.compile_snapshots()
+    for path in paths:
+        print(f"已生成知识快照: {path}")
+    return 0
+
+def __getattr__(name):
+    """兼容 `from .knowledge import knowledge_manager` 的旧用法，首次访问时才创建实例"""
+    if name == "knowledge_manager":
+        return get_knowledge_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# 全局知识管理器实例
-knowledge_manager = KnowledgeManager() 
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
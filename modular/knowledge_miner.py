@@ -0,0 +1,288 @@
+"""
+轨迹知识挖掘模块
+
+离线读取任务文件夹中的 TaskLogger 日志，从成功完成的任务中提取每个应用里验证过的导航路径，
+合并到知识树中：已有节点记录验证次数和来源，缺失的节点作为新的 page/feature 节点加入，
+并附带备注和来源（provenance）。修改后的知识文件会被 KnowledgeManager 自动重新加载。
+
+用法:
+    python -m modular.knowledge_miner task_xxx task_yyy [--min-support 2] [--dry-run]
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .config import Config
+from .matcher import AhoCorasick
+from .utils import target_name
+
+# 没有出现在知识库中的应用："打开XXX"/"打开XXXapp"
+_OPEN_APP_RE = re.compile(r'^打开(?:手机上的|手机中的)?[“"「]?(\w+?)(?:app|APP|App|应用|软件)?[”"」]?$')
+
+@dataclass
+class MinedPath:
+    """一条挖掘出的导航路径：在应用中依次点击 steps 即可到达最后一个元素"""
+    app_name: str
+    steps: List[str]
+    provenance: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def key(self) -> Tuple[str, Tuple[str, ...]]:
+        return self.app_name, tuple(self.steps)
+
+def source_key(provenance: Dict[str, Any]) -> str:
+    """来源的去重键：任务文件夹名（不含路径），没有时用任务时间"""
+    task_folder = provenance.get("task_folder")
+    if task_folder:
+        return os.path.basename(os.path.normpath(task_folder))
+    return str(provenance.get("time", ""))
+
+def _app_name_of(node: Dict[str, Any]) -> str:
+    """与 KnowledgeManager._extract_features 一致的应用名"""
+    return node["name"].replace("app", "").strip()
+
+class TrajectoryMiner:
+    """从任务日志中提取验证过的导航路径"""
+
+    def __init__(self, known_apps: Iterable[str] = ()):
+        self.known_apps = [app for app in known_apps if app]
+        self._app_matcher = AhoCorasick(self.known_apps)
+
+    @staticmethod
+    def load_task_log(task_folder: str) -> Optional[Dict[str, Any]]:
+        """读取任务文件夹中的 JSON 日志"""
+        for log_path in sorted(glob.glob(os.path.join(task_folder, "task_log_*.json"))):
+            try:
+                with open(log_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"读取任务日志失败: {log_path}: {e}")
+        return None
+
+    def detect_app(self, description: str) -> Optional[str]:
+        """识别子任务描述中打开/使用的应用"""
+        found = self._app_matcher.find_all(description)
+        if found:
+            return max(found, key=len)
+        match = _OPEN_APP_RE.match(description.strip())
+        return match.group(1) if match else None
+
+    def extract_paths(self, log_data: Dict[str, Any], task_folder: str = "") -> List[MinedPath]:
+        """从一次任务日志中提取路径，只使用最终成功的任务中成功完成的子任务"""
+        if log_data.get("final_status") != "COMPLETED":
+            return []
+
+        paths = []
+        app_name, steps, subtasks, broken = None, [], [], False
+
+        def flush():
+            if app_name and steps:
+                paths.append(MinedPath(app_name, list(steps), [{
+                    "source": "trajectory",
+                    "task": log_data.get("task_name", ""),
+                    "task_folder": task_folder,
+                    "subtasks": list(subtasks),
+                    "time": log_data.get("end_time") or log_data.get("start_time", "")
+                }]))
+
+        for subtask in log_data.get("subtasks", []):
+            if not subtask.get("success"):
+                # 失败的子任务之后的路径无法确认，重新开始
+                flush()
+                app_name, steps, subtasks, broken = None, [], [], False
+                continue
+            detected = self.detect_app(subtask.get("description", ""))
+            if detected and detected != app_name:
+                flush()
+                app_name, steps, subtasks, broken = detected, [], [], False
+            subtasks.append(subtask.get("description", ""))
+
+            for action in subtask.get("actions", []):
+                if not action.get("success", True) or app_name is None:
+                    continue
+                action_type = action.get("action_type")
+                if action_type in ("click", "long_press"):
+                    if broken:
+                        continue
+                    name = target_name(action.get("thought", ""))
+                    if name is None:
+                        # 无法确定点击目标，之后的步骤不再可靠
+                        broken = True
+                    elif app_name in name:
+                        continue  # 在桌面上点击应用图标
+                    elif name in steps:
+                        # 回到了之前的页面，去掉中间绕的路
+                        del steps[steps.index(name) + 1:]
+                    else:
+                        steps.append(name)
+                elif action_type == "press_back" and not broken and steps:
+                    steps.pop()
+                elif action_type == "type":
+                    # 输入文本之后的点击依赖于输入内容，不作为通用导航路径
+                    broken = True
+                elif action_type == "press_home":
+                    flush()
+                    app_name, steps, subtasks, broken = None, [], [], False
+        flush()
+        return paths
+
+    def mine(self, task_folders: Iterable[str]) -> List[MinedPath]:
+        """挖掘多个任务文件夹，相同路径合并来源；同一个任务文件夹只挖掘一次"""
+        merged = {}
+        seen = set()
+        for task_folder in task_folders:
+            key = source_key({"task_folder": task_folder})
+            if key in seen:
+                continue
+            seen.add(key)
+            log_data = self.load_task_log(task_folder)
+            if log_data is None:
+                continue
+            for path in self.extract_paths(log_data, task_folder):
+                if path.key in merged:
+                    merged[path.key].provenance.extend(path.provenance)
+                else:
+                    merged[path.key] = path
+        return list(merged.values())
+
+class KnowledgeTreeWriter:
+    """把挖掘出的路径合并到知识文件中"""
+
+    def __init__(self, knowledge_file: str = None, knowledge_dir: str = None):
+        self.knowledge_file = knowledge_file if knowledge_file is not None else Config.KNOWLEDGE_FILE
+        self.knowledge_dir = knowledge_dir if knowledge_dir is not None else Config.KNOWLEDGE_DIR
+        self.trees = {}        # 知识文件 -> 知识树
+        self.app_nodes = {}    # 应用名 -> (知识文件, 应用节点)
+        self.changed = set()
+        sources = [self.knowledge_file] if os.path.exists(self.knowledge_file) else []
+        if self.knowledge_dir and os.path.isdir(self.knowledge_dir):
+            sources += sorted(glob.glob(os.path.join(self.knowledge_dir, "*.json")))
+        for source in sources:
+            with open(source, "r", encoding="utf-8") as f:
+                self.trees[source] = json.load(f)
+            self._register_apps(source, self.trees[source])
+
+    def _register_apps(self, source: str, node: Dict[str, Any]):
+        if node.get("type") == "app":
+            self.app_nodes.setdefault(_app_name_of(node), (source, node))
+        for child in node.get("children", []):
+            self._register_apps(source, child)
+
+    def known_apps(self) -> List[str]:
+        return list(self.app_nodes)
+
+    def _app_node(self, app_name: str) -> Optional[Dict[str, Any]]:
+        """获取应用节点，知识库中没有的应用在知识目录中新建一个分片"""
+        if app_name in self.app_nodes:
+            source, node = self.app_nodes[app_name]
+            self.changed.add(source)
+            return node
+        if not self.knowledge_dir:
+            print(f"知识库中没有应用\"{app_name}\"且未配置知识目录，跳过")
+            return None
+        source = os.path.join(self.knowledge_dir, f"{app_name}.json")
+        node = {"name": f"{app_name}app", "type": "app", "children": []}
+        self.trees[source] = node
+        self.app_nodes[app_name] = (source, node)
+        self.changed.add(source)
+        return node
+
+    @staticmethod
+    def _find_child(node: Dict[str, Any], name: str) -> Optional[Dict[str, Any]]:
+        """在当前页面中查找元素：直接子节点，或者穿过菜单（界面容器）的子节点"""
+        queue = list(node.get("children", []))
+        while queue:
+            child = queue.pop(0)
+            if child.get("name") == name:
+                return child
+            if child.get("type") == "menu":
+                queue.extend(child.get("children", []))
+        return None
+
+    @staticmethod
+    def _record(node: Dict[str, Any], provenance: List[Dict[str, Any]]):
+        """记录验证次数和来源；只更新挖掘生成的节点的备注，人工编写的备注保持不变
+
+        已记录过的来源（同一任务文件夹或时间）不重复计数，重复挖掘相同的日志不会改变节点。
+        verified_sources 保存全部来源的去重键，provenance 只保留最近的几条详细记录。
+        """
+        sources = node.get("verified_sources")
+        if sources is None:
+            sources = list(dict.fromkeys(source_key(p) for p in node.get("provenance", [])))
+        new = []
+        for p in provenance:
+            key = source_key(p)
+            if key not in sources:
+                sources.append(key)
+                new.append(p)
+        node["verified_sources"] = sources
+        node["verified_count"] = len(sources)
+        node["provenance"] = (node.get("provenance", []) + new)[-Config.KNOWLEDGE_MINER_MAX_PROVENANCE:]
+        if node.get("learned"):
+            node["note"] = f"该路径已在{node['verified_count']}次成功执行中验证"
+
+    def merge(self, path: MinedPath) -> int:
+        """合并一条路径，返回新增的节点数"""
+        node = self._app_node(path.app_name)
+        if node is None:
+            return 0
+        added = 0
+        for i, name in enumerate(path.steps):
+            is_last = i == len(path.steps) - 1
+            child = self._find_child(node, name)
+            if child is None:
+                child = {"name": name, "type": "feature" if is_last else "page", "learned": True}
+                node.setdefault("children", []).append(child)
+                added += 1
+            elif child.get("learned") and not is_last and child.get("type") == "feature":
+                child["type"] = "page"
+            self._record(child, path.provenance)
+            node = child
+        return added
+
+    def save(self):
+        """原子地写回修改过的知识文件"""
+        for source in sorted(self.changed):
+            os.makedirs(os.path.dirname(source) or ".", exist_ok=True)
+            tmp_path = f"{source}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.trees[source], f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, source)
+            print(f"已更新知识文件: {source}")
+
+def main(argv: List[str] = None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="从成功的任务日志中挖掘导航路径并合并到知识库")
+    parser.add_argument("task_folders", nargs="+", help="任务文件夹（TaskLogger 生成的 task_xxx 目录）")
+    parser.add_argument("--knowledge-file", default=None, help="知识文件，默认 Config.KNOWLEDGE_FILE")
+    parser.add_argument("--knowledge-dir", default=None, help="按应用拆分的知识目录，默认 Config.KNOWLEDGE_DIR")
+    parser.add_argument("--min-support", type=int, default=Config.KNOWLEDGE_MINER_MIN_SUPPORT,
+                        help="路径至少在多少次成功执行中出现才合并")
+    parser.add_argument("--dry-run", action="store_true", help="只打印挖掘结果，不写回知识文件")
+    args = parser.parse_args(argv)
+
+    writer = KnowledgeTreeWriter(args.knowledge_file, args.knowledge_dir)
+    miner = TrajectoryMiner(writer.known_apps())
+    paths = miner.mine(args.task_folders)
+    accepted = [path for path in paths if len(path.provenance) >= args.min_support]
+    print(f"挖掘到 {len(paths)} 条路径，其中 {len(accepted)} 条达到最小支持数 {args.min_support}")
+
+    added = 0
+    for path in accepted:
+        print(f"  [{path.app_name}] {' -> '.join(path.steps)}（{len(path.provenance)}次）")
+        if not args.dry_run:
+            added += writer.merge(path)
+    if not args.dry_run:
+        writer.save()
+        print(f"新增 {added} 个知识节点（{datetime.now().isoformat()}）")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+桌面图标坐标缓存模块
+
+按设备记录桌面各页面（以画面感知哈希标识）上识别出的应用图标及点击坐标，数据来自
+成功打开应用的子任务中 action_history 里的点击。之后打开同一应用时，如果当前画面
+是缓存中的桌面页面，直接点击图标而不调用模型。页面的哈希变化（图标移动、页面改版）
+或直接点击后画面没有变化时，对应的缓存失效。
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from .config import Config
+from .utils import hash_distance, lazy_singleton, target_name
+
+class LauncherIconCache:
+    """桌面图标坐标缓存
+
+    结构: {设备: [{"hash": 页面哈希, "screen_size": [宽, 高],
+                  "icons": {图标名称: {"x": x, "y": y, "hits": 直接点击成功次数, "updated": ...}}}]}
+    """
+
+    def __init__(self, cache_file: str = None, device: str = None):
+        self.cache_file = cache_file if cache_file is not None else Config.LAUNCHER_ICON_CACHE_FILE
+        self.device = device if device is not None else Config.BASE_URL
+        self.devices = {}
+        self.stats = {"lookups": 0, "hits": 0, "direct_taps": 0, "invalidations": 0, "learned": 0}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """读取缓存文件"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                self.devices = json.load(f)
+        except Exception as e:
+            print(f"桌面图标缓存加载失败: {e}")
+            self.devices = {}
+
+    def _save(self):
+        """原子地写回缓存文件，调用方持有锁"""
+        if not self.cache_file:
+            return
+        try:
+            tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.devices, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_file)
+        except Exception as e:
+            print(f"桌面图标缓存保存失败: {e}")
+
+    def _pages(self) -> List[Dict[str, Any]]:
+        return self.devices.setdefault(self.device, [])
+
+    def _find_page(self, frame_hash: Optional[int], screen_size: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+        """与当前画面相同的桌面页面，调用方持有锁"""
+        best, best_distance = None, Config.FRAME_HASH_DISTANCE_THRESHOLD + 1
+        for page in self._pages():
+            if page["screen_size"] != list(screen_size):
+                continue
+            distance = hash_distance(frame_hash, page["hash"])
+            if distance < best_distance:
+                best, best_distance = page, distance
+        return best
+
+    @staticmethod
+    def _match_label(icons: Dict[str, Any], app_name: str) -> Optional[str]:
+        """与应用名一致或包含应用名的图标名称（"中国联通" / "中国联通app"）"""
+        if app_name in icons:
+            return app_name
+        for label in icons:
+            if app_name in label:
+                return label
+        return None
+
+    def lookup(self, frame_hash: Optional[int], screen_size: Tuple[int, int],
+               app_name: str) -> Optional[Tuple[int, int]]:
+        """当前画面是缓存的桌面页面且页面上有该应用图标时返回点击坐标"""
+        if frame_hash is None:
+            return None
+        with self._lock:
+            self.stats["lookups"] += 1
+            page = self._find_page(frame_hash, screen_size)
+            label = self._match_label(page["icons"], app_name) if page else None
+            if label is None:
+                return None
+            self.stats["hits"] += 1
+            icon = page["icons"][label]
+            return icon["x"], icon["y"]
+
+    def record(self, frame_hash: Optional[int], screen_size: Tuple[int, int], label: str, x: int, y: int):
+        """记录一次成功打开应用的图标点击"""
+        if frame_hash is None:
+            return
+        with self._lock:
+            # 图标出现在新的页面上说明桌面布局变化，删除其他页面上的旧记录
+            for page in self._pages():
+                if hash_distance(frame_hash, page["hash"]) > Config.FRAME_HASH_DISTANCE_THRESHOLD:
+                    page["icons"].pop(label, None)
+            page = self._find_page(frame_hash, screen_size)
+            if page is None:
+                page = {"hash": frame_hash, "screen_size": list(screen_size), "icons": {}}
+                self._pages().append(page)
+            else:
+                page["hash"] = frame_hash
+            old = page["icons"].get(label, {})
+            page["icons"][label] = {"x": x, "y": y, "hits": old.get("hits", 0), "updated": datetime.now().isoformat()}
+            self.devices[self.device] = [p for p in self._pages() if p["icons"]][-Config.LAUNCHER_ICON_CACHE_MAX_PAGES:]
+            self.stats["learned"] += 1
+            self._save()
+        print(f"记录桌面图标: {label} ({x},{y})")
+
+    def report(self, frame_hash: Optional[int], screen_size: Tuple[int, int], app_name: str, success: bool):
+        """记录一次直接点击的结果，失败时该页面的缓存失效"""
+        with self._lock:
+            page = self._find_page(frame_hash, screen_size)
+            if page is None:
+                return
+            if success:
+                self.stats["direct_taps"] += 1
+                label = self._match_label(page["icons"], app_name)
+                if label:
+                    page["icons"][label]["hits"] += 1
+            else:
+                # 点击后画面没有变化，页面已经和记录时不同
+                self.stats["invalidations"] += 1
+                self._pages().remove(page)
+                print(f"桌面页面缓存失效（点击\"{app_name}\"后画面未变化）")
+            self._save()
+
+    def learn(self, app_name: str, action_history: List[Dict[str, Any]], screen_size: Tuple[int, int]) -> bool:
+        """从成功打开应用的子任务中找出点击应用图标的动作，记录点击前的桌面页面；找到时返回True
+
+        动作记录中的 frame_hash 是执行该动作时（点击前）画面的哈希。
+        """
+        for action in reversed(action_history):
+            if action.get("replayed") or action.get("action_type") not in ("click", "tap"):
+                continue
+            label = target_name(action.get("thought", ""))
+            if not label or app_name not in label:
+                continue
+            start_box = action.get("action_inputs", {}).get("start_box")
+            frame_hash = action.get("frame_hash")
+            if not isinstance(start_box, list) or len(start_box) < 2 or frame_hash is None:
+                continue
+            self.record(frame_hash, screen_size, label, round(start_box[0]), round(start_box[1]))
+            return True
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中率和直接点击次数"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pages"] = len(self.devices.get(self.device, []))
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+# 全局桌面图标缓存（惰性创建）
+get_launcher_icon_cache = lazy_singleton(LauncherIconCache)
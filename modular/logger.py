@@ -27,8 +27,24 @@ class TaskLogger:
             "plan_regenerations": [],
             "errors": [],
             "total_runtime": 0,
-            "task_knowledge": None
+            "task_knowledge": None,
+            "budget_events": [],
+            "action_repairs": [],
+            "routing_decisions": [],
+            "replays": [],
+            "app_launches": [],
+            "reflection_gates": [],
+            "reflection_cache": [],
+            "reflection_cascade": [],
+            "plan_cache": [],
+            "plan_candidates": [],
+            "plan_parses": [],
+            "subtasks": []
         }
+        # 当前子任务第一个动作在 actions_executed 中的位置
+        self._subtask_action_start = 0
+        # 已开始的子任务数，截图按它标记所属子任务
+        self._subtask_index = 0
         
         # 创建任务文件夹
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -95,17 +111,165 @@ class TaskLogger:
         self.log_data["reflections"].append(reflection)
         self.logger.info(f"Reflection completed - {execution_time:.2f}s")
         
-    def log_plan_regeneration(self, old_plan: List, new_plan: List, reason: str, execution_time: float):
-        """记录计划重新生成"""
+    def log_plan_regeneration(self, old_plan: List, new_plan: List, reason: str, execution_time: float,
+                              mode: str = "full", edits: Optional[List] = None):
+        """记录计划重新生成（full: 完整重新生成，repair: 只修补失败子任务附近的计划，fallback: 切换到备选计划）"""
         plan_regen = {
             "timestamp": datetime.now().isoformat(),
+            "mode": mode,
             "old_plan": old_plan,
             "new_plan": new_plan,
+            "edits": edits,
             "reason": reason,
             "execution_time": execution_time
         }
         self.log_data["plan_regenerations"].append(plan_regen)
-        self.logger.info(f"Plan regeneration - {execution_time:.2f}s - {len(new_plan)} new subtasks")
+        self.logger.info(f"Plan regeneration ({mode}) - {execution_time:.2f}s - {len(new_plan)} new subtasks")
+        
+    def log_action_repair(self, original_output: str, repaired_output: Optional[str],
+                          fixes: List[str], success: bool):
+        """记录本地动作格式修复"""
+        repair = {
+            "timestamp": datetime.now().isoformat(),
+            "original_output": original_output,
+            "repaired_output": repaired_output,
+            "fixes": fixes,
+            "success": success
+        }
+        self.log_data["action_repairs"].append(repair)
+        self.logger.info(f"Action repair: {'Success' if success else 'Failed'} - fixes={fixes}")
+        
+    def log_routing_decision(self, round_index: int, mode: str, reason: str, signals: Dict):
+        """记录操作模型路由决策"""
+        decision = {
+            "timestamp": datetime.now().isoformat(),
+            "round": round_index,
+            "mode": mode,
+            "reason": reason,
+            "signals": signals
+        }
+        self.log_data["routing_decisions"].append(decision)
+        self.logger.info(f"Routing: round {round_index} -> {mode} ({reason})")
+        
+    def log_reflection_gate(self, round_index: int, triggered: bool, reason: str, signals: Dict):
+        """记录反思门控的跳过/触发决策"""
+        decision = {
+            "timestamp": datetime.now().isoformat(),
+            "round": round_index,
+            "triggered": triggered,
+            "reason": reason,
+            "signals": signals
+        }
+        self.log_data["reflection_gates"].append(decision)
+        self.logger.info(f"Reflection gate: round {round_index} -> {'trigger' if triggered else 'skip'} ({reason})")
+        
+    def log_reflection_cache(self, subtask_description: str, status: str, age: Optional[float]):
+        """记录反思结论缓存的命中（hit）或相同画面的结论已过期（stale）"""
+        event = {
+            "timestamp": datetime.now().isoformat(),
+            "subtask": subtask_description,
+            "status": status,
+            "age": age
+        }
+        self.log_data["reflection_cache"].append(event)
+        self.logger.info(f"Reflection cache: {subtask_description} - {status} (age {age:.1f}s)")
+        
+    def log_plan_parse(self, source: str, success: bool, fixes: List[str], parse_time: float,
+                       error: Optional[str] = None):
+        """记录一次规划输出解析：是否成功、应用的修复和耗时"""
+        event = {
+            "timestamp": datetime.now().isoformat(),
+            "source": source,
+            "success": success,
+            "fixes": fixes,
+            "parse_time": parse_time,
+            "error": error
+        }
+        self.log_data["plan_parses"].append(event)
+        self.logger.info(f"Plan parse ({source}): {'Success' if success else 'Failed'} - fixes={fixes} "
+                         f"- {parse_time * 1000:.2f}ms")
+        
+    def log_plan_candidates(self, instruction: str, candidates: List[Dict]):
+        """记录任务分解的候选计划及本地打分（按得分排序，第一个为选用的计划）"""
+        event = {
+            "timestamp": datetime.now().isoformat(),
+            "instruction": instruction,
+            "candidates": candidates
+        }
+        self.log_data["plan_candidates"].append(event)
+        self.logger.info(f"Plan candidates: {instruction} - {len(candidates)} valid, "
+                         f"scores {[c['score'] for c in candidates]}")
+        
+    def log_plan_cache(self, instruction: str, key: str, status: str):
+        """记录计划缓存的命中（hit）、未命中（miss）和计划失效（invalidated）"""
+        event = {
+            "timestamp": datetime.now().isoformat(),
+            "instruction": instruction,
+            "key": key,
+            "status": status
+        }
+        self.log_data["plan_cache"].append(event)
+        self.logger.info(f"Plan cache: {instruction} - {status}")
+        
+    def log_reflection_cascade(self, subtask_description: str, confidence: Any, escalation_reason: Optional[str],
+                               small_time: float, large_time: Optional[float], disagreed: bool):
+        """记录一次反思级联：小模型置信度、是否升级到大模型、各级耗时以及两级结论是否不一致"""
+        cascade = {
+            "timestamp": datetime.now().isoformat(),
+            "subtask": subtask_description,
+            "confidence": confidence,
+            "escalated": escalation_reason is not None,
+            "escalation_reason": escalation_reason,
+            "small_time": small_time,
+            "large_time": large_time,
+            "disagreed": disagreed
+        }
+        self.log_data["reflection_cascade"].append(cascade)
+        self.logger.info(f"Reflection cascade: {subtask_description} - "
+                         f"{'escalated (' + escalation_reason + ')' if escalation_reason else 'small model only'}")
+        
+    def log_replay(self, subtask_description: str, hit: bool, recorded_steps: int = 0,
+                   verified_steps: int = 0, completed: bool = False, model_calls_saved: int = 0):
+        """记录轨迹回放缓存的查找和回放结果"""
+        replay = {
+            "timestamp": datetime.now().isoformat(),
+            "subtask": subtask_description,
+            "hit": hit,
+            "recorded_steps": recorded_steps,
+            "verified_steps": verified_steps,
+            "completed": completed,
+            "model_calls_saved": model_calls_saved
+        }
+        self.log_data["replays"].append(replay)
+        self.logger.info(f"Replay: {subtask_description} - {'hit' if hit else 'miss'} "
+                         f"{verified_steps}/{recorded_steps} steps - saved {model_calls_saved} model calls")
+        
+    def log_app_launch(self, subtask_description: str, app_name: str, package: Optional[str],
+                       foreground: Optional[str], success: bool, execution_time: float):
+        """记录通过包名直接启动应用的结果"""
+        launch = {
+            "timestamp": datetime.now().isoformat(),
+            "subtask": subtask_description,
+            "app_name": app_name,
+            "package": package,
+            "foreground": foreground,
+            "success": success,
+            "execution_time": execution_time
+        }
+        self.log_data["app_launches"].append(launch)
+        self.logger.info(f"App launch: {app_name} ({package}) - foreground={foreground} - "
+                         f"{execution_time:.2f}s - {'Success' if success else 'Failed'}")
+        
+    def log_budget_event(self, event: str, budget_summary: Dict):
+        """记录预算事件（等级变化、预算耗尽、最终用量）"""
+        budget_event = {
+            "timestamp": datetime.now().isoformat(),
+            "event": event,
+            "budget": budget_summary
+        }
+        self.log_data["budget_events"].append(budget_event)
+        self.logger.info(f"Budget event: {event} - tokens={budget_summary.get('used_tokens')} "
+                         f"calls={budget_summary.get('model_calls')} elapsed={budget_summary.get('elapsed_seconds')}s")
         
     def log_task_knowledge(self, task_knowledge: str):
         """记录任务知识"""
@@ -127,9 +291,30 @@ class TaskLogger:
         self.log_data["errors"].append(error)
         self.logger.error(f"Error ({error_type}): {error_message}")
         
+    def begin_subtask(self, subtask_description: str):
+        """标记子任务开始，之后执行的动作归属于该子任务"""
+        self._subtask_action_start = len(self.log_data["actions_executed"])
+        self._subtask_index += 1
+        self.logger.info(f"Subtask started: {subtask_description}")
+        
     def log_subtask_completion(self, subtask_id: int, subtask_description: str, 
                              completion_time: float, success: bool):
-        """记录子任务完成"""
+        """记录子任务完成，连同该子任务执行的动作序列"""
+        actions = self.log_data["actions_executed"][self._subtask_action_start:]
+        self.log_data["subtasks"].append({
+            "timestamp": datetime.now().isoformat(),
+            "subtask_id": subtask_id,
+            "description": subtask_description,
+            "completion_time": completion_time,
+            "success": success,
+            "actions": [{
+                "action_type": action["action_type"],
+                "action_inputs": action["action_inputs"],
+                "thought": action["thought"],
+                "success": action["success"]
+            } for action in actions]
+        })
+        self._subtask_action_start = len(self.log_data["actions_executed"])
         self.logger.info(f"Subtask {subtask_id} completed: {subtask_description} - {completion_time:.2f}s - {'Success' if success else 'Failed'}")
         
     def log_task_completion(self, final_status: str, completed_subtasks: List, failed_subtasks: List):
@@ -175,7 +360,8 @@ class TaskLogger:
                 "original_path": screenshot_path,
                 "description": description,
                 "timestamp": datetime.now().isoformat(),
-                "counter": self.screenshot_counter
+                "counter": self.screenshot_counter,
+                "subtask_index": self._subtask_index
             }
             self.screenshots.append(screenshot_info)
             
@@ -189,6 +375,10 @@ class TaskLogger:
         """获取所有保存的截图路径"""
         return [os.path.join(self.task_folder, s["filename"]) for s in self.screenshots]
     
+    def get_screenshot_records(self) -> List[Dict]:
+        """获取所有保存的截图记录（路径、描述、所属子任务），用于选择关键帧"""
+        return [dict(s, path=os.path.join(self.task_folder, s["filename"])) for s in self.screenshots]
+    
     def get_summary(self) -> Dict:
         """获取任务执行摘要"""
         total_model_calls = len(self.log_data["model_calls"])
@@ -196,6 +386,14 @@ class TaskLogger:
         total_reflections = len(self.log_data["reflections"])
         total_plan_regens = len(self.log_data["plan_regenerations"])
         total_errors = len(self.log_data["errors"])
+        total_repairs = len(self.log_data["action_repairs"])
+        repair_hits = sum(1 for r in self.log_data["action_repairs"] if r["success"])
+        sync_rounds = sum(1 for d in self.log_data["routing_decisions"] if d["mode"] == "sync")
+        replays = self.log_data["replays"]
+        replay_hits = sum(1 for r in replays if r["hit"])
+        cascades = self.log_data["reflection_cascade"]
+        escalations = sum(1 for c in cascades if c["escalated"])
+        parses = self.log_data["plan_parses"]
         
         # 计算各模型的总调用时间
         model_times = {}
@@ -213,8 +411,29 @@ class TaskLogger:
             "total_reflections": total_reflections,
             "total_plan_regenerations": total_plan_regens,
             "total_errors": total_errors,
+            "total_action_repairs": total_repairs,
+            "action_repair_hit_rate": repair_hits / total_repairs if total_repairs else 0.0,
             "model_execution_times": model_times,
+            "sync_mode_rounds": sync_rounds,
+            "simple_mode_rounds": len(self.log_data["routing_decisions"]) - sync_rounds,
+            "replay_lookups": len(replays),
+            "replay_hit_rate": replay_hits / len(replays) if replays else 0.0,
+            "replay_completed_subtasks": sum(1 for r in replays if r["completed"]),
+            "replay_model_calls_saved": sum(r["model_calls_saved"] for r in replays),
+            "fast_app_launches": sum(1 for l in self.log_data["app_launches"] if l["success"]),
+            "reflection_gate_triggers": sum(1 for g in self.log_data["reflection_gates"] if g["triggered"]),
+            "reflection_gate_skips": sum(1 for g in self.log_data["reflection_gates"] if not g["triggered"]),
+            "reflection_cache_hits": sum(1 for c in self.log_data["reflection_cache"] if c["status"] == "hit"),
+            "reflection_cascade_escalation_rate": escalations / len(cascades) if cascades else 0.0,
+            "reflection_cascade_disagreements": sum(1 for c in cascades if c["disagreed"]),
+            "plan_repairs": sum(1 for p in self.log_data["plan_regenerations"] if p.get("mode") == "repair"),
+            "plan_parse_failure_rate": (sum(1 for p in parses if not p["success"]) / len(parses)
+                                        if parses else 0.0),
+            "plan_parse_time": sum(p["parse_time"] for p in parses),
+            "plan_fallbacks": sum(1 for p in self.log_data["plan_regenerations"] if p.get("mode") == "fallback"),
+            "plan_cache_hits": sum(1 for c in self.log_data["plan_cache"] if c["status"] == "hit"),
             "final_status": self.log_data.get("final_status", "Unknown"),
             "total_screenshots": len(self.screenshots),
-            "task_folder": self.task_folder
+            "task_folder": self.task_folder,
+            "budget": self.log_data["budget_events"][-1]["budget"] if self.log_data["budget_events"] else None
         } 
\ No newline at end of file
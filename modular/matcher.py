@@ -0,0 +1,143 @@
+"""
+多模式字符串匹配模块
+"""
+
+import sys
+import itertools
+from array import array
+from collections import deque
+from typing import Dict, List, Iterable, Tuple
+
+# 转移表的键为 状态 * _ALPHABET + 字符码位，用一个扁平的整数字典代替每个状态一个字典，
+# 构建、查找和序列化都更快
+_ALPHABET = 0x110000
+# 导出的表名 -> 数组类型（按小端字节序保存）
+_TABLE_TYPES = {
+    "goto_keys": "q",
+    "goto_states": "i",
+    "fail": "i",
+    "output_states": "i",
+    "output_counts": "i",
+    "output_patterns": "i",
+}
+
+class AhoCorasick:
+    """Aho-Corasick多模式匹配自动机，一次扫描文本找出所有模式的出现位置"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = []
+        self._goto = {}       # 状态 * _ALPHABET + 字符码位 -> 下一状态
+        self._fail = [0]      # 状态 -> 失配时跳转的状态
+        self._output = {}     # 状态 -> 在该状态结束的模式编号（含失配链上的模式），没有输出的状态不记录
+        children = [[]]       # 构建期间使用：状态 -> [(字符码位, 子状态)]
+        for pattern in dict.fromkeys(patterns):
+            if pattern:
+                self._add(pattern, children)
+        self._build_fail_links(children)
+
+    def _add(self, pattern: str, children: List[List[Tuple[int, int]]]):
+        """把一个模式加入字典树"""
+        state = 0
+        for ch in pattern:
+            code = ord(ch)
+            next_state = self._goto.get(state * _ALPHABET + code)
+            if next_state is None:
+                next_state = len(self._fail)
+                self._goto[state * _ALPHABET + code] = next_state
+                self._fail.append(0)
+                children.append([])
+                children[state].append((code, next_state))
+            state = next_state
+        self._output[state] = (len(self.patterns),)
+        self.patterns.append(pattern)
+
+    def _build_fail_links(self, children: List[List[Tuple[int, int]]]):
+        """按广度优先计算失配指针，并合并失配链上的输出"""
+        goto, fail, output = self._goto, self._fail, self._output
+        queue = deque(child for _, child in children[0])
+        while queue:
+            state = queue.popleft()
+            for code, next_state in children[state]:
+                queue.append(next_state)
+                f = fail[state]
+                while f and f * _ALPHABET + code not in goto:
+                    f = fail[f]
+                target = goto.get(f * _ALPHABET + code, 0)
+                fail[next_state] = target if target != next_state else 0
+                inherited = output.get(fail[next_state])
+                if inherited:
+                    output[next_state] = output.get(next_state, ()) + inherited
+
+    def export_tables(self) -> Dict[str, bytes]:
+        """导出转移表、失配指针和输出表（小端整数数组的字节串），不含模式本身"""
+        tables = {
+            "goto_keys": array("q", self._goto.keys()),
+            "goto_states": array("i", self._goto.values()),
+            "fail": array("i", self._fail),
+            "output_states": array("i", self._output.keys()),
+            "output_counts": array("i", map(len, self._output.values())),
+            "output_patterns": array("i", itertools.chain.from_iterable(self._output.values())),
+        }
+        if sys.byteorder == "big":
+            for table in tables.values():
+                table.byteswap()
+        return {name: table.tobytes() for name, table in tables.items()}
+
+    @classmethod
+    def from_tables(cls, patterns: List[str], tables: Dict[str, bytes]) -> "AhoCorasick":
+        """用 export_tables 导出的表重建自动机（patterns 须与导出时的模式顺序一致），表不合法时抛出ValueError"""
+        arrays = {}
+        for name, typecode in _TABLE_TYPES.items():
+            data = tables.get(name)
+            if not isinstance(data, bytes):
+                raise ValueError(f"缺少匹配表 {name}")
+            table = array(typecode)
+            table.frombytes(data)
+            if sys.byteorder == "big":
+                table.byteswap()
+            arrays[name] = table
+        goto_keys, goto_states, fail = arrays["goto_keys"], arrays["goto_states"], arrays["fail"]
+        counts, indices = arrays["output_counts"], arrays["output_patterns"]
+        states = len(fail)
+        if len(goto_keys) != len(goto_states) or len(arrays["output_states"]) != len(counts) \
+                or sum(counts) != len(indices) or (counts and min(counts) < 1):
+            raise ValueError("匹配表长度不一致")
+        for table, upper in ((goto_states, states), (fail, states), (arrays["output_states"], states),
+                             (indices, len(patterns))):
+            if table and (min(table) < 0 or max(table) >= upper):
+                raise ValueError("匹配表中的编号越界")
+
+        matcher = cls.__new__(cls)
+        matcher.patterns = list(patterns)
+        matcher._goto = dict(zip(goto_keys, goto_states))
+        matcher._fail = fail.tolist()
+        matcher._output = {}
+        position = 0
+        for state, count in zip(arrays["output_states"], counts):
+            matcher._output[state] = tuple(indices[position:position + count])
+            position += count
+        return matcher
+
+    def iter_matches(self, text: str) -> Iterable[Tuple[int, str]]:
+        """依次产出 (起始位置, 模式)，包括重叠的匹配"""
+        goto, fail, output, patterns = self._goto, self._fail, self._output, self.patterns
+        state = 0
+        for end, ch in enumerate(text, 1):
+            code = ord(ch)
+            while state and state * _ALPHABET + code not in goto:
+                state = fail[state]
+            state = goto.get(state * _ALPHABET + code, 0)
+            if state in output:
+                for index in output[state]:
+                    pattern = patterns[index]
+                    yield end - len(pattern), pattern
+
+    def find_all(self, text: str) -> Dict[str, int]:
+        """返回文本中出现的所有模式及其第一次出现的位置"""
+        found = {}
+        for start, pattern in self.iter_matches(text):
+            found.setdefault(pattern, start)
+        return found
+
+    def __len__(self) -> int:
+        return len(self.patterns)
@@ -2,16 +2,18 @@
 模型管理模块
 """
 
-from openai import OpenAI
-from typing import Dict, List, Any, Optional
+import threading
+from typing import Dict, List, Any, Optional, Iterator
 
 from .config import Config
+from .utils import lazy_singleton
 
 class ModelManager:
     """模型管理器"""
     
     def __init__(self):
         self.config = Config.get_model_config()
+        self._local = threading.local()  # 当前线程最近一次调用实际使用的模型名
         self._init_clients()
     
     def _init_clients(self):
@@ -39,24 +41,55 @@ class ModelManager:
             base_url=plan_cfg["base_url"]
         )
     
-    def call_main_model(self, messages: List[Dict[str, Any]], temperature: float = 0.0, model_type = "simple") -> str:
+    def get_model_name(self, model_key: str, budget=None) -> str:
+        """获取实际使用的模型名，预算紧张时反思/规划模型降级为格式模型"""
+        model_name = self.config[model_key]
+        if budget is not None and model_key in ("reflection_model", "plan_model"):
+            model_name = budget.select_model(model_name, self.config["format_model"])
+        return model_name
+
+    def _use_model(self, model_name: str) -> str:
+        """记录本次调用使用的模型名（按线程记录，并发调用互不影响）"""
+        self._local.model_name = model_name
+        return model_name
+
+    def _select_model(self, model_key: str, budget=None) -> str:
+        """选出本次调用使用的模型并记录"""
+        return self._use_model(self.get_model_name(model_key, budget))
+
+    def last_model_name(self, default: Optional[str] = None) -> Optional[str]:
+        """当前线程最近一次模型调用实际使用的模型名，用于写入日志"""
+        return getattr(self._local, "model_name", default)
+
+    def _charge_budget(self, response, budget, call_type: str):
+        """按响应中的usage记录预算消耗"""
+        if budget is None:
+            return
+        usage = getattr(response, "usage", None)
+        tokens = getattr(usage, "total_tokens", 0) if usage else 0
+        budget.charge(tokens=tokens, calls=1, call_type=call_type)
+
+    def call_main_model(self, messages: List[Dict[str, Any]], temperature: float = 0.0, model_type = "simple",
+                        budget=None) -> str:
         """调用主模型"""
         try:
             if model_type == "simple":
                 response = self.main_client.chat.completions.create(
-                    model=self.config["model_id"],
+                    model=self._use_model(self.config["model_id"]),
                     messages=messages,
                     temperature=temperature,
                     stream=False
                 )
+                self._charge_budget(response, budget, "ui_tars")
                 return response.choices[0].message.content
             elif model_type == "sync":
                 response = self.plan_client.chat.completions.create(
-                    model=self.config["plan_model"],
+                    model=self._select_model("plan_model", budget),
                     messages=messages,
                     # temperature=temperature,
                     # stream=False
                 )
+                self._charge_budget(response, budget, "ui_tars_sync_thought")
                 full_output = response.choices[0].message.content.strip()
                 print("GPT-5 原始输出:\n", full_output)
                 lines = full_output.splitlines()
@@ -73,12 +106,14 @@ class ModelManager:
                     prefix = action_line.split("(")[0] + "("
                     skeleton = f"{thought_line}\n{prefix}"
                     print("保留骨架:\n", skeleton)
+                    self._use_model(f"{self.last_model_name()}+{self.config['model_id']}")
                     response = self.main_client.chat.completions.create(
                         model=self.config["model_id"],
                         messages=messages+[{"role": "assistant", "content": skeleton}],
                         temperature=temperature,
                         stream=False
                     )
+                    self._charge_budget(response, budget, "ui_tars")
                     coords = response.choices[0].message.content.strip()
                     print("coords:\n", coords)  # 例如 "345,678)"
                     final_action = f"{skeleton}{coords}"
@@ -89,37 +124,76 @@ class ModelManager:
             print(f"Main model call failed: {e}")
             raise
     
-    def call_format_model(self, messages: List[Dict[str, Any]]) -> str:
+    def call_format_model(self, messages: List[Dict[str, Any]], budget=None) -> str:
         """调用格式更正模型"""
         try:
             response = self.format_client.chat.completions.create(
-                model=self.config["format_model"],
+                model=self._select_model("format_model", budget),
                 messages=messages
             )
+            self._charge_budget(response, budget, "format")
             return response.choices[0].message.content
         except Exception as e:
             print(f"Format model call failed: {e}")
             raise
     
-    def call_reflection_model(self, messages: List[Dict[str, Any]]) -> str:
+    def call_reflection_model(self, messages: List[Dict[str, Any]], budget=None) -> str:
         """调用反思模型"""
         try:
             response = self.reflection_client.chat.completions.create(
-                model=self.config["reflection_model"],
+                model=self._select_model("reflection_model", budget),
                 messages=messages
             )
+            self._charge_budget(response, budget, "reflection")
             return response.choices[0].message.content
         except Exception as e:
             print(f"Reflection model call failed: {e}")
             raise
     
-    def call_plan_model(self, messages: List[Dict[str, Any]]) -> str:
+    def stream_reflection_model(self, messages: List[Dict[str, Any]], budget=None) -> Iterator[str]:
+        """流式调用反思模型，逐段返回输出文本"""
+        charged = False
+        try:
+            stream = self.reflection_client.chat.completions.create(
+                model=self._select_model("reflection_model", budget),
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    self._charge_budget(chunk, budget, "reflection")
+                    charged = True
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            print(f"Reflection model stream failed: {e}")
+            raise
+        finally:
+            if not charged and budget is not None:
+                budget.charge(tokens=0, calls=1, call_type="reflection")
+    
+    def call_small_reflection_model(self, messages: List[Dict[str, Any]], budget=None) -> str:
+        """用格式模型做反思（反思级联的第一级）"""
+        try:
+            response = self.format_client.chat.completions.create(
+                model=self._select_model("format_model", budget),
+                messages=messages
+            )
+            self._charge_budget(response, budget, "reflection_small")
+            return response.choices[0].message.content
+        except Exception as e:
+            print(f"Small reflection model call failed: {e}")
+            raise
+    
+    def call_plan_model(self, messages: List[Dict[str, Any]], budget=None) -> str:
         """调用规划模型"""
         try:
             response = self.plan_client.chat.completions.create(
-                model=self.config["plan_model"],
+                model=self._select_model("plan_model", budget),
                 messages=messages
             )
+            self._charge_budget(response, budget, "plan")
             return response.choices[0].message.content
         except Exception as e:
             print(f"Plan model call failed: {e}")
@@ -129,5 +203,12 @@ class ModelManager:
         """获取模型配置"""
         return self.config
 
-# 全局模型管理器实例
-model_manager = ModelManager() 
+# 全局模型管理器（惰性创建，避免导入时初始化OpenAI客户端）
+get_model_manager = lazy_singleton(ModelManager)
+
+def __getattr__(name):
+    """兼容 `from .models import model_manager` 的旧用法，首次访问时才创建实例"""
+    if name == "model_manager":
+        return get_model_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
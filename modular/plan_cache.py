@@ -0,0 +1,137 @@
+"""
+计划缓存模块
+
+按 (规范化的任务指令, 知识库版本, 起始画面类别) 缓存任务分解得到的子任务列表。起始画面类别为
+前台应用的包名（探测失败时为空），同一类别下再用起始画面的感知哈希校验，画面相近时直接复用计划，
+否则调用规划模型。使用缓存的计划之后需要重新规划或任务失败时，该计划失效。
+缓存持久化到 Config.PLAN_CACHE_FILE。
+"""
+
+import os
+import copy
+import json
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from .config import Config
+from .utils import hash_distance, lazy_singleton
+
+def _normalize(instruction: str) -> str:
+    """任务指令的缓存键：去掉空白、常见标点并小写"""
+    return "".join(ch for ch in instruction.lower() if not ch.isspace() and ch not in "，。,.!！?？、")
+
+class PlanCache:
+    """计划缓存
+
+    结构: {"指令|知识库版本|画面类别": [{"screen_hash": 起始画面哈希, "subtasks": [...],
+                                       "hits": 复用次数, "created": ..., "last_used": ...}]}
+    """
+
+    def __init__(self, cache_file: str = None):
+        self.cache_file = cache_file if cache_file is not None else Config.PLAN_CACHE_FILE
+        self.entries = {}
+        self.stats = {"lookups": 0, "hits": 0, "stored": 0, "invalidated": 0}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """读取缓存文件"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            print(f"计划缓存加载失败: {e}")
+            self.entries = {}
+
+    def _save(self):
+        """原子地写回缓存文件，调用方持有锁"""
+        if not self.cache_file:
+            return
+        try:
+            tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_file)
+        except Exception as e:
+            print(f"计划缓存保存失败: {e}")
+
+    @staticmethod
+    def make_key(instruction: str, knowledge_version: str, screen_class: Optional[str]) -> str:
+        return f"{_normalize(instruction)}|{knowledge_version}|{screen_class or ''}"
+
+    def lookup(self, key: str, frame_hash: Optional[int]) -> Optional[List[Dict[str, Any]]]:
+        """起始画面与缓存的计划相近时返回子任务列表的副本"""
+        with self._lock:
+            self.stats["lookups"] += 1
+            best, best_distance = None, Config.PLAN_CACHE_SCREEN_DISTANCE + 1
+            for entry in self.entries.get(key, []):
+                distance = hash_distance(frame_hash, entry["screen_hash"])
+                if distance < best_distance:
+                    best, best_distance = entry, distance
+            if best is None:
+                return None
+            self.stats["hits"] += 1
+            best["hits"] += 1
+            best["last_used"] = datetime.now().isoformat()
+            self._save()
+            return copy.deepcopy(best["subtasks"])
+
+    def store(self, key: str, frame_hash: Optional[int], subtasks: List[Dict[str, Any]]):
+        """记录一次任务分解的结果，替换起始画面相近的旧计划"""
+        if frame_hash is None or not subtasks:
+            return
+        now = datetime.now().isoformat()
+        with self._lock:
+            entries = [e for e in self.entries.get(key, [])
+                       if hash_distance(frame_hash, e["screen_hash"]) > Config.PLAN_CACHE_SCREEN_DISTANCE]
+            entries.append({"screen_hash": frame_hash, "subtasks": copy.deepcopy(subtasks),
+                            "hits": 0, "created": now, "last_used": now})
+            self.entries[key] = entries[-Config.PLAN_CACHE_MAX_SCREENS_PER_KEY:]
+            self.stats["stored"] += 1
+            self._evict()
+            self._save()
+
+    def _evict(self):
+        """计划总数超过上限时淘汰最久未使用的计划，调用方持有锁"""
+        all_entries = [(e["last_used"], key, e) for key, es in self.entries.items() for e in es]
+        excess = len(all_entries) - Config.PLAN_CACHE_MAX_ENTRIES
+        if excess <= 0:
+            return
+        for _, key, entry in sorted(all_entries, key=lambda item: item[0])[:excess]:
+            self.entries[key].remove(entry)
+            if not self.entries[key]:
+                del self.entries[key]
+
+    def invalidate(self, key: str, frame_hash: Optional[int] = None) -> int:
+        """删除失败的计划：指定画面哈希时只删除该画面的计划，否则删除整个键；返回删除的数量"""
+        with self._lock:
+            entries = self.entries.get(key, [])
+            if frame_hash is None:
+                removed = entries
+            else:
+                removed = [e for e in entries
+                           if hash_distance(frame_hash, e["screen_hash"]) <= Config.PLAN_CACHE_SCREEN_DISTANCE]
+            if not removed:
+                return 0
+            remaining = [e for e in entries if e not in removed]
+            if remaining:
+                self.entries[key] = remaining
+            else:
+                self.entries.pop(key, None)
+            self.stats["invalidated"] += len(removed)
+            self._save()
+        return len(removed)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中率"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["plans"] = sum(len(e) for e in self.entries.values())
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+# 全局计划缓存（惰性创建）
+get_plan_cache = lazy_singleton(PlanCache)
@@ -0,0 +1,84 @@
+"""
+候选计划模块
+
+任务分解时可以并发请求多个不同思路的候选计划（Config.PLAN_CANDIDATES），在本地打分排序：
+- 知识路径覆盖：指令匹配到的知识库路径中，有多少步骤（应用/页面/功能名）出现在计划里
+- 历史结果：有成功录制轨迹（轨迹回放缓存）的子任务加分，本进程中失败过的子任务扣分
+- 子任务数：其他条件相同时子任务越少越好
+得分最高的计划用于执行，其余按得分保留为备选。子任务失败需要重新规划时，先尝试切换到仍然适用的备选计划，
+不需要再调用规划模型。
+"""
+
+from typing import Callable, Collection, Dict, List, Any, Optional
+
+# 每个候选计划附加到任务分解提示词后的思路提示，第一个候选使用原提示词
+VARIANT_HINTS = [
+    "",
+    "请严格按照任务相关知识中的操作路径逐步分解。",
+    "请优先考虑用搜索功能（应用内的搜索框或手机主页下方的搜索栏）直接定位目标。",
+    "请尽量合并可以连续完成的操作，用更少的子任务完成任务。",
+]
+
+KNOWLEDGE_WEIGHT = 1.0   # 知识路径覆盖率
+SUCCESS_WEIGHT = 0.5     # 有成功录制的子任务比例
+FAILURE_WEIGHT = 1.0     # 失败过的子任务比例
+LENGTH_WEIGHT = 0.02     # 每个子任务
+
+def normalize(text: str) -> str:
+    """子任务文本比较用：去掉空白并小写"""
+    return "".join(text.lower().split())
+
+def knowledge_steps(knowledge_manager, instruction: str) -> List[str]:
+    """指令匹配到的第一条知识路径中的步骤名（不含无名菜单）"""
+    for app_name, feature in knowledge_manager.match_features(instruction):
+        path = knowledge_manager.find_path(feature, app_name)
+        if path:
+            return [step["name"].replace("app", "").strip() if step.get("type") == "app" else step["name"]
+                    for step in path if step["name"]]
+    return []
+
+def _valid(plan: Any) -> bool:
+    return isinstance(plan, list) and bool(plan) and all(
+        isinstance(item, dict) and isinstance(item.get("description"), str) for item in plan)
+
+def score_plan(plan: List[Dict[str, Any]], steps: List[str], succeeded: Callable[[str], bool],
+               failed: Collection[str]) -> Dict[str, Any]:
+    """本地给候选计划打分，返回得分及各项指标"""
+    descriptions = [item["description"] for item in plan]
+    text = normalize("".join(descriptions))
+    coverage = sum(1 for step in steps if normalize(step) in text) / len(steps) if steps else 0.0
+    success_rate = sum(1 for d in descriptions if succeeded(d)) / len(descriptions)
+    failure_rate = sum(1 for d in descriptions if normalize(d) in failed) / len(descriptions)
+    score = (KNOWLEDGE_WEIGHT * coverage + SUCCESS_WEIGHT * success_rate
+             - FAILURE_WEIGHT * failure_rate - LENGTH_WEIGHT * len(descriptions))
+    return {"score": round(score, 4), "knowledge_coverage": coverage, "recorded_subtasks": success_rate,
+            "failed_subtasks": failure_rate, "subtask_count": len(descriptions)}
+
+def rank_plans(plans: List[Any], steps: List[str], succeeded: Callable[[str], bool],
+               failed: Collection[str]) -> List[Dict[str, Any]]:
+    """去掉无效和重复的候选计划，按得分从高到低排序；得分相同时保持请求顺序"""
+    ranked, seen = [], set()
+    for i, plan in enumerate(plans):
+        if not _valid(plan):
+            continue
+        signature = tuple(normalize(item["description"]) for item in plan)
+        if signature in seen:
+            continue
+        seen.add(signature)
+        ranked.append(dict(score_plan(plan, steps, succeeded, failed), candidate=i, subtasks=plan))
+    ranked.sort(key=lambda c: (-c["score"], c["candidate"]))
+    return ranked
+
+def fallback_remaining(plan: List[Dict[str, Any]], completed_subtasks: List[str],
+                       failed_subtask: str) -> Optional[List[Dict[str, Any]]]:
+    """备选计划在当前进度下剩余的子任务，不适用时返回None
+
+    备选计划的开头必须与已完成的子任务一致（没有已完成的子任务时总是满足），剩余部分不能包含失败的子任务。
+    """
+    completed = [normalize(d) for d in completed_subtasks]
+    if len(plan) <= len(completed) or [normalize(item["description"]) for item in plan[:len(completed)]] != completed:
+        return None
+    remaining = plan[len(completed):]
+    if any(normalize(item["description"]) == normalize(failed_subtask) for item in remaining):
+        return None
+    return [dict(item, subtask_id=i + 1) for i, item in enumerate(remaining)]
@@ -0,0 +1,228 @@
+"""
+规划输出解析模块
+
+规划模型的输出（子任务列表、计划编辑操作）先按严格JSON解析，失败时用确定性规则修复常见问题后再解析：
+代码块标记、列表前后的说明文字、末尾多余的逗号、单引号/中文引号字符串、字符串中未转义的双引号、
+结构中的中文逗号冒号、Python 的 True/False/None、未加引号的键名。不使用 eval。
+子任务列表解析后再做结构校验，每次解析的结果、应用的修复和耗时都会记录。
+"""
+
+import re
+import json
+import time
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+from .utils import lazy_singleton
+
+class PlanParseError(ValueError):
+    """规划输出解析失败"""
+
+_CODE_FENCE = re.compile(r"```[a-zA-Z]*")
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_HEX4 = re.compile(r"[0-9a-fA-F]{4}")
+# 字符串起始引号 -> 结束引号
+_QUOTES = {'"': '"', "'": "'", "“": "”", "‘": "’"}
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+_STRUCT_PUNCT = {"，": ",", "：": ":"}
+_LITERALS = {"true": "true", "false": "false", "null": "null",
+             "True": "true", "False": "false", "None": "null"}
+# 模型有时把子任务列表包在对象里返回
+_LIST_KEYS = ("subtasks", "plan", "tasks")
+
+def _read_string(text: str, i: int, close: str, fixes: List[str]) -> Tuple[int, Optional[str]]:
+    """从 i 开始读取字符串内容直到结束引号，返回 (结束引号之后的位置, 内容)；没有结束引号时内容为None
+
+    结束引号后面（忽略空白）紧跟结构字符或文本结束时才是字符串的结尾，否则视为内容中未转义的引号。
+    """
+    chars = []
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == "\\" and i + 1 < n:
+            nxt = text[i + 1]
+            if nxt == "u" and _HEX4.match(text, i + 2):
+                chars.append(chr(int(text[i + 2:i + 6], 16)))
+                i += 6
+            else:
+                chars.append(_ESCAPES.get(nxt, nxt))
+                i += 2
+            continue
+        if ch == close:
+            rest = text[i + 1:].lstrip()
+            if not rest or rest[0] in ",:]}，：":
+                return i + 1, "".join(chars)
+            fixes.append("unescaped_quote")
+        chars.append(ch)
+        i += 1
+    return n, None
+
+def _normalize_json(text: str, fixes: List[str]) -> Optional[str]:
+    """把第一个 [ 或 { 开始的JSON结构改写为严格JSON，结构不完整时返回None"""
+    match = re.search(r"[\[{]", text)
+    if match is None:
+        return None
+    if text[:match.start()].strip():
+        fixes.append("surrounding_text")
+    out = []
+    depth = 0
+    i = match.start()
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch in _QUOTES:
+            if ch == "'":
+                fixes.append("single_quotes")
+            elif ch != '"':
+                fixes.append("chinese_quotes")
+            i, value = _read_string(text, i + 1, _QUOTES[ch], fixes)
+            if value is None:
+                return None
+            out.append(json.dumps(value, ensure_ascii=False))
+            continue
+        if ch in "[{":
+            depth += 1
+        elif ch in "]}":
+            # 去掉右括号前多余的逗号
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ",":
+                del out[j]
+                fixes.append("trailing_comma")
+            depth -= 1
+            out.append(ch)
+            i += 1
+            if depth == 0:
+                break
+            continue
+        elif ch in _STRUCT_PUNCT:
+            fixes.append("cn_punct")
+            ch = _STRUCT_PUNCT[ch]
+        elif ch.isalpha() or ch == "_":
+            word = _WORD.match(text, i)
+            if word is None:
+                return None
+            word = word.group()
+            if word in _LITERALS:
+                if _LITERALS[word] != word:
+                    fixes.append("python_literal")
+                out.append(_LITERALS[word])
+            else:
+                fixes.append("unquoted_key")
+                out.append(json.dumps(word))
+            i += len(word)
+            continue
+        out.append(ch)
+        i += 1
+    if depth != 0:
+        return None
+    if text[i:].strip():
+        fixes.append("surrounding_text")
+    return "".join(out)
+
+def validate_subtasks(value: Any, fixes: List[str]) -> List[Dict[str, Any]]:
+    """校验子任务列表：非空列表，每项有非空的 description；subtask_id 不是从1开始的连续整数时重新编号"""
+    if isinstance(value, dict):
+        lists = [value[key] for key in _LIST_KEYS if isinstance(value.get(key), list)]
+        if len(lists) != 1:
+            raise PlanParseError(f"子任务列表不是列表格式: {type(value).__name__}")
+        value = lists[0]
+        fixes.append("wrapped_list")
+    if not isinstance(value, list) or not value:
+        raise PlanParseError("子任务列表为空或不是列表格式")
+    subtasks = []
+    for i, item in enumerate(value):
+        if isinstance(item, str):
+            item = {"description": item}
+            fixes.append("string_items")
+        if not isinstance(item, dict) or not isinstance(item.get("description"), str) \
+                or not item["description"].strip():
+            raise PlanParseError(f"第{i + 1}个子任务缺少 description")
+        subtasks.append(dict(item, description=item["description"].strip()))
+    if [item.get("subtask_id") for item in subtasks] != list(range(1, len(subtasks) + 1)):
+        subtasks = [dict(item, subtask_id=i + 1) for i, item in enumerate(subtasks)]
+        fixes.append("subtask_id")
+    return subtasks
+
+class PlanParser:
+    """规划输出解析器"""
+
+    def __init__(self):
+        self.stats = {"attempts": 0, "failures": 0, "repaired": 0, "parse_time": 0.0, "fixes": {}}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse(text: str) -> Tuple[Any, List[str]]:
+        """宽松解析模型输出中的JSON，返回 (解析结果, 应用的修复列表)；无法解析时抛出 PlanParseError"""
+        if not text or not text.strip():
+            raise PlanParseError("输出为空")
+        cleaned = _CODE_FENCE.sub("", text).strip()
+        try:
+            return json.loads(cleaned), []
+        except json.JSONDecodeError:
+            pass
+        fixes = []
+        normalized = _normalize_json(cleaned, fixes)
+        if normalized is None:
+            raise PlanParseError("没有找到完整的JSON列表或对象")
+        try:
+            return json.loads(normalized), sorted(set(fixes))
+        except json.JSONDecodeError as e:
+            raise PlanParseError(f"修复后仍无法解析: {e}")
+
+    def _parse_logged(self, text: str, source: str, validate, task_logger=None) -> Optional[Any]:
+        """解析并校验，记录结果和耗时；失败时返回None"""
+        start_time = time.perf_counter()
+        result, fixes, error = None, [], None
+        try:
+            value, fixes = self.parse(text)
+            result = validate(value, fixes)
+            fixes = sorted(set(fixes))
+        except PlanParseError as e:
+            error = str(e)
+        parse_time = time.perf_counter() - start_time
+        self.record(result is not None, fixes, parse_time)
+        if error:
+            print(f"规划输出解析失败（{source}）: {error}")
+        elif fixes:
+            print(f"规划输出已修复（{source}）: {fixes}")
+        if task_logger:
+            task_logger.log_plan_parse(source, result is not None, fixes, parse_time, error)
+        return result
+
+    def parse_subtasks(self, text: str, source: str = "plan", task_logger=None) -> Optional[List[Dict[str, Any]]]:
+        """解析子任务列表，失败时返回None"""
+        return self._parse_logged(text, source, validate_subtasks, task_logger)
+
+    def parse_edits(self, text: str, task_logger=None) -> Optional[List[Any]]:
+        """解析计划编辑操作列表（各项的合法性由 apply_plan_edits 检查），失败时返回None"""
+        def validate(value, fixes):
+            if not isinstance(value, list):
+                raise PlanParseError(f"编辑操作不是列表格式: {type(value).__name__}")
+            return value
+        return self._parse_logged(text, "plan_repair", validate, task_logger)
+
+    def record(self, success: bool, fixes: List[str], parse_time: float):
+        """记录一次解析结果"""
+        with self._lock:
+            self.stats["attempts"] += 1
+            self.stats["parse_time"] += parse_time
+            if not success:
+                self.stats["failures"] += 1
+            elif fixes:
+                self.stats["repaired"] += 1
+                for fix in fixes:
+                    self.stats["fixes"][fix] = self.stats["fixes"].get(fix, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """解析失败率、修复次数和平均耗时"""
+        with self._lock:
+            stats = dict(self.stats, fixes=dict(self.stats["fixes"]))
+        attempts = stats["attempts"]
+        stats["failure_rate"] = stats["failures"] / attempts if attempts else 0.0
+        stats["avg_parse_time"] = stats["parse_time"] / attempts if attempts else 0.0
+        return stats
+
+# 全局规划输出解析器（惰性创建）
+get_plan_parser = lazy_singleton(PlanParser)
@@ -0,0 +1,55 @@
+"""
+计划修补模块
+
+子任务失败后不再让规划模型重写整个剩余计划，而是只给出失败子任务附近的几个子任务（窗口），
+由模型返回对窗口的编辑操作，再应用到当前计划上：
+    {"op": "replace", "index": 1, "description": "新的子任务描述"}
+    {"op": "insert", "before": 1, "description": "插入的子任务描述"}
+    {"op": "drop", "index": 2}
+index / before 是子任务在窗口中的序号（从1开始，失败的子任务为1），before 为窗口长度+1 时插入到窗口末尾。
+"""
+
+from typing import Dict, List, Any, Optional
+
+EDIT_OPS = ("replace", "insert", "drop")
+
+def apply_plan_edits(remaining_plan: List[Dict[str, Any]], window_size: int,
+                     edits: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """把编辑操作应用到剩余计划的前 window_size 个子任务上，返回重新编号的剩余计划；编辑不合法时返回None"""
+    if not isinstance(edits, list):
+        return None
+    slots = [item["description"] for item in remaining_plan[:window_size]]
+    replaced = [None] * window_size
+    dropped = set()
+    inserts = [[] for _ in range(window_size + 1)]
+    for edit in edits:
+        if not isinstance(edit, dict) or edit.get("op") not in EDIT_OPS:
+            return None
+        op = edit["op"]
+        position = edit.get("before" if op == "insert" else "index")
+        if not isinstance(position, int) or isinstance(position, bool):
+            return None
+        description = edit.get("description")
+        if op != "drop" and (not isinstance(description, str) or not description.strip()):
+            return None
+        if op == "insert":
+            if not 1 <= position <= window_size + 1:
+                return None
+            inserts[position - 1].append(description.strip())
+            continue
+        if not 1 <= position <= window_size or position - 1 in dropped or replaced[position - 1] is not None:
+            return None  # 同一个子任务只能修改一次
+        if op == "drop":
+            dropped.add(position - 1)
+        else:
+            replaced[position - 1] = description.strip()
+
+    descriptions = []
+    for i in range(window_size + 1):
+        descriptions.extend(inserts[i])
+        if i < window_size and i not in dropped:
+            descriptions.append(replaced[i] or slots[i])
+    descriptions.extend(item["description"] for item in remaining_plan[window_size:])
+    if not descriptions:
+        return None
+    return [{"subtask_id": i + 1, "description": description} for i, description in enumerate(descriptions)]
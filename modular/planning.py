@@ -3,25 +3,46 @@
 """
 
 import base64
-import re
+import copy
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
 
-from .models import model_manager
-from .knowledge import knowledge_manager
+from .config import Config
+from .models import get_model_manager
+from .knowledge import get_knowledge_manager
+from .plan_cache import get_plan_cache
+from .plan_candidates import VARIANT_HINTS, fallback_remaining, knowledge_steps, normalize, rank_plans
+from .plan_parser import get_plan_parser
+from .plan_repair import apply_plan_edits
+from .replay import get_trajectory_cache
+from .utils import compute_image_hash, lazy_singleton
 
 class PlanningManager:
     """规划管理器"""
     
     def __init__(self):
-        self.model_manager = model_manager
-        self.knowledge_manager = knowledge_manager
+        # 任务指令 -> (计划缓存键, 起始画面哈希, 待验证的新计划)，新计划在任务成功后才写入缓存，
+        # 复用的缓存计划在任务失败或重新规划时失效
+        self._active_plans = {}
+        # 任务指令 -> 按得分排序的备选计划（Config.PLAN_CANDIDATES > 1 时）
+        self._fallback_plans = {}
+        # 本进程中失败过的子任务（规范化文本），候选计划打分时扣分
+        self._failed_subtasks = set()
     
-    def decompose_task_to_subtasks(self, user_instruction: str, task_logger=None) -> List[Dict[str, Any]]:
+    @property
+    def model_manager(self):
+        return get_model_manager()
+    
+    @property
+    def knowledge_manager(self):
+        return get_knowledge_manager()
+    
+    def decompose_task_to_subtasks(self, user_instruction: str, task_logger=None, budget=None) -> List[Dict[str, Any]]:
         """调用VLM将用户指令分解为子任务列表"""
         # 1. 获取当前界面截图
-        from .actions import action_executor
-        screenshot_path, size_x, size_y = action_executor.screenshot(task_logger=task_logger, description="Task decomposition")
+        from .actions import get_action_executor
+        screenshot_path, size_x, size_y = get_action_executor().screenshot(task_logger=task_logger, description="Task decomposition")
         if not screenshot_path:
             return []
         
@@ -36,11 +57,98 @@ class PlanningManager:
         if task_logger:
             task_logger.log_task_knowledge(task_knowledge)
         
-        return self._decompose_with_knowledge(user_instruction, task_knowledge, base64_img, task_logger)
+        self._fallback_plans.pop(user_instruction, None)
+        if not Config.PLAN_CACHE_ENABLED:
+            return self._decompose(user_instruction, task_knowledge, base64_img, task_logger, budget)
+        
+        # 相同指令、相同知识库版本、相近起始画面分解过时直接复用计划
+        plan_cache = get_plan_cache()
+        frame_hash = compute_image_hash(screenshot_path)
+        key = plan_cache.make_key(user_instruction, self.knowledge_manager.get_version(), self._screen_class())
+        self._active_plans[user_instruction] = (key, frame_hash, None)
+        subtasks = plan_cache.lookup(key, frame_hash)
+        if task_logger:
+            task_logger.log_plan_cache(user_instruction, key, "hit" if subtasks is not None else "miss")
+        if subtasks is not None:
+            print(f"计划缓存命中，复用 {len(subtasks)} 个子任务")
+            return subtasks
+        
+        subtasks = self._decompose(user_instruction, task_knowledge, base64_img, task_logger, budget)
+        if subtasks:
+            self._active_plans[user_instruction] = (key, frame_hash, subtasks)
+        return subtasks
+    
+    def _decompose(self, user_instruction: str, task_knowledge: str, base64_img: str,
+                   task_logger=None, budget=None) -> List[Dict[str, Any]]:
+        """分解任务；配置了多个候选计划时并发请求，本地打分后执行得分最高的计划，其余作为备选"""
+        if Config.PLAN_CANDIDATES <= 1:
+            return self._decompose_with_knowledge(user_instruction, task_knowledge, base64_img, task_logger, budget)
+        
+        hints = [VARIANT_HINTS[i % len(VARIANT_HINTS)] for i in range(Config.PLAN_CANDIDATES)]
+        with ThreadPoolExecutor(max_workers=len(hints)) as pool:
+            plans = list(pool.map(
+                lambda hint: self._decompose_with_knowledge(user_instruction, task_knowledge, base64_img,
+                                                            task_logger, budget, variant=hint), hints))
+        ranked = rank_plans(plans, knowledge_steps(self.knowledge_manager, user_instruction),
+                            get_trajectory_cache().has_recordings, self._failed_subtasks)
+        if task_logger:
+            task_logger.log_plan_candidates(user_instruction, ranked)
+        if not ranked:
+            return []
+        print(f"{len(plans)} 个候选计划中有 {len(ranked)} 个有效，"
+              f"选用第 {ranked[0]['candidate'] + 1} 个（得分 {ranked[0]['score']:.2f}）")
+        self._fallback_plans[user_instruction] = [candidate["subtasks"] for candidate in ranked[1:]]
+        return ranked[0]["subtasks"]
+    
+    def _switch_to_fallback(self, original_instruction: str, completed_subtasks: List[str], failed_subtask: str,
+                            old_plan: List[Dict[str, Any]], reason: str, task_logger=None) -> List[Dict[str, Any]]:
+        """切换到第一个仍然适用的备选计划，返回其剩余的子任务；没有适用的备选计划时返回空列表"""
+        fallbacks = self._fallback_plans.get(original_instruction, [])
+        for i, plan in enumerate(fallbacks):
+            new_subtasks = fallback_remaining(plan, completed_subtasks, failed_subtask)
+            if new_subtasks:
+                del fallbacks[:i + 1]
+                print(f"切换到备选计划，剩余 {len(new_subtasks)} 个子任务（还有 {len(fallbacks)} 个备选）")
+                if task_logger:
+                    task_logger.log_plan_regeneration(old_plan=old_plan, new_plan=new_subtasks, reason=reason,
+                                                      execution_time=0.0, mode="fallback")
+                return new_subtasks
+        return []
+    
+    @staticmethod
+    def _screen_class() -> Optional[str]:
+        """起始画面类别：前台应用包名，探测关闭或失败时为None"""
+        if not Config.FOREGROUND_PROBE_ENABLED:
+            return None
+        from .actions import get_action_executor
+        foreground = get_action_executor().get_foreground()
+        return foreground.get("package") if foreground else None
+    
+    def report_plan_outcome(self, user_instruction: str, success: bool, task_logger=None):
+        """任务结束时报告计划的执行结果：成功时写入新计划，失败时从缓存中删除复用的计划
+
+        没有报告结果的任务（停止或异常退出）不会写入缓存。
+        """
+        active = self._active_plans.pop(user_instruction, None)
+        if active is None:
+            return
+        key, frame_hash, pending = active
+        if success:
+            if pending is not None:
+                get_plan_cache().store(key, frame_hash, pending)
+            return
+        if pending is not None:
+            return
+        removed = get_plan_cache().invalidate(key, frame_hash)
+        if removed:
+            print(f"计划执行失败，已从计划缓存中删除 {removed} 个计划")
+            if task_logger:
+                task_logger.log_plan_cache(user_instruction, key, "invalidated")
     
     def _decompose_with_knowledge(self, user_instruction: str, task_knowledge: str, 
-                                base64_img: str, task_logger=None) -> List[Dict[str, Any]]:
-        """使用已知的task_knowledge进行任务分解"""
+                                base64_img: str, task_logger=None, budget=None,
+                                variant: str = "") -> List[Dict[str, Any]]:
+        """使用已知的task_knowledge进行任务分解，variant 为附加的分解思路提示"""
         messages = [
             {
                 "role": "system",
@@ -91,7 +199,7 @@ ui-tars-agent可以执行以下动作：
             {
                 "role": "user",
                 "content": [
-                    {"type": "text", "text": f"总体任务：{user_instruction}"},
+                    {"type": "text", "text": f"总体任务：{user_instruction}" + (f"\n{variant}" if variant else "")},
                     {"type": "image_url", "image_url": {"url": f"data:image/jpg;base64,{base64_img}"}}
                 ]
             }
@@ -100,14 +208,14 @@ ui-tars-agent可以执行以下动作：
         # 4. 调用VLM生成子任务列表
         try:
             decompose_start_time = time.time()
-            response_text = self.model_manager.call_plan_model(messages)
+            response_text = self.model_manager.call_plan_model(messages, budget=budget)
             decompose_execution_time = time.time() - decompose_start_time
             print(f"Plan Agent Response:\n{response_text}")
             
             # 记录任务分解模型调用
             if task_logger:
                 task_logger.log_model_call(
-                    model_name=self.model_manager.config["plan_model"],
+                    model_name=self.model_manager.last_model_name(),
                     call_type="plan",
                     input_data={"user_instruction": user_instruction, "messages_count": len(messages)},
                     output_data={"response_text": response_text},
@@ -115,23 +223,18 @@ ui-tars-agent可以执行以下动作：
                     success=True
                 )
             
-            # 5. 解析为Python列表（移除可能的格式符号）
-            response_text = re.sub(r"```json|```", "", response_text).strip()
-            subtasks = eval(response_text)  # 安全场景下可用json.loads，需确保输出严格为JSON
-            
-            # 确保返回的是列表格式
-            if isinstance(subtasks, list):
-                print(f"任务分解完成，生成 {len(subtasks)} 个子任务")
-                return subtasks
-            else:
-                print(f"任务分解结果不是列表格式: {type(subtasks)}")
+            # 5. 解析并校验子任务列表（修复常见格式问题）
+            subtasks = get_plan_parser().parse_subtasks(response_text, "plan", task_logger)
+            if subtasks is None:
                 return []
+            print(f"任务分解完成，生成 {len(subtasks)} 个子任务")
+            return subtasks
         
         except Exception as e:
             print(f"任务分解失败：{e}")
             if task_logger:
                 task_logger.log_model_call(
-                    model_name=self.model_manager.config["plan_model"],
+                    model_name=self.model_manager.last_model_name(),
                     call_type="plan",
                     input_data={"user_instruction": user_instruction, "messages_count": len(messages)},
                     output_data={},
@@ -144,8 +247,37 @@ ui-tars-agent可以执行以下动作：
     def regenerate_plan(self, original_instruction: str, reflection_data: Dict[str, Any], 
                        completed_subtasks: List[str], current_screenshot_path: str, 
                        failed_subtask: Optional[str] = None, task_logger=None, 
-                       task_knowledge: Optional[str] = None) -> List[Dict[str, Any]]:
-        """使用plan-agent根据反思结果重新生成计划"""
+                       task_knowledge: Optional[str] = None, budget=None,
+                       current_plan: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """使用plan-agent根据反思结果重新生成计划
+
+        有适用的备选计划时直接切换，不调用模型；否则提供当前计划且能定位失败的子任务时，
+        先只修补失败子任务附近的计划，修补失败再完整重新生成。
+        """
+        # 需要重新规划说明最初的计划行不通，不再复用（任务后续使用新计划，不再报告结果）
+        self.report_plan_outcome(original_instruction, False, task_logger)
+        if budget is not None and budget.is_exhausted():
+            print("预算已耗尽，跳过计划重新生成")
+            return []
+        
+        old_plan = self._remaining_plan(current_plan, failed_subtask)
+        if failed_subtask:
+            self._failed_subtasks.add(normalize(failed_subtask))
+            new_subtasks = self._switch_to_fallback(original_instruction, completed_subtasks, failed_subtask, old_plan,
+                                                    reflection_data.get('replanning_reason', 'Unknown'), task_logger)
+            if new_subtasks:
+                return new_subtasks
+        if Config.PLAN_REPAIR_ENABLED and old_plan:
+            new_subtasks = self._repair_plan(original_instruction, reflection_data, completed_subtasks, old_plan,
+                                             current_screenshot_path, task_logger, budget)
+            if new_subtasks:
+                return new_subtasks
+            if budget is not None and budget.is_exhausted():
+                print("预算已耗尽，跳过计划重新生成")
+                return []
+            print("计划修补失败，完整重新生成计划")
+        if not old_plan:
+            old_plan = copy.deepcopy(current_plan or [])
         try:
             # 编码当前截图
             with open(current_screenshot_path, "rb") as f:
@@ -233,14 +365,14 @@ ui-tars-agent可以执行以下动作：
             ]
             
             plan_start_time = time.time()
-            plan_result = self.model_manager.call_plan_model(messages)
+            plan_result = self.model_manager.call_plan_model(messages, budget=budget)
             plan_execution_time = time.time() - plan_start_time
             print(f"Plan regeneration result: {plan_result}")
             
             # 记录计划重新生成模型调用
             if task_logger:
                 task_logger.log_model_call(
-                    model_name=self.model_manager.config["plan_model"],
+                    model_name=self.model_manager.last_model_name(),
                     call_type="plan",
                     input_data={"original_instruction": original_instruction, "reflection_data": reflection_data, "completed_subtasks": completed_subtasks},
                     output_data={"plan_result": plan_result},
@@ -248,32 +380,130 @@ ui-tars-agent可以执行以下动作：
                     success=True
                 )
             
-            # 尝试解析计划结果
-            try:
-                plan_result = re.sub(r"```json|```", "", plan_result).strip()
-                new_subtasks = eval(plan_result)
-                
-                # 确保返回的是列表格式
-                if isinstance(new_subtasks, list):
-                    # 记录计划重新生成完成
-                    if task_logger:
-                        task_logger.log_plan_regeneration(
-                            old_plan=[],
-                            new_plan=new_subtasks,
-                            reason=reflection_data.get('replanning_reason', 'Unknown'),
-                            execution_time=plan_execution_time
-                        )
-                    return new_subtasks
-                else:
-                    print(f"Plan result is not a list: {type(new_subtasks)}")
-                    return []
-            except Exception as e:
-                print(f"Plan parsing failed: {e}")
+            # 解析并校验计划结果
+            new_subtasks = get_plan_parser().parse_subtasks(plan_result, "plan_regeneration", task_logger)
+            if new_subtasks is None:
                 return []
+            # 记录计划重新生成完成
+            if task_logger:
+                task_logger.log_plan_regeneration(
+                    old_plan=old_plan,
+                    new_plan=new_subtasks,
+                    reason=reflection_data.get('replanning_reason', 'Unknown'),
+                    execution_time=plan_execution_time
+                )
+            return new_subtasks
                 
         except Exception as e:
             print(f"Plan regeneration failed: {e}")
             return []
 
-# 全局规划管理器实例
-planning_manager = PlanningManager() 
\ No newline at end of file
+    
+    @staticmethod
+    def _remaining_plan(current_plan: Optional[List[Dict[str, Any]]],
+                        failed_subtask: Optional[str]) -> List[Dict[str, Any]]:
+        """当前计划中从失败的子任务开始的部分，找不到失败的子任务时为空"""
+        if not current_plan or not failed_subtask:
+            return []
+        for i, item in enumerate(current_plan):
+            if item.get("description") == failed_subtask:
+                return copy.deepcopy(current_plan[i:])
+        return []
+    
+    def _repair_plan(self, original_instruction: str, reflection_data: Dict[str, Any],
+                     completed_subtasks: List[str], old_plan: List[Dict[str, Any]],
+                     current_screenshot_path: str, task_logger=None, budget=None) -> List[Dict[str, Any]]:
+        """让规划模型只返回对失败子任务附近计划的编辑操作，应用到剩余计划上；失败时返回空列表"""
+        window = old_plan[:1 + Config.PLAN_REPAIR_WINDOW]
+        window_text = "\n".join(
+            f"[{i + 1}] {item['description']}" + ("（失败）" if i == 0 else "") for i, item in enumerate(window))
+        rest = len(old_plan) - len(window)
+        # 只提供窗口内子任务相关的知识
+        window_knowledge = self.knowledge_manager.get_task_knowledge("；".join(item["description"] for item in window))
+        
+        repair_prompt = f"""你是GUI-Agent领域的任务规划专家。ui-tars-agent执行下面计划中标记为失败的子任务时出现问题，请根据当前界面截图和反思结果修补计划。
+
+## 总体任务
+{original_instruction}
+
+## 上一个已完成的子任务
+{completed_subtasks[-1] if completed_subtasks else "无"}
+
+## 可修改的子任务（序号从失败的子任务开始）
+{window_text}
+{f"（之后还有 {rest} 个子任务，保持不变）" if rest > 0 else ""}
+
+## 相关知识
+{window_knowledge}
+
+## 反思结果
+{reflection_data.get('reflection_summary', '')}
+当前问题: {', '.join(reflection_data.get('current_issues', []))}
+建议: {', '.join(reflection_data.get('suggestions', []))}
+重新规划原因: {reflection_data.get('replanning_reason', '未知')}
+
+只返回对上面子任务的编辑操作列表（JSON），不要重写整个计划：
+- {{"op": "replace", "index": 序号, "description": "新的子任务描述"}} 改写一个子任务
+- {{"op": "insert", "before": 序号, "description": "子任务描述"}} 在该序号的子任务之前插入（序号为{len(window) + 1}时插入到末尾）
+- {{"op": "drop", "index": 序号}} 删除一个子任务
+序号均指上面列出的原序号，每个子任务最多修改一次。子任务描述要包含应用名等限定信息，只使用点击、输入、拖拽、长按、Home键、返回键这些动作。
+直接返回列表，不要额外文字，例如：
+[{{"op": "insert", "before": 1, "description": "在微信中点击返回键回到聊天列表"}}]
+"""
+        try:
+            with open(current_screenshot_path, "rb") as f:
+                base64_img = base64.b64encode(f.read()).decode('utf-8')
+            messages = [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": repair_prompt},
+                        {"type": "image_url", "image_url": {"url": f"data:image/jpg;base64,{base64_img}"}}
+                    ]
+                }
+            ]
+            repair_start_time = time.time()
+            repair_result = self.model_manager.call_plan_model(messages, budget=budget)
+            repair_execution_time = time.time() - repair_start_time
+            print(f"Plan repair result: {repair_result}")
+            if task_logger:
+                task_logger.log_model_call(
+                    model_name=self.model_manager.last_model_name(),
+                    call_type="plan_repair",
+                    input_data={"original_instruction": original_instruction, "window": window,
+                                "prompt_chars": len(repair_prompt)},
+                    output_data={"repair_result": repair_result},
+                    execution_time=repair_execution_time,
+                    success=True
+                )
+        except Exception as e:
+            print(f"Plan repair failed: {e}")
+            return []
+        
+        edits = get_plan_parser().parse_edits(repair_result, task_logger)
+        if edits is None:
+            return []
+        new_subtasks = apply_plan_edits(old_plan, len(window), edits)
+        if new_subtasks is None:
+            print(f"计划编辑不合法: {edits}")
+            return []
+        print(f"计划修补完成: {len(edits)} 处编辑，剩余 {len(new_subtasks)} 个子任务")
+        if task_logger:
+            task_logger.log_plan_regeneration(
+                old_plan=old_plan,
+                new_plan=new_subtasks,
+                reason=reflection_data.get('replanning_reason', 'Unknown'),
+                execution_time=repair_execution_time,
+                mode="repair",
+                edits=edits
+            )
+        return new_subtasks
+
+# 全局规划管理器（惰性创建）
+get_planning_manager = lazy_singleton(PlanningManager)
+
+def __getattr__(name):
+    """兼容 `from .planning import planning_manager` 的旧用法，首次访问时才创建实例"""
+    if name == "planning_manager":
+        return get_planning_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
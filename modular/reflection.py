@@ -2,19 +2,41 @@
 反思模块
 """
 
-import base64
+import os
 import json
 import time
-from typing import Dict, List, Any, Optional
+import threading
+from typing import Dict, List, Any, Optional, Tuple
 
-from .models import model_manager
-from .utils import calculate_image_similarity
+from .config import Config
+from .models import get_model_manager
+from .keyframes import select_keyframes
+from .contact_sheet import screenshot_parts, parts_bytes, decode_image_part, image_part
+from .reflection_cache import get_reflection_cache, HIT, MISS
+from .streaming import StreamingReply
+from .utils import calculate_image_similarity, compute_image_hash, lazy_singleton
+
+# 级联第一级要求小模型额外给出的置信度
+CONFIDENCE_INSTRUCTION = """
+另外请在JSON中加入 "confidence" 字段：0到1之间的数字，表示你对 subtask_completed 和 need_replanning 判断的把握程度。
+"""
 
 class ReflectionManager:
     """反思管理器"""
     
     def __init__(self):
-        self.model_manager = model_manager
+        self.cascade_stats = {"reflections": 0, "escalations": 0, "disagreements": 0,
+                              "small_time": 0.0, "large_time": 0.0}
+        self._lock = threading.Lock()
+        self._pending_replies = []  # 结论已提前返回、仍在后台接收的流式反思
+    
+    @property
+    def model_manager(self):
+        return get_model_manager()
+    
+    @property
+    def reflection_cache(self):
+        return get_reflection_cache()
     
     def summarize_execution_history(self, messages: List[Dict[str, Any]]) -> str:
         """总结ui-tars的执行历史，提取关键信息"""
@@ -37,17 +59,218 @@ class ReflectionManager:
         
         return "\n".join(summary)
     
+    @staticmethod
+    def _extract_history_screenshots(messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[bytes]]:
+        """取出历史消息中的截图，消息中的图片替换为序号文本；返回 (新的消息列表, 截图字节)"""
+        compacted, images = [], []
+        for msg in messages:
+            if msg["role"] != "user" or not isinstance(msg["content"], list):
+                compacted.append(msg)
+                continue
+            content = []
+            for part in msg["content"]:
+                data = decode_image_part(part) if part.get("type") == "image_url" else None
+                if data is None:
+                    content.append(part)
+                else:
+                    images.append(data)
+                    content.append({"type": "text", "text": f"[历史截图{len(images)}，见缩略图拼图]"})
+            compacted.append({**msg, "content": content})
+        return compacted, images
+    
+    def _parse_reflection_result(self, reflection_result: str) -> Dict[str, Any]:
+        """解析反思模型返回的JSON并补全字段，无法解析时抛出 json.JSONDecodeError"""
+        # 清理可能的markdown格式
+        cleaned_result = reflection_result.strip()
+        if cleaned_result.startswith("```json"):
+            cleaned_result = cleaned_result[7:]
+        if cleaned_result.endswith("```"):
+            cleaned_result = cleaned_result[:-3]
+        cleaned_result = cleaned_result.strip()
+        
+        print(f"Attempting to parse JSON: {cleaned_result[:200]}...")
+        return self._fill_reflection_fields(json.loads(cleaned_result))
+    
+    @staticmethod
+    def _fill_reflection_fields(reflection_data: Dict[str, Any]) -> Dict[str, Any]:
+        """补全反思结论中缺失或类型不对的字段"""
+        # 确保所有必需字段都存在
+        required_fields = {
+            "subtask_completed": False,
+            "action_summary": "",
+            "current_issues": [],
+            "suggestions": [],
+            "reflection_summary": "",
+            "need_replanning": False,
+            "replanning_reason": ""
+        }
+        
+        # 补充缺失的字段
+        for field, default_value in required_fields.items():
+            if field not in reflection_data:
+                reflection_data[field] = default_value
+            elif field == "current_issues" and not isinstance(reflection_data[field], list):
+                if isinstance(reflection_data[field], str):
+                    reflection_data[field] = [reflection_data[field]]
+                else:
+                    reflection_data[field] = []
+            elif field == "suggestions" and not isinstance(reflection_data[field], list):
+                if isinstance(reflection_data[field], str):
+                    reflection_data[field] = [reflection_data[field]]
+                else:
+                    reflection_data[field] = []
+            elif field == "action_summary" and not isinstance(reflection_data[field], str):
+                reflection_data[field] = str(reflection_data[field]) if reflection_data[field] is not None else ""
+        return reflection_data
+    
+    @staticmethod
+    def _verdict_ready(fields: Dict[str, Any]) -> bool:
+        """流式输出中已经可以据此行动的结论：子任务已完成，或者既未完成也不需要重新规划且建议已给出
+        
+        需要重新规划时 regenerate_plan 要用到完整的问题和总结，等待输出结束。
+        """
+        if fields.get("subtask_completed") is True:
+            return True
+        return fields.get("subtask_completed") is False and fields.get("need_replanning") is False \
+            and "suggestions" in fields
+    
+    def _use_cascade(self, budget=None) -> bool:
+        """是否使用反思级联；预算紧张时反思模型已经降级为小模型，不再级联"""
+        if not Config.REFLECTION_CASCADE_ENABLED:
+            return False
+        return self.model_manager.get_model_name("reflection_model", budget) != \
+            self.model_manager.get_model_name("format_model", budget)
+    
+    @staticmethod
+    def _last_history_image(messages: Optional[List[Dict[str, Any]]]) -> Optional[bytes]:
+        """历史消息中最后一张截图（即上一步动作前的画面），没有时返回None"""
+        for msg in reversed(messages or []):
+            if msg["role"] != "user" or not isinstance(msg["content"], list):
+                continue
+            for part in reversed(msg["content"]):
+                data = decode_image_part(part) if part.get("type") == "image_url" else None
+                if data is not None:
+                    return data
+        return None
+    
+    def _reflect_with_small_model(self, reflection_prompt: str, current_image: bytes,
+                                  previous_image: Optional[bytes] = None,
+                                  budget=None, task_logger=None) -> Tuple[Optional[Dict[str, Any]], float]:
+        """级联第一级：小模型看上一张历史截图和当前截图给出带置信度的结论，返回 (结论或None, 耗时)"""
+        images = [image_part(current_image)]
+        if previous_image is not None:
+            images = [{"type": "text", "text": "第一张图片为上一步动作前的界面截图，第二张图片为当前界面截图。"},
+                      image_part(previous_image)] + images
+        small_messages = [
+            {
+                "role": "system",
+                "content": "你是一个任务执行反思专家，负责分析当前子任务的执行过程并提供改进建议。"
+            },
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": reflection_prompt + CONFIDENCE_INSTRUCTION},
+                    *images
+                ]
+            }
+        ]
+        start_time = time.time()
+        try:
+            result = self.model_manager.call_small_reflection_model(small_messages, budget=budget)
+        except Exception as e:
+            print(f"小模型反思失败: {e}")
+            return None, time.time() - start_time
+        execution_time = time.time() - start_time
+        print(f"Small reflection result: {result}")
+        if task_logger:
+            task_logger.log_model_call(
+                model_name=self.model_manager.last_model_name(),
+                call_type="reflection_small",
+                input_data={"messages_count": len(small_messages)},
+                output_data={"reflection_result": result},
+                execution_time=execution_time,
+                success=True
+            )
+        try:
+            return self._parse_reflection_result(result), execution_time
+        except json.JSONDecodeError as e:
+            print(f"小模型反思结果解析失败: {e}")
+            return None, execution_time
+    
+    @staticmethod
+    def _escalation_reason(verdict: Optional[Dict[str, Any]]) -> Optional[str]:
+        """小模型的结论需要升级到大模型时返回原因"""
+        if verdict is None:
+            return "小模型结果无法解析"
+        if verdict.get("need_replanning"):
+            return "小模型建议重新规划"
+        try:
+            confidence = float(verdict.get("confidence"))
+        except (TypeError, ValueError):
+            return "小模型未给出置信度"
+        if confidence < Config.REFLECTION_CASCADE_MIN_CONFIDENCE:
+            return f"小模型置信度{confidence:.2f}过低"
+        return None
+    
+    def _record_cascade(self, subtask: str, small_verdict: Optional[Dict[str, Any]], small_time: float,
+                        escalate_reason: Optional[str], large_verdict: Optional[Dict[str, Any]] = None,
+                        large_time: Optional[float] = None, task_logger=None):
+        """累计级联统计并写入任务日志"""
+        disagreed = small_verdict is not None and large_verdict is not None and any(
+            bool(small_verdict.get(k)) != bool(large_verdict.get(k)) for k in ("subtask_completed", "need_replanning"))
+        with self._lock:
+            stats = self.cascade_stats
+            stats["reflections"] += 1
+            stats["small_time"] += small_time
+            if escalate_reason:
+                stats["escalations"] += 1
+                stats["large_time"] += large_time or 0.0
+                stats["disagreements"] += int(disagreed)
+        confidence = small_verdict.get("confidence") if small_verdict else None
+        print(f"反思级联: 小模型{small_time:.1f}s，置信度{confidence}，"
+              + (f"升级到大模型（{escalate_reason}），{'结论不一致' if disagreed else '结论一致'}" if escalate_reason else "未升级"))
+        if task_logger:
+            task_logger.log_reflection_cascade(subtask, confidence, escalate_reason, small_time, large_time, disagreed)
+    
+    def join_pending(self, timeout: Optional[float] = None):
+        """等待后台接收中的流式反思写完日志，保存任务日志前调用"""
+        if timeout is None:
+            timeout = Config.REFLECTION_STREAM_JOIN_TIMEOUT
+        with self._lock:
+            replies, self._pending_replies = self._pending_replies, []
+        deadline = time.time() + timeout
+        for reply in replies:
+            if not reply.join(max(0.0, deadline - time.time())):
+                print(f"流式反思在{timeout}秒内未接收完，不再等待")
+    
+    def get_cascade_stats(self) -> Dict[str, Any]:
+        """各级平均延迟、升级率和大小模型结论不一致率"""
+        with self._lock:
+            stats = dict(self.cascade_stats)
+        reflections, escalations = stats["reflections"], stats["escalations"]
+        stats["small_mean_latency"] = stats["small_time"] / reflections if reflections else None
+        stats["large_mean_latency"] = stats["large_time"] / escalations if escalations else None
+        stats["escalation_rate"] = escalations / reflections if reflections else 0.0
+        stats["disagreement_rate"] = stats["disagreements"] / escalations if escalations else 0.0
+        return stats
+    
     def reflect_on_execution(self, original_instruction: str, current_subtask: str, 
                            messages: List[Dict[str, Any]], current_screenshot_path: str,
                            action_history: Optional[List[Dict[str, Any]]] = None,
                            completed_subtasks: Optional[List[str]] = None,
                            all_subtasks: Optional[List[Dict[str, Any]]] = None,
-                           task_logger=None) -> Dict[str, Any]:
+                           task_logger=None, budget=None) -> Dict[str, Any]:
         """对当前子任务的执行过程进行反思"""
         try:
-            # 编码当前截图
-            with open(current_screenshot_path, "rb") as f:
-                base64_img = base64.b64encode(f.read()).decode('utf-8')
+            # 相同子任务在相同画面上刚反思过时直接复用结论
+            frame_hash = compute_image_hash(current_screenshot_path)
+            cache_status, cached_verdict, cache_age = self.reflection_cache.lookup(
+                current_subtask, completed_subtasks, frame_hash)
+            if task_logger and cache_status != MISS:
+                task_logger.log_reflection_cache(current_subtask, cache_status, cache_age)
+            if cache_status == HIT:
+                print(f"相同画面在{cache_age:.0f}秒前已反思过，复用反思结论")
+                return cached_verdict
             
             # 总结执行历史
             execution_summary = self.summarize_execution_history(messages)
@@ -121,18 +344,34 @@ class ReflectionManager:
 2. **是否偏离或超出了原计划**：ui-tars-agent可能做出不符合当前子任务的动作，或者已经顺势完成了后续的一些子任务，则需要重新进行规划以便可以衔接到当前的状态。
 3. **计划合理性**: 如果觉得后续子任务的计划不合理，请重新规划。
 
-请以JSON格式返回：
+请以JSON格式返回，并按以下顺序输出字段（先给出结论，再给出分析）：
 {{
     "subtask_completed": true/false,
-    "action_summary": "动作总结",
-    "current_issues": ["问题1", "问题2"],
-    "suggestions": ["建议1", "建议2"],
-    "reflection_summary": "反思总结",
     "need_replanning": true/false,
-    "replanning_reason": "重新规划的原因"
+    "suggestions": ["建议1", "建议2"],
+    "replanning_reason": "重新规划的原因",
+    "current_issues": ["问题1", "问题2"],
+    "action_summary": "动作总结",
+    "reflection_summary": "反思总结"
 }}
 """
             
+            with open(current_screenshot_path, "rb") as f:
+                current_image = f.read()
+            
+            # 反思级联：先由小模型看上一张历史截图和当前截图给出带置信度的结论，置信度低或建议重新规划时才升级到大模型
+            cascade = self._use_cascade(budget)
+            if cascade:
+                small_verdict, small_time = self._reflect_with_small_model(
+                    reflection_prompt, current_image, self._last_history_image(messages), budget, task_logger)
+                escalate_reason = self._escalation_reason(small_verdict)
+                if escalate_reason is None:
+                    self._record_cascade(current_subtask, small_verdict, small_time, None, task_logger=task_logger)
+                    if task_logger:
+                        task_logger.log_reflection(small_verdict, small_time)
+                    self.reflection_cache.store(current_subtask, completed_subtasks, frame_hash, small_verdict)
+                    return small_verdict
+            
             # 构建包含完整message历史的对话
             reflection_messages = [
                 {
@@ -142,97 +381,99 @@ class ReflectionManager:
             ]
             
             # 添加ui-tars的完整message历史（限制长度避免token过多）
-            if messages:
-                recent_messages = messages[-6:] if len(messages) > 6 else messages
-                for msg in recent_messages:
-                    reflection_messages.append(msg)
+            recent_messages = list(messages or [])[-6:]
+            history_images = []
+            if Config.REFLECTION_CONTACT_SHEET:
+                # 拼图模式：历史消息中的截图换成序号，统一拼成缩略图放在最后一条消息中
+                recent_messages, history_images = self._extract_history_screenshots(recent_messages)
+            reflection_messages.extend(recent_messages)
             
             # 添加当前截图和反思提示
-            reflection_messages.append({
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": reflection_prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpg;base64,{base64_img}"}}
-                ]
-            })
+            image_parts, used_sheet = screenshot_parts(history_images, current_image)
+            if not used_sheet and history_images:
+                # 拼图失败，恢复原始的历史消息
+                reflection_messages = reflection_messages[:1] + list(messages or [])[-6:]
+                image_parts = [image_part(current_image)]
+            content = [{"type": "text", "text": reflection_prompt}]
+            if used_sheet:
+                content.append({"type": "text", "text": f"历史截图1-{len(history_images)}以缩略图拼图提供（左上角为序号），最后一张图片为当前界面截图原图。"})
+            reflection_messages.append({"role": "user", "content": content + image_parts})
             
-            reflection_start_time = time.time()
-            reflection_result = self.model_manager.call_reflection_model(reflection_messages)
-            reflection_execution_time = time.time() - reflection_start_time
-            print(f"Reflection result: {reflection_result}")
+            reply = None  # 流式接收时的 StreamingReply
             
-            # 记录反思模型调用
-            if task_logger:
-                task_logger.log_model_call(
-                    model_name=self.model_manager.config["reflection_model"],
-                    call_type="reflection",
-                    input_data={"original_instruction": original_instruction, "current_subtask": current_subtask, "messages_count": len(reflection_messages)},
-                    output_data={"reflection_result": reflection_result},
-                    execution_time=reflection_execution_time,
-                    success=True
-                )
+            def finish(reflection_result: str, reflection_execution_time: float) -> Dict[str, Any]:
+                """完整输出到达后记录模型调用、解析结论并写入缓存"""
+                print(f"Reflection result: {reflection_result}")
             
-            # 尝试解析JSON结果
-            try:
-                # 清理可能的markdown格式
-                cleaned_result = reflection_result.strip()
-                if cleaned_result.startswith("```json"):
-                    cleaned_result = cleaned_result[7:]
-                if cleaned_result.endswith("```"):
-                    cleaned_result = cleaned_result[:-3]
-                cleaned_result = cleaned_result.strip()
-                
-                print(f"Attempting to parse JSON: {cleaned_result[:200]}...")
-                reflection_data = json.loads(cleaned_result)
-                
-                # 确保所有必需字段都存在
-                required_fields = {
-                    "subtask_completed": False,
-                    "action_summary": "",
-                    "current_issues": [],
-                    "suggestions": [],
-                    "reflection_summary": "",
-                    "need_replanning": False,
-                    "replanning_reason": ""
-                }
-                
-                # 补充缺失的字段
-                for field, default_value in required_fields.items():
-                    if field not in reflection_data:
-                        reflection_data[field] = default_value
-                    elif field == "current_issues" and not isinstance(reflection_data[field], list):
-                        if isinstance(reflection_data[field], str):
-                            reflection_data[field] = [reflection_data[field]]
-                        else:
-                            reflection_data[field] = []
-                    elif field == "suggestions" and not isinstance(reflection_data[field], list):
-                        if isinstance(reflection_data[field], str):
-                            reflection_data[field] = [reflection_data[field]]
-                        else:
-                            reflection_data[field] = []
-                    elif field == "action_summary" and not isinstance(reflection_data[field], str):
-                        reflection_data[field] = str(reflection_data[field]) if reflection_data[field] is not None else ""
+                # 记录反思模型调用
+                if task_logger:
+                    task_logger.log_model_call(
+                        model_name=self.model_manager.last_model_name(),
+                        call_type="reflection",
+                        input_data={"original_instruction": original_instruction, "current_subtask": current_subtask, "messages_count": len(reflection_messages),
+                                    "contact_sheet": used_sheet, "history_screenshots": len(history_images)},
+                        output_data={"reflection_result": reflection_result,
+                                     "time_to_verdict": reply.time_to_ready if reply else None},
+                        execution_time=reflection_execution_time,
+                        success=True
+                    )
+            
+                # 尝试解析JSON结果
+                try:
+                    reflection_data = self._parse_reflection_result(reflection_result)
                 
-                print(f"Successfully parsed reflection data: {reflection_data}")
+                    print(f"Successfully parsed reflection data: {reflection_data}")
                 
-                # 记录反思完成
-                if task_logger:
-                    task_logger.log_reflection(reflection_data, reflection_execution_time)
+                    # 记录反思完成
+                    if cascade:
+                        self._record_cascade(current_subtask, small_verdict, small_time, escalate_reason,
+                                             reflection_data, reflection_execution_time, task_logger)
+                    if task_logger:
+                        task_logger.log_reflection(reflection_data, reflection_execution_time)
+                    self.reflection_cache.store(current_subtask, completed_subtasks, frame_hash, reflection_data)
                 
-                return reflection_data
-            except json.JSONDecodeError as e:
-                print(f"JSON parsing failed: {e}")
-                print(f"Raw reflection result: {reflection_result}")
-                # 如果JSON解析失败，返回默认结构
-                return {
-                    "subtask_completed": False,
-                    "action_summary": "",
-                    "current_issues": ["无法解析反思结果"],
-                    "suggestions": ["重新规划任务"],
-                    "reflection_summary": reflection_result,
-                    "need_replanning": True,
-                    "replanning_reason": "反思结果解析失败"
-                }
+                    return reflection_data
+                except json.JSONDecodeError as e:
+                    print(f"JSON parsing failed: {e}")
+                    print(f"Raw reflection result: {reflection_result}")
+                    if cascade:
+                        self._record_cascade(current_subtask, small_verdict, small_time, escalate_reason,
+                                             None, reflection_execution_time, task_logger)
+                    # 如果JSON解析失败，返回默认结构
+                    return {
+                        "subtask_completed": False,
+                        "action_summary": "",
+                        "current_issues": ["无法解析反思结果"],
+                        "suggestions": ["重新规划任务"],
+                        "reflection_summary": reflection_result,
+                        "need_replanning": True,
+                        "replanning_reason": "反思结果解析失败"
+                    }
+            
+            if not Config.REFLECTION_STREAMING:
+                reflection_start_time = time.time()
+                reflection_result = self.model_manager.call_reflection_model(reflection_messages, budget=budget)
+                return finish(reflection_result, time.time() - reflection_start_time)
+            
+            # 流式接收：结论字段一输出就返回，其余分析内容在后台接收完后写入日志
+            reply = StreamingReply(self.model_manager.stream_reflection_model(reflection_messages, budget=budget),
+                                   self._verdict_ready, finish)
+            reply.start()
+            try:
+                fields = reply.wait_ready(Config.REFLECTION_STREAM_READY_TIMEOUT)
+            except TimeoutError:
+                with self._lock:
+                    self._pending_replies.append(reply)
+                raise
+            if not reply.early:
+                return reply.result
+            with self._lock:
+                self._pending_replies.append(reply)
+            verdict = self._fill_reflection_fields(fields)
+            print(f"反思结论在{reply.time_to_ready:.1f}s时已确定（subtask_completed={verdict['subtask_completed']}，"
+                  f"need_replanning={verdict['need_replanning']}），其余内容在后台接收")
+            self.reflection_cache.store(current_subtask, completed_subtasks, frame_hash, verdict)
+            return verdict
                 
         except Exception as e:
             print(f"Reflection failed: {e}")
@@ -250,13 +491,14 @@ class ReflectionManager:
                                                         total_task_check_prompt: str,
                                                         completed_subtasks: List[str], 
                                                         subtask_list: List[Dict[str, Any]], 
-                                                        task_logger) -> Dict[str, Any]:
+                                                        task_logger, budget=None) -> Dict[str, Any]:
         """基于所有保存的截图检查总任务完成情况"""
         try:
-            # 获取所有保存的截图
-            all_screenshots = task_logger.get_all_screenshots()
+            # 获取所有保存的截图，只上传去重后的关键帧
+            all_screenshots = task_logger.get_screenshot_records()
+            keyframes = select_keyframes(all_screenshots)
             
-            if not all_screenshots:
+            if not keyframes:
                 print("No screenshots available for total task completion check")
                 return {
                     "subtask_completed": False,
@@ -269,8 +511,8 @@ class ReflectionManager:
             enhanced_prompt = f"""
 {total_task_check_prompt}
 
-## 任务执行过程中的所有截图
-以下是任务执行过程中的所有截图，按时间顺序排列：
+## 任务执行过程中的关键截图
+以下是任务执行过程中的关键截图（已去除重复画面，保留了第一张、最后一张和子任务切换前后的截图），按时间顺序排列：
 """
             
             # 添加所有截图到消息中
@@ -287,29 +529,33 @@ class ReflectionManager:
                 }
             ]
             
-            # 添加所有截图
-            for i, screenshot_path in enumerate(all_screenshots):
-                if os.path.exists(screenshot_path):
-                    with open(screenshot_path, "rb") as f:
-                        base64_img = base64.b64encode(f.read()).decode('utf-8')
-                    
-                    messages[1]["content"].append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpg;base64,{base64_img}"}
-                    })
+            # 添加关键帧，拼图模式下除最后一帧外拼成缩略图
+            keyframe_images = []
+            for frame in keyframes:
+                with open(frame["path"], "rb") as f:
+                    keyframe_images.append(f.read())
+            image_parts, used_sheet = screenshot_parts(keyframe_images[:-1], keyframe_images[-1])
+            if used_sheet:
+                messages[1]["content"].append({"type": "text", "text": f"截图1-{len(keyframes) - 1}以缩略图拼图提供（左上角为序号），最后一张图片为最终界面截图原图。"})
+            messages[1]["content"].extend(image_parts)
+            request_bytes = parts_bytes(image_parts)
+            print(f"总任务完成检查: 从 {len(all_screenshots)} 张截图中选出 {len(keyframes)} 张关键帧"
+                  f"（{'拼图，' if used_sheet else ''}{request_bytes / 1024:.0f}KB）")
             
             # 调用反思模型
             reflection_start_time = time.time()
-            reflection_result = self.model_manager.call_reflection_model(messages)
+            reflection_result = self.model_manager.call_reflection_model(messages, budget=budget)
             reflection_execution_time = time.time() - reflection_start_time
             print(f"Total task completion check result: {reflection_result}")
             
             # 记录模型调用
             if task_logger:
                 task_logger.log_model_call(
-                    model_name=self.model_manager.config["reflection_model"],
+                    model_name=self.model_manager.last_model_name(),
                     call_type="total_task_completion_check",
-                    input_data={"original_instruction": original_instruction, "screenshots_count": len(all_screenshots)},
+                    input_data={"original_instruction": original_instruction, "screenshots_count": len(all_screenshots),
+                                "keyframes_count": len(keyframes), "image_bytes": request_bytes, "contact_sheet": used_sheet,
+                                "keyframes": [{"filename": f["filename"], "reason": f["keep_reason"]} for f in keyframes]},
                     output_data={"reflection_result": reflection_result},
                     execution_time=reflection_execution_time,
                     success=True
@@ -369,5 +615,11 @@ class ReflectionManager:
                 "reflection_summary": f"检查失败: {e}"
             }
 
-# 全局反思管理器实例
-reflection_manager = ReflectionManager() 
\ No newline at end of file
+# 全局反思管理器（惰性创建）
+get_reflection_manager = lazy_singleton(ReflectionManager)
+
+def __getattr__(name):
+    """兼容 `from .reflection import reflection_manager` 的旧用法，首次访问时才创建实例"""
+    if name == "reflection_manager":
+        return get_reflection_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,82 @@
+"""
+反思结论缓存模块
+
+同一子任务在相同画面上经常被连续反思两次（例如无效动作之后，或第10轮反思之后紧接着的达到最大轮数反思）。
+按 (当前子任务, 已完成子任务, 画面感知哈希) 缓存反思结论，在 Config.REFLECTION_CACHE_TTL 秒内直接复用。
+缓存只保存在内存中。
+"""
+
+import copy
+import time
+import threading
+from typing import Dict, List, Any, Optional, Tuple
+
+from .config import Config
+from .utils import hash_distance, lazy_singleton
+
+HIT, STALE, MISS = "hit", "stale", "miss"
+
+class ReflectionCache:
+    """反思结论缓存：(子任务, 已完成子任务) -> [{"hash": 画面哈希, "verdict": 反思结论, "time": 时间}]"""
+
+    def __init__(self, ttl: float = None, max_entries: int = None):
+        self.ttl = ttl if ttl is not None else Config.REFLECTION_CACHE_TTL
+        self.max_entries = max_entries if max_entries is not None else Config.REFLECTION_CACHE_MAX_ENTRIES
+        self.entries = {}
+        self.stats = {"lookups": 0, HIT: 0, STALE: 0, MISS: 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(subtask: str, completed_subtasks: Optional[List[str]]) -> Tuple:
+        return "".join(subtask.split()), tuple(completed_subtasks or [])
+
+    def lookup(self, subtask: str, completed_subtasks: Optional[List[str]],
+               frame_hash: Optional[int]) -> Tuple[str, Optional[Dict[str, Any]], Optional[float]]:
+        """返回 (hit/stale/miss, 结论副本, 缓存的时长秒)；stale 表示相同画面的结论已过期"""
+        if frame_hash is None:
+            return MISS, None, None
+        now = time.time()
+        with self._lock:
+            self.stats["lookups"] += 1
+            status, verdict, age = MISS, None, None
+            for entry in self.entries.get(self._key(subtask, completed_subtasks), []):
+                if hash_distance(frame_hash, entry["hash"]) > Config.FRAME_HASH_DISTANCE_THRESHOLD:
+                    continue
+                age = now - entry["time"]
+                if age <= self.ttl:
+                    status, verdict = HIT, copy.deepcopy(entry["verdict"])
+                    break
+                status = STALE
+            self.stats[status] += 1
+        return status, verdict, age
+
+    def store(self, subtask: str, completed_subtasks: Optional[List[str]],
+              frame_hash: Optional[int], verdict: Dict[str, Any]):
+        """记录一次反思结论，替换相同画面的旧结论并清理过期条目"""
+        if frame_hash is None:
+            return
+        now = time.time()
+        key = self._key(subtask, completed_subtasks)
+        with self._lock:
+            entries = [e for e in self.entries.get(key, [])
+                       if now - e["time"] <= self.ttl
+                       and hash_distance(frame_hash, e["hash"]) > Config.FRAME_HASH_DISTANCE_THRESHOLD]
+            entries.append({"hash": frame_hash, "verdict": copy.deepcopy(verdict), "time": now})
+            self.entries[key] = entries
+            # 超过上限时丢弃最早的结论
+            all_entries = sorted(((e["time"], k, e) for k, es in self.entries.items() for e in es),
+                                 key=lambda item: item[0])
+            for _, k, entry in all_entries[:max(0, len(all_entries) - self.max_entries)]:
+                self.entries[k].remove(entry)
+                if not self.entries[k]:
+                    del self.entries[k]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中率"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = stats[HIT] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+# 全局反思结论缓存（惰性创建）
+get_reflection_cache = lazy_singleton(ReflectionCache)
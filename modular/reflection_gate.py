@@ -0,0 +1,108 @@
+"""
+反思门控模块
+
+run_gui_task 原来固定在第6轮和第10轮调用反思模型（MAX_ROUNDS 为10时的中间轮和最后一轮，
+现在按子任务的 max_rounds 计算）。门控用本地的廉价信号决定是否反思：
+- 画面持续变化（或进入了新的应用）且没有卡住的信号时，跳过中间轮的例行反思
+- 连续无效动作、连续重复相同动作、返回键离开应用时提前触发反思
+- 最后点击的元素正是知识路径中子任务的目标功能时触发反思，确认子任务是否已完成
+每次跳过和触发都记录到 TaskLogger。
+"""
+
+from typing import Dict, List, Any, Optional, Tuple
+
+from .config import Config
+from .knowledge import get_knowledge_manager
+from .routing import RoutingSignals
+from .utils import target_name
+
+class ReflectionGate:
+    """单个子任务执行过程中的反思门控"""
+
+    def __init__(self, instruction: str, max_rounds: int, targets: Optional[List[str]] = None):
+        self.instruction = instruction
+        # 例行反思的轮次（rounds 从0开始）：中间轮，以及最后一轮（达到最大步数限制）
+        self.checkpoint_round = max_rounds // 2
+        self.final_round = max_rounds - 1
+        # 子任务中提到的知识库功能名，点击到这些元素时检查子任务是否完成
+        if targets is None:
+            targets = [feature for _, feature in get_knowledge_manager().match_features(instruction)] \
+                if Config.REFLECTION_GATE_ENABLED else []
+        self.targets = targets
+        self.last_reflection_round = None
+        self.checked_targets = set()
+
+    def _reached_target(self, parsed_actions: List[Dict[str, Any]]) -> Optional[str]:
+        """本轮点击的元素是子任务的目标功能时返回功能名"""
+        for action in parsed_actions:
+            if action.get("action_type") not in ("click", "long_press"):
+                continue
+            name = target_name(action.get("thought", ""))
+            for target in self.targets:
+                if name and target in name and target not in self.checked_targets:
+                    return target
+        return None
+
+    @staticmethod
+    def _stuck_reasons(signals: RoutingSignals) -> List[str]:
+        """比操作模型路由更强的卡住信号（路由切换到sync之后仍然没有进展）"""
+        reasons = []
+        if signals.no_op_streak >= Config.REFLECTION_GATE_NO_OP_ROUNDS:
+            reasons.append(f"连续{signals.no_op_streak}次动作后画面未变化")
+        if signals.repeat_streak + 1 >= Config.REFLECTION_GATE_REPEAT_ROUNDS:
+            reasons.append(f"连续{signals.repeat_streak + 1}次相同动作")
+        if signals.left_app:
+            reasons.append(f"返回键离开了应用{signals.left_app}")
+        return reasons
+
+    def _decide(self, rounds: int, signals: RoutingSignals,
+                parsed_actions: List[Dict[str, Any]]) -> Tuple[Optional[bool], str]:
+        """返回 (是否反思, 原因)；本轮既不是例行反思也没有触发信号时为 (None, "")"""
+        checkpoint = f"第{self.checkpoint_round + 1}步反思"
+        final = f"第{self.final_round + 1}步反思（达到最大步数限制）"
+        if not Config.REFLECTION_GATE_ENABLED:
+            if rounds == self.final_round:
+                return True, final
+            if rounds == self.checkpoint_round:
+                return True, checkpoint
+            return None, ""
+
+        target = self._reached_target(parsed_actions)
+        if target:
+            self.checked_targets.add(target)
+            return True, f"点击了知识路径中的目标功能\"{target}\"，检查子任务是否完成"
+        if rounds == self.final_round:
+            return True, final
+
+        reasons = self._stuck_reasons(signals)
+        cooling = self.last_reflection_round is not None and \
+            rounds - self.last_reflection_round < Config.REFLECTION_GATE_COOLDOWN_ROUNDS
+        if rounds == self.checkpoint_round:
+            if reasons and not cooling:
+                return True, f"{checkpoint}：{'；'.join(reasons)}"
+            if cooling:
+                return False, f"第{self.last_reflection_round + 1}步刚反思过，跳过{checkpoint}"
+            if signals.progress_streak >= Config.REFLECTION_GATE_PROGRESS_ROUNDS:
+                return False, f"画面已连续{signals.progress_streak}轮变化且没有卡住的信号，跳过{checkpoint}"
+            if signals.foreground_changed:
+                return False, f"进入了新的应用{signals.foreground}，跳过{checkpoint}"
+            return True, f"{checkpoint}：最近几轮没有明显进展"
+        if reasons and not cooling and rounds + 1 >= Config.REFLECTION_GATE_MIN_ROUND:
+            return True, f"提前反思：{'；'.join(reasons)}"
+        return None, ""
+
+    def decide(self, rounds: int, signals: RoutingSignals, parsed_actions: List[Dict[str, Any]],
+               task_logger=None) -> Tuple[bool, str]:
+        """本轮动作执行后是否反思，返回 (是否反思, 原因)，跳过和触发都记录到日志
+
+        调用前 signals 应已记录本轮动作之后的画面，否则画面信号落后一轮。
+        """
+        should_reflect, reason = self._decide(rounds, signals, parsed_actions)
+        if should_reflect is None:
+            return False, ""
+        if should_reflect:
+            self.last_reflection_round = rounds
+        print(f"反思门控: {'触发' if should_reflect else '跳过'} - {reason}")
+        if task_logger:
+            task_logger.log_reflection_gate(rounds + 1, should_reflect, reason, signals.summary())
+        return should_reflect, reason
@@ -0,0 +1,152 @@
+"""
+轨迹回放缓存模块
+
+记录 (子任务文本, 起始画面的感知哈希) -> 完成该子任务的动作序列，以及每一步执行后的画面哈希。
+再次遇到同一子任务且起始画面相同时，run_gui_task 直接回放动作，每一步都用录制的画面哈希校验，
+第一次出现偏差就交回ui-tars模型继续执行。缓存持久化到 Config.REPLAY_CACHE_FILE。
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from .config import Config
+from .utils import hash_distance, lazy_singleton
+
+def _normalize(instruction: str) -> str:
+    """子任务文本的缓存键：去掉空白并小写"""
+    return "".join(instruction.lower().split())
+
+class TrajectoryCache:
+    """轨迹回放缓存
+
+    每条录制为:
+    {"start_hash": 起始画面哈希, "screen_size": [宽, 高],
+     "steps": [{"actions": [动作], "frame_hash": 该步执行后的画面哈希, "model_calls": 录制时该步的模型调用数}],
+     "hits": 完整回放次数, "divergences": 连续偏差次数, "created": ..., "last_used": ...}
+    最后一步以finished结束时 frame_hash 为None，不需要校验。
+    """
+
+    def __init__(self, cache_file: str = None):
+        self.cache_file = cache_file if cache_file is not None else Config.REPLAY_CACHE_FILE
+        self.entries = {}  # 规范化的子任务文本 -> [录制]
+        self.stats = {"lookups": 0, "hits": 0, "full_replays": 0, "divergences": 0,
+                      "replayed_steps": 0, "model_calls_saved": 0}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """读取缓存文件"""
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+            print(f"轨迹回放缓存加载完成: {sum(len(r) for r in self.entries.values())} 条录制")
+        except Exception as e:
+            print(f"轨迹回放缓存加载失败: {e}")
+            self.entries = {}
+
+    def _save(self):
+        """原子地写回缓存文件，调用方持有锁"""
+        if not self.cache_file:
+            return
+        try:
+            tmp_path = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_file)
+        except Exception as e:
+            print(f"轨迹回放缓存保存失败: {e}")
+
+    def has_recordings(self, instruction: str) -> bool:
+        """该子任务是否有录制，没有时不需要为查找额外截图"""
+        return bool(self.entries.get(_normalize(instruction)))
+
+    def lookup(self, instruction: str, frame_hash: Optional[int],
+               screen_size: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+        """查找起始画面最接近的录制，距离超过阈值或屏幕尺寸不同时返回None"""
+        with self._lock:
+            self.stats["lookups"] += 1
+            best, best_distance = None, Config.FRAME_HASH_DISTANCE_THRESHOLD + 1
+            for recording in self.entries.get(_normalize(instruction), []):
+                if list(screen_size) != recording.get("screen_size"):
+                    continue
+                distance = hash_distance(frame_hash, recording["start_hash"])
+                if distance < best_distance:
+                    best, best_distance = recording, distance
+            if best is not None:
+                self.stats["hits"] += 1
+            return best
+
+    def record(self, instruction: str, start_hash: Optional[int], screen_size: Tuple[int, int],
+               steps: List[Dict[str, Any]]):
+        """录制一次成功完成子任务的轨迹，替换起始画面相同的旧录制"""
+        if start_hash is None or not steps:
+            return
+        key = _normalize(instruction)
+        now = datetime.now().isoformat()
+        with self._lock:
+            recordings = [r for r in self.entries.get(key, [])
+                          if list(screen_size) != r.get("screen_size")
+                          or hash_distance(start_hash, r["start_hash"]) > Config.FRAME_HASH_DISTANCE_THRESHOLD]
+            recordings.append({
+                "start_hash": start_hash,
+                "screen_size": list(screen_size),
+                "steps": steps,
+                "hits": 0,
+                "divergences": 0,
+                "created": now,
+                "last_used": now
+            })
+            self.entries[key] = recordings[-Config.REPLAY_MAX_RECORDINGS_PER_SUBTASK:]
+            self._evict()
+            self._save()
+        print(f"录制子任务轨迹: {instruction}（{len(steps)} 步）")
+
+    def _evict(self):
+        """录制总数超过上限时淘汰最久未使用的录制，调用方持有锁"""
+        all_recordings = [(r["last_used"], key, r) for key, rs in self.entries.items() for r in rs]
+        excess = len(all_recordings) - Config.REPLAY_CACHE_MAX_RECORDINGS
+        if excess <= 0:
+            return
+        for _, key, recording in sorted(all_recordings, key=lambda item: item[0])[:excess]:
+            self.entries[key].remove(recording)
+            if not self.entries[key]:
+                del self.entries[key]
+
+    def report(self, instruction: str, recording: Dict[str, Any], verified_steps: int, completed: bool):
+        """记录一次回放结果：verified_steps 为校验通过的步数，completed 表示完整回放了子任务"""
+        saved = sum(step.get("model_calls", 1) for step in recording["steps"][:verified_steps])
+        with self._lock:
+            self.stats["replayed_steps"] += verified_steps
+            self.stats["model_calls_saved"] += saved
+            recording["last_used"] = datetime.now().isoformat()
+            if completed:
+                self.stats["full_replays"] += 1
+                recording["hits"] += 1
+                recording["divergences"] = 0
+            else:
+                self.stats["divergences"] += 1
+                recording["divergences"] += 1
+                if recording["divergences"] >= Config.REPLAY_MAX_DIVERGENCES:
+                    # 界面已经变化，删除失效的录制
+                    recordings = self.entries.get(_normalize(instruction), [])
+                    if recording in recordings:
+                        recordings.remove(recording)
+                        print(f"轨迹录制连续{recording['divergences']}次偏差，已删除: {instruction}")
+            self._save()
+        return saved
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中率和节省的模型调用数"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["recordings"] = sum(len(r) for r in self.entries.values())
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+# 全局轨迹回放缓存（惰性创建）
+get_trajectory_cache = lazy_singleton(TrajectoryCache)
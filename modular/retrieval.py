@@ -0,0 +1,99 @@
+"""
+模糊检索模块
+
+基于字符n-gram TF-IDF的本地检索索引，用于指令中没有逐字出现应用名/功能名时的知识查询，
+例如"联通"对应"中国联通"。
+"""
+
+import math
+import heapq
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Tuple
+
+def _normalize(text: str) -> str:
+    """小写并去掉空白"""
+    return "".join(text.lower().split())
+
+class NgramTfidfIndex:
+    """字符n-gram TF-IDF检索索引
+
+    得分（0~1）为两个覆盖率的几何平均：
+    - 文档覆盖率：文档n-gram的TF-IDF权重平方中被查询命中的比例，文档完整出现在查询中时为1
+    - 查询覆盖率：查询中属于索引词表的n-gram的IDF权重平方中被该文档命中的比例，
+      指令里与知识库无关的词不参与计算，因此长指令不会拉低得分
+    至少有一个长度不小于 min_match_n 的n-gram命中才计分，避免只靠单个常见字匹配；
+    出现在大量文档中的n-gram（IDF很低）不用于生成候选文档，候选文档先按命中的n-gram权重粗排，
+    只对前 max_candidates 个计算完整得分。
+    """
+
+    def __init__(self, documents: Iterable[Tuple[str, Any, float]], ngram_range: Tuple[int, int] = (1, 2),
+                 min_match_n: int = 2):
+        """documents 为 (文本, 附带数据, 得分系数) 的序列"""
+        self.ngram_range = ngram_range
+        self.min_match_n = min_match_n
+        self.payloads = []
+        self.doc_weights = []
+        self.doc_texts = []   # 规范化后的文档文本，查询时为候选文档重新切分n-gram，不常驻每个文档的n-gram表
+        self.doc_norms = []   # 文档TF-IDF权重的平方和
+        self.idf = {}
+        self.postings = {}    # 长度不小于 min_match_n 的n-gram -> 包含它的文档
+
+        doc_counts = []
+        document_frequency = Counter()
+        for text, payload, weight in documents:
+            text = _normalize(text)
+            counts = Counter(self._ngrams(text))
+            if not counts:
+                continue
+            self.payloads.append(payload)
+            self.doc_weights.append(weight)
+            self.doc_texts.append(text)
+            doc_counts.append(counts)
+            document_frequency.update(counts.keys())
+
+        total = len(doc_counts)
+        idf = {gram: math.log((total + 1) / (df + 1)) + 1 for gram, df in document_frequency.items()}
+        self.idf = idf
+        for doc_id, counts in enumerate(doc_counts):
+            self.doc_norms.append(sum((tf * idf[gram]) ** 2 for gram, tf in counts.items()))
+            for gram in counts:
+                if len(gram) >= min_match_n:
+                    self.postings.setdefault(gram, []).append(doc_id)
+
+    def _ngrams(self, text: str) -> List[str]:
+        """切分规范化文本的n-gram"""
+        low, high = self.ngram_range
+        return [text[i:i + n] for n in range(low, high + 1) for i in range(len(text) - n + 1)]
+
+    def search(self, query: str, top_k: int = 5, threshold: float = 0.0,
+               max_candidates: int = 200) -> List[Tuple[float, Any]]:
+        """返回得分不低于阈值的前 top_k 个 (得分, 附带数据)，按得分从高到低排列"""
+        idf = self.idf
+        query_weights = {gram: idf[gram] ** 2 for gram in set(self._ngrams(_normalize(query))) if gram in idf}
+        query_total = sum(query_weights.values())
+        max_postings = max(256, len(self.payloads) // 20)
+        rough_scores = Counter()
+        for gram, weight in query_weights.items():
+            postings = self.postings.get(gram, ())
+            if len(postings) <= max_postings:
+                for doc_id in postings:
+                    rough_scores[doc_id] += weight
+        candidates = [doc_id for doc_id, _ in rough_scores.most_common(max(max_candidates, top_k))]
+
+        results = []
+        for doc_id in candidates:
+            doc_matched = 0.0
+            query_matched = 0.0
+            for gram, tf in Counter(self._ngrams(self.doc_texts[doc_id])).items():
+                if gram in query_weights:
+                    doc_matched += (tf * idf[gram]) ** 2
+                    query_matched += query_weights[gram]
+            doc_coverage = doc_matched / self.doc_norms[doc_id]
+            score = math.sqrt(doc_coverage * query_matched / query_total) * self.doc_weights[doc_id]
+            if score >= threshold:
+                results.append((score, doc_id))
+        return [(score, self.payloads[doc_id])
+                for score, doc_id in heapq.nlargest(top_k, results, key=lambda item: (item[0], -item[1]))]
+
+    def __len__(self) -> int:
+        return len(self.payloads)
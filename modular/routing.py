@@ -0,0 +1,175 @@
+"""
+操作模型路由模块
+
+根据实时信号在两种操作模式之间选择：
+- simple: 只调用ui-tars模型，一轮一次调用
+- sync: plan模型先生成思考，ui-tars再补全坐标，一轮两次调用
+默认使用更便宜的simple模式，只有出现卡住的信号时才切换到sync。
+"""
+
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional, Tuple
+
+from .config import Config
+from .utils import hash_distance, lazy_singleton
+
+SIMPLE = "simple"
+SYNC = "sync"
+
+def _action_key(action: Dict[str, Any]) -> Tuple:
+    """动作的比较键：动作类型 + 取整后的坐标/输入内容"""
+    inputs = action.get("action_inputs", {})
+    box = inputs.get("start_box")
+    coords = tuple(round(v) for v in box) if isinstance(box, list) else ()
+    return action.get("action_type"), coords, inputs.get("content")
+
+class RoutingSignals:
+    """单个子任务执行过程中的路由信号"""
+
+    def __init__(self):
+        self.mode = SIMPLE
+        self.frame_hashes = []
+        self.frame_rounds = []      # 每个画面所属的轮次（从1开始）
+        self.frame_changed = True
+        self.revisit_round = None
+        self.no_op_streak = 0
+        self.repeat_streak = 0
+        self.progress_streak = 0
+        self.parse_failures = deque(maxlen=3)
+        self.foreground = None
+        self.foreground_changed = False
+        self.left_app = None
+        self._last_action_key = None
+        self._acted_since_last_frame = False
+        self._pressed_back = False
+
+    def record_frame(self, frame_hash: Optional[int], round_number: Optional[int] = None):
+        """记录新一轮的截图哈希，更新画面变化/回到旧画面等信号；round_number 为该画面所属的轮次（从1开始）"""
+        threshold = Config.FRAME_HASH_DISTANCE_THRESHOLD
+        if self.frame_hashes:
+            self.frame_changed = hash_distance(frame_hash, self.frame_hashes[-1]) > threshold
+        else:
+            self.frame_changed = True
+
+        # 与更早的画面相似，说明在几个页面之间来回
+        self.revisit_round = None
+        if self.frame_changed:
+            for i, old_hash in enumerate(self.frame_hashes[:-1]):
+                if hash_distance(frame_hash, old_hash) <= threshold:
+                    self.revisit_round = self.frame_rounds[i]
+                    break
+
+        if self._acted_since_last_frame:
+            if self.frame_changed:
+                self.no_op_streak = 0
+            else:
+                self.no_op_streak += 1
+        if self.frame_changed and self.revisit_round is None:
+            self.progress_streak += 1
+        else:
+            self.progress_streak = 0
+
+        self.frame_hashes.append(frame_hash)
+        self.frame_rounds.append(round_number if round_number is not None else len(self.frame_hashes))
+        self._acted_since_last_frame = False
+
+    def record_foreground(self, package: Optional[str]):
+        """记录本轮的前台应用（探测失败时为None），检测返回键是否离开了应用"""
+        self.left_app = None
+        self.foreground_changed = False
+        if package is None:
+            return
+        if self._pressed_back and self.foreground and package != self.foreground:
+            self.left_app = self.foreground
+        elif self.foreground and package != self.foreground:
+            self.foreground_changed = True
+        self.foreground = package
+        self._pressed_back = False
+
+    def record_parse(self, success: bool):
+        """记录本轮ui-tars输出是否可以直接解析"""
+        self.parse_failures.append(not success)
+
+    def record_actions(self, parsed_actions: List[Dict[str, Any]]):
+        """记录本轮执行的动作，用于检测重复动作"""
+        key = tuple(_action_key(a) for a in parsed_actions)
+        self.repeat_streak = self.repeat_streak + 1 if key == self._last_action_key else 0
+        self._last_action_key = key
+        self._acted_since_last_frame = True
+        self._pressed_back = any("back" in (a.get("action_type") or "") for a in parsed_actions)
+
+    def summary(self) -> Dict[str, Any]:
+        """当前信号摘要，用于日志"""
+        return {
+            "mode": self.mode,
+            "frame_changed": self.frame_changed,
+            "revisit_round": self.revisit_round,
+            "no_op_streak": self.no_op_streak,
+            "repeat_streak": self.repeat_streak,
+            "progress_streak": self.progress_streak,
+            "recent_parse_failures": sum(self.parse_failures),
+            "foreground": self.foreground,
+            "foreground_changed": self.foreground_changed,
+            "left_app": self.left_app
+        }
+
+class OperateModelRouter:
+    """操作模型路由器，跨任务累计各模式的延迟统计"""
+
+    def __init__(self, window: int = 50):
+        self.latencies = {SIMPLE: deque(maxlen=window), SYNC: deque(maxlen=window)}
+        self._lock = threading.Lock()
+
+    def record_latency(self, mode: str, seconds: float):
+        """记录一次模型调用的延迟"""
+        with self._lock:
+            self.latencies.setdefault(mode, deque(maxlen=50)).append(seconds)
+
+    def mean_latency(self, mode: str) -> Optional[float]:
+        """某模式的平均延迟，无记录时返回None"""
+        with self._lock:
+            samples = list(self.latencies.get(mode, []))
+        return sum(samples) / len(samples) if samples else None
+
+    def _stuck_reasons(self, signals: RoutingSignals) -> List[str]:
+        """收集表明simple模式卡住的信号"""
+        reasons = []
+        if signals.no_op_streak >= Config.ROUTER_NO_OP_THRESHOLD:
+            reasons.append(f"连续{signals.no_op_streak}次动作后画面未变化")
+        if signals.repeat_streak >= Config.ROUTER_REPEAT_THRESHOLD:
+            reasons.append(f"连续{signals.repeat_streak + 1}次相同动作")
+        if signals.revisit_round is not None:
+            reasons.append(f"回到了第{signals.revisit_round}轮的画面")
+        if signals.left_app:
+            reasons.append(f"返回键离开了应用{signals.left_app}")
+        if sum(signals.parse_failures) >= Config.ROUTER_PARSE_FAILURE_THRESHOLD:
+            reasons.append(f"最近{len(signals.parse_failures)}轮中{sum(signals.parse_failures)}次解析失败")
+        return reasons
+
+    def choose_mode(self, signals: RoutingSignals, budget=None) -> Tuple[str, str]:
+        """选择本轮的操作模式，返回(模式, 原因)"""
+        if budget is not None and not budget.allow_sync_mode():
+            mode, reason = SIMPLE, f"预算等级为{budget.level()}，不使用sync模式"
+        else:
+            reasons = self._stuck_reasons(signals)
+            if reasons:
+                sync_latency = self.mean_latency(SYNC)
+                if sync_latency is not None and sync_latency > Config.ROUTER_MAX_SYNC_LATENCY and len(reasons) < 2:
+                    mode, reason = SIMPLE, f"sync平均延迟{sync_latency:.1f}s过高，信号不足以切换（{reasons[0]}）"
+                else:
+                    mode, reason = SYNC, "；".join(reasons)
+            elif signals.mode == SYNC and signals.progress_streak < Config.ROUTER_RECOVERY_ROUNDS:
+                mode, reason = SYNC, f"sync模式下已连续{signals.progress_streak}轮有进展，继续观察"
+            else:
+                mode, reason = SIMPLE, "没有卡住的信号"
+        signals.mode = mode
+        return mode, reason
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各模式的延迟统计"""
+        return {mode: {"samples": len(samples), "mean_latency": self.mean_latency(mode)}
+                for mode, samples in self.latencies.items()}
+
+# 全局路由器（惰性创建）
+get_operate_router = lazy_singleton(OperateModelRouter)
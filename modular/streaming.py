@@ -0,0 +1,133 @@
+"""
+流式输出解析模块
+
+- IncrementalJSONParser: 逐段喂入模型输出，顶层JSON对象的每个字段一结束就解析出来，
+  不需要等整个对象输出完（允许对象前后有 ```json 或说明文字）
+- StreamingReply: 在后台线程消费流式输出，字段满足调用方的条件时立即唤醒等待方，
+  其余内容继续在后台接收，完整输出到达后调用 on_complete
+"""
+
+import json
+import time
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+class IncrementalJSONParser:
+    """增量解析顶层JSON对象的字段，已完成的字段在 fields 中"""
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.done = False
+        self._pos = 0            # 下一个待扫描的字符
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = None         # 当前顶层字段名
+        self._key_start = None   # 顶层字段名字符串的起始位置
+        self._value_start = None # 当前顶层字段值的起始位置
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """喂入一段输出，返回本次新解析出的字段"""
+        self.text += chunk
+        new_fields = {}
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None and self._value_start is None:
+                        self._key = json.loads(text[self._key_start:self._pos + 1])
+                        self._key_start = None
+            elif ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._value_start is None and self._key is None:
+                    self._key_start = self._pos
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]" and self._depth > 0:
+                if self._depth == 1:
+                    self._finish_value(self._pos, new_fields)
+                    self.done = True
+                self._depth -= 1
+            elif self._depth == 1:
+                if ch == ":" and self._key is not None and self._value_start is None:
+                    self._value_start = self._pos + 1
+                elif ch == ",":
+                    self._finish_value(self._pos, new_fields)
+            self._pos += 1
+        return new_fields
+
+    def _finish_value(self, end: int, new_fields: Dict[str, Any]):
+        """顶层字段的值在 end 处结束，解析并记录"""
+        if self._key is not None and self._value_start is not None:
+            raw = self.text[self._value_start:end].strip()
+            try:
+                value = json.loads(raw)
+            except json.JSONDecodeError:
+                value = None
+            if raw and (value is not None or raw == "null"):
+                self.fields[self._key] = new_fields[self._key] = value
+        self._key = self._key_start = self._value_start = None
+
+class StreamingReply:
+    """在后台消费流式输出；ready(fields) 为真时唤醒 wait_ready，完整输出到达后调用 on_complete(text, 耗时)"""
+
+    def __init__(self, chunks: Iterable[str], ready: Callable[[Dict[str, Any]], bool],
+                 on_complete: Optional[Callable[[str, float], Any]] = None):
+        self.chunks = chunks
+        self.ready = ready
+        self.on_complete = on_complete
+        self.parser = IncrementalJSONParser()
+        self.early = False        # 是否在输出结束前满足了条件
+        self.time_to_ready = None
+        self.ready_fields = {}    # 满足条件时已解析的字段
+        self.result = None        # on_complete 的返回值
+        self.error = None
+        self._ready_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="streaming-reply")
+
+    def _run(self):
+        start_time = time.time()
+        try:
+            for chunk in self.chunks:
+                self.parser.feed(chunk)
+                if not self._ready_event.is_set() and self.ready(self.parser.fields):
+                    self.early = not self.parser.done
+                    self.time_to_ready = time.time() - start_time
+                    self.ready_fields = dict(self.parser.fields)
+                    self._ready_event.set()
+            if self.time_to_ready is None:
+                self.time_to_ready = time.time() - start_time
+                self.ready_fields = dict(self.parser.fields)
+            if self.on_complete:
+                self.result = self.on_complete(self.parser.text, time.time() - start_time)
+        except Exception as e:
+            self.error = e
+            print(f"流式输出接收失败: {e}")
+        finally:
+            self._ready_event.set()
+
+    def start(self):
+        self._thread.start()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """等待到满足条件或输出结束，返回已解析的字段；输出结束前出错时抛出异常，超时时抛出 TimeoutError"""
+        if not self._ready_event.wait(timeout):
+            raise TimeoutError(f"流式输出在{timeout}秒内未给出结论")
+        if not self.early:
+            # 输出已经结束（或没有提前满足条件），等待 on_complete 执行完
+            self._thread.join(timeout)
+        if self.error is not None and not self.early:
+            raise self.error
+        return self.ready_fields
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """等待后台接收和 on_complete 结束，返回是否已结束"""
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
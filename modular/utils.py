@@ -6,14 +6,30 @@ import re
 import ast
 import math
 import base64
-from typing import List, Dict, Any, Optional, Tuple
-from PIL import Image
-import requests
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Callable
 import time
 import os
+from dataclasses import dataclass, field
+from functools import lru_cache
 
 from .config import Config
 
+def lazy_singleton(factory: Callable[[], Any]) -> Callable[[], Any]:
+    """返回线程安全的惰性单例访问函数，首次调用时才创建实例"""
+    instance = []
+    lock = threading.Lock()
+
+    def accessor():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    accessor.__doc__ = f"获取全局{factory.__name__}实例（首次调用时创建）"
+    return accessor
+
 def convert_point_to_coordinates(text: str, is_answer: bool = False) -> str:
     """转换坐标点格式"""
     pattern = r"<point>(\d+)\s+(\d+)</point>"
@@ -73,19 +89,10 @@ def floor_by_factor(number: int, factor: int) -> int:
     """按因子向下取整"""
     return math.floor(number / factor) * factor
 
-def smart_resize(height: int, width: int, factor: int = None, 
-                min_pixels: int = None, max_pixels: int = None, 
-                max_ratio: int = None) -> Tuple[int, int]:
-    """智能调整图像尺寸"""
-    if factor is None:
-        factor = Config.IMAGE_FACTOR
-    if min_pixels is None:
-        min_pixels = Config.MIN_PIXELS
-    if max_pixels is None:
-        max_pixels = Config.MAX_PIXELS
-    if max_ratio is None:
-        max_ratio = Config.MAX_RATIO
-    
+@lru_cache(maxsize=256)
+def _smart_resize_cached(height: int, width: int, factor: int, min_pixels: int,
+                         max_pixels: int, max_ratio: int) -> Tuple[int, int]:
+    """smart_resize的缓存实现，同一设备的截图尺寸固定，只需计算一次"""
     if max(height, width) / min(height, width) > max_ratio:
         raise ValueError(f"Aspect ratio exceeds {max_ratio}")
     
@@ -103,159 +110,246 @@ def smart_resize(height: int, width: int, factor: int = None,
     
     return h_bar, w_bar
 
-def parse_action_to_structure_output(text: str, factor: int, origin_h: int, 
-                                   origin_w: int, model_type: str = "qwen25vl") -> List[Dict[str, Any]]:
-    """解析动作输出为结构化格式"""
-    text = text.strip()
-    
-    # 检查是否以finished开头
-    if text.strip().lower().startswith("finished"):
+def smart_resize(height: int, width: int, factor: int = None, 
+                min_pixels: int = None, max_pixels: int = None, 
+                max_ratio: int = None) -> Tuple[int, int]:
+    """智能调整图像尺寸"""
+    if factor is None:
+        factor = Config.IMAGE_FACTOR
+    if min_pixels is None:
+        min_pixels = Config.MIN_PIXELS
+    if max_pixels is None:
+        max_pixels = Config.MAX_PIXELS
+    if max_ratio is None:
+        max_ratio = Config.MAX_RATIO
+    return _smart_resize_cached(height, width, factor, min_pixels, max_pixels, max_ratio)
+
+class ActionParseError(ValueError):
+    """动作解析失败"""
+
+@dataclass
+class ParsedAction:
+    """解析后的动作"""
+    action_type: str
+    action_inputs: Dict[str, Any] = field(default_factory=dict)
+    thought: Optional[str] = ""
+    raw_text: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为agent使用的字典格式"""
+        return {
+            "thought": self.thought,
+            "action_type": self.action_type,
+            "action_inputs": self.action_inputs,
+            "raw_text": self.raw_text
+        }
+
+# 动作字符串的词法规则，一次扫描完成切分
+_ACTION_TOKEN_RE = re.compile(r"""
+    [ \t\r]*(?:
+      (?P<nl>\n)
+    | (?P<str>'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*")
+    | (?P<num>-?\d+(?:\.\d+)?)
+    | (?P<name>[A-Za-z_][A-Za-z_0-9.]*)
+    | (?P<op>[(),=])
+    | (?P<other>.)
+    )
+""", re.VERBOSE | re.DOTALL)
+_NUM_RE = re.compile(r"-?\d+(?:\.\d+)?")
+_ESCAPE_RE = re.compile(r"\\(.)", re.DOTALL)
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "\\": "\\", "'": "'", '"': '"'}
+_NAME_CONSTANTS = {"True": True, "False": False, "None": None}
+# 坐标参数名 -> 标准参数名
+_BOX_KEYS = {
+    "point": "start_box",
+    "start_point": "start_box",
+    "start_box": "start_box",
+    "end_point": "end_box",
+    "end_box": "end_box",
+}
+
+def _unescape(value: str) -> str:
+    """去掉字符串字面量的引号并处理转义"""
+    body = value[1:-1]
+    if "\\" not in body:
+        return body
+    return _ESCAPE_RE.sub(lambda m: _ESCAPES.get(m.group(1), "\\" + m.group(1)), body)
+
+def _skip_line(tokens: List[Tuple[str, str]], i: int) -> int:
+    """跳到下一行，用于跳过无法解析的动作"""
+    while i < len(tokens) and tokens[i][0] != "nl":
+        i += 1
+    return i
+
+def _parse_value(tokens: List[Tuple[str, str]], i: int) -> Tuple[Any, int]:
+    """解析参数值，返回(值, 下一个位置)"""
+    kind, val = tokens[i]
+    if kind == "str":
+        return _unescape(val), i + 1
+    if kind == "num":
+        return (float(val) if "." in val else int(val)), i + 1
+    if kind == "name":
+        return _NAME_CONSTANTS.get(val), i + 1
+    if val == "(":
+        # 元组形式的坐标，如 point=(100, 200)
+        depth, j, nums = 0, i, []
+        while j < len(tokens):
+            if tokens[j][1] == "(":
+                depth += 1
+            elif tokens[j][1] == ")":
+                depth -= 1
+                if depth == 0:
+                    return "(" + ",".join(nums) + ")", j + 1
+            elif tokens[j][0] == "num":
+                nums.append(tokens[j][1])
+            j += 1
+        raise ActionParseError("Unclosed tuple")
+    raise ActionParseError(f"Unexpected token {val!r}")
+
+def _parse_call(tokens: List[Tuple[str, str]], i: int) -> Tuple[str, Dict[str, Any], int]:
+    """解析一个函数调用 name(key=value, ...)，缺少右括号时视为已闭合"""
+    n = len(tokens)
+    if tokens[i][0] != "name":
+        raise ActionParseError(f"Expected function name, got {tokens[i][1]!r}")
+    func_name = tokens[i][1].rsplit(".", 1)[-1]
+    i += 1
+    if i >= n or tokens[i][1] != "(":
+        raise ActionParseError(f"Expected '(' after {func_name}")
+    i += 1
+
+    kwargs = {}
+    while i < n:
+        kind, val = tokens[i]
+        if kind == "nl" or val == ",":
+            i += 1
+            continue
+        if val == ")":
+            return func_name, kwargs, i + 1
+        if kind == "name" and i + 1 < n and tokens[i + 1][1] == "=":
+            value, i = _parse_value(tokens, i + 2)
+            kwargs[val] = value
+        else:
+            # 位置参数不使用，只跳过
+            _, i = _parse_value(tokens, i)
+        if i < n and tokens[i][1] not in (",", ")") and tokens[i][0] != "nl":
+            raise ActionParseError(f"Unexpected token {tokens[i][1]!r}")
+    return func_name, kwargs, i
+
+def _parse_calls(action_str: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """扫描动作字符串，返回所有可解析的函数调用"""
+    tokens = [(m.lastgroup, m.group(m.lastgroup)) for m in _ACTION_TOKEN_RE.finditer(action_str.rstrip())]
+    calls = []
+    i = 0
+    while i < len(tokens):
+        if tokens[i][0] == "nl":
+            i += 1
+            continue
         try:
-            if "(" in text and ")" in text:
-                start_idx = text.find("(")
-                end_idx = text.rfind(")")
-                content = text[start_idx + 1:end_idx].strip()
-                if content.startswith("'") and content.endswith("'"):
-                    content = content[1:-1]
-                elif content.startswith('"') and content.endswith('"'):
-                    content = content[1:-1]
-                
-                return [{
-                    "thought": "",
-                    "action_type": "finished",
-                    "action_inputs": {"content": content},
-                    "raw_text": text
-                }]
-            else:
-                return [{
-                    "thought": "",
-                    "action_type": "finished",
-                    "action_inputs": {"content": ""},
-                    "raw_text": text
-                }]
-        except Exception as e:
-            print(f"Error parsing finished action: {e}")
-            return [{
-                "thought": "",
-                "action_type": "finished",
-                "action_inputs": {"content": ""},
-                "raw_text": text
-            }]
-    
-    if "<point>" in text:
-        text = convert_point_to_coordinates(text)
-    if "point=" in text:
-        text = text.replace("point=", "start_box=")
-    if "start_point=" in text:
-        text = text.replace("start_point=", "start_box=")
-    if "end_point=" in text:
-        text = text.replace("end_point=", "end_box=")
+            func_name, kwargs, i = _parse_call(tokens, i)
+            calls.append((func_name, kwargs))
+        except ActionParseError as e:
+            print(f"Parse action failed: {e}")
+            i = _skip_line(tokens, i + 1)
+    return calls
 
-    smart_h, smart_w = smart_resize(origin_h, origin_w, factor=factor)
+def _build_inputs(kwargs: Dict[str, Any], factor: int, smart_h: int, smart_w: int,
+                  model_type: str) -> Dict[str, Any]:
+    """构建action_inputs，坐标参数统一为start_box/end_box并完成缩放"""
+    action_inputs = {}
+    for k, v in kwargs.items():
+        box_key = _BOX_KEYS.get(k)
+        if box_key is None:
+            action_inputs[k] = v
+            continue
+        nums = [float(n) for n in _NUM_RE.findall(v)] if isinstance(v, str) else []
+        if len(nums) == 2:
+            nums = [nums[0], nums[1], nums[0], nums[1]]
+        if len(nums) != 4:
+            action_inputs[box_key] = v
+            continue
+        if model_type == "qwen25vl":
+            action_inputs[box_key] = [
+                nums[0] * smart_w / 1000,
+                nums[1] * smart_h / 1000,
+                nums[2] * smart_w / 1000,
+                nums[3] * smart_h / 1000
+            ]
+        else:
+            action_inputs[box_key] = [n * factor for n in nums]
+    return action_inputs
+
+def _parse_finished(text: str) -> ParsedAction:
+    """解析以finished开头的输出"""
+    content = ""
+    if "(" in text and ")" in text:
+        content = text[text.find("(") + 1:text.rfind(")")].strip()
+        if content.startswith("content="):
+            content = content[len("content="):].strip()
+        if len(content) >= 2 and content[0] == content[-1] and content[0] in "'\"":
+            content = content[1:-1]
+    return ParsedAction(action_type="finished", action_inputs={"content": content},
+                        thought="", raw_text=text)
 
-    # 提取thought和action
+def parse_actions(text: str, factor: int, origin_h: int, origin_w: int,
+                  model_type: str = "qwen25vl") -> List[ParsedAction]:
+    """单遍解析ui-tars输出为ParsedAction列表，没有Action且无法解析时抛出ActionParseError"""
+    text = text.replace("[EOS]", "").strip()
+    
+    # 检查是否以finished开头
+    if text.lower().startswith("finished"):
+        return [_parse_finished(text)]
+    
+    # 提取thought和action：thought取最后一个"Thought:"到其后第一个"Action:"，action取最后一个"Action:"之后
     thought = None
-    if "Thought:" in text:
-        thought = text.split("Thought:")[-1].split("Action:")[0].strip()
-    if "Action:" in text:
-        action_str = text.split("Action:")[-1].strip()
+    thought_idx = text.rfind("Thought:")
+    if thought_idx >= 0:
+        thought_end = text.find("Action:", thought_idx)
+        thought = text[thought_idx + 8:thought_end if thought_end >= 0 else len(text)].strip()
+    action_idx = text.rfind("Action:")
+    if action_idx >= 0:
+        action_str = text[action_idx + 7:]
     else:
         # 没有Action，尝试直接解析
         thought = ""
         action_str = text
-        try:
-            parsed = parse_action(action_str)
-            if not parsed:
-                raise AssertionError("No Action found in response")
-            func_name = parsed['function']
-            args = parsed['args']
-            action_inputs = {}
-            for k, v in args.items():
-                if k in ["start_box", "end_box", "start_point", "end_point"]:
-                    if isinstance(v, str) and v.startswith("("):
-                        v = v.replace("(", "").replace(")", "")
-                        nums = list(map(float, v.split(",")))
-                        if len(nums) == 2:
-                            nums = [nums[0], nums[1], nums[0], nums[1]]
-                        if model_type == "qwen25vl":
-                            scaled = [
-                                nums[0] * smart_w / 1000,
-                                nums[1] * smart_h / 1000,
-                                nums[2] * smart_w / 1000,
-                                nums[3] * smart_h / 1000
-                            ]
-                        else:
-                            scaled = [n * factor for n in nums]
-                        if k in ["start_point", "start_box"]:
-                            action_inputs["start_box"] = scaled
-                        elif k in ["end_point", "end_box"]:
-                            action_inputs["end_box"] = scaled
-                    else:
-                        action_inputs[k] = v
-                else:
-                    action_inputs[k] = v
-            return [{
-                "thought": thought,
-                "action_type": func_name,
-                "action_inputs": action_inputs,
-                "raw_text": text
-            }]
-        except Exception as e:
-            return [{"error": str(e), "raw_text": text}]
-
-    # 解析动作
-    parsed_actions = []
-    for act in action_str.split(")\n"):
-        if not act.strip():
-            continue
-        if not act.endswith(")"):
-            act += ")"
-        parsed = parse_action(act)
-        if not parsed:
-            continue
-        func_name = parsed['function']
-        args = parsed['args']
-
-        action_inputs = {}
-        for k, v in args.items():
-            if k in ["start_box", "end_box", "start_point", "end_point"]:
-                if isinstance(v, str) and v.startswith("("):
-                    v = v.replace("(", "").replace(")", "")
-                    nums = list(map(float, v.split(",")))
-                    if len(nums) == 2:
-                        nums = [nums[0], nums[1], nums[0], nums[1]]
-                    
-                    if model_type == "qwen25vl":
-                        scaled = [
-                            nums[0] * smart_w / 1000,
-                            nums[1] * smart_h / 1000,
-                            nums[2] * smart_w / 1000,
-                            nums[3] * smart_h / 1000
-                        ]
-                    else:
-                        scaled = [n * factor for n in nums]
-                    
-                    if k in ["start_point", "start_box"]:
-                        action_inputs["start_box"] = scaled
-                    elif k in ["end_point", "end_box"]:
-                        action_inputs["end_box"] = scaled
-                else:
-                    action_inputs[k] = v
-            else:
-                action_inputs[k] = v
+    
+    calls = _parse_calls(action_str)
+    if not calls and action_idx < 0:
+        raise ActionParseError("No Action found in response")
+    
+    smart_h, smart_w = smart_resize(origin_h, origin_w, factor=factor)
+    return [
+        ParsedAction(
+            action_type=func_name,
+            action_inputs=_build_inputs(kwargs, factor, smart_h, smart_w, model_type),
+            thought=thought,
+            raw_text=text
+        )
+        for func_name, kwargs in calls
+    ]
 
-        parsed_actions.append({
-            "thought": thought,
-            "action_type": func_name,
-            "action_inputs": action_inputs,
-            "raw_text": text
-        })
-    return parsed_actions
+def parse_action_to_structure_output(text: str, factor: int, origin_h: int, 
+                                   origin_w: int, model_type: str = "qwen25vl") -> List[Dict[str, Any]]:
+    """解析动作输出为结构化格式"""
+    try:
+        return [action.to_dict() for action in parse_actions(text, factor, origin_h, origin_w, model_type)]
+    except ActionParseError as e:
+        return [{"error": str(e), "raw_text": text}]
+
+# 思考中用引号括起来的目标元素名称，取最后一个（ui-tars 会在思考末尾总结本步要点击的元素）
+_QUOTED_RE = re.compile(r'[“"「『‘\'](.{1,20}?)[”"」』’\']')
+
+def target_name(thought: str) -> Optional[str]:
+    """从动作的思考中提取点击的目标元素名称，无法确定时返回None"""
+    names = [name.strip() for name in _QUOTED_RE.findall(thought or "")]
+    names = [name for name in names if name]
+    return names[-1] if names else None
 
 def calculate_image_similarity(img1_path: str, img2_path: str) -> float:
     """计算两张图片的相似度"""
     try:
         import numpy as np
+        from PIL import Image
         
         img1 = Image.open(img1_path).convert('RGB')
         img2 = Image.open(img2_path).convert('RGB')
@@ -275,8 +369,34 @@ def calculate_image_similarity(img1_path: str, img2_path: str) -> float:
         print(f"图片相似度计算失败: {e}")
         return 0.0
 
+def compute_image_hash(image_path: str, hash_size: int = 8) -> Optional[int]:
+    """计算图片的差值感知哈希（dHash），用于快速判断两帧截图是否相似"""
+    try:
+        from PIL import Image
+        
+        with Image.open(image_path) as img:
+            img = img.convert('L').resize((hash_size + 1, hash_size))
+            pixels = list(img.getdata())
+        
+        value = 0
+        for row in range(hash_size):
+            offset = row * (hash_size + 1)
+            for col in range(hash_size):
+                value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+        return value
+    except Exception as e:
+        print(f"图片哈希计算失败: {e}")
+        return None
+
+def hash_distance(hash1: Optional[int], hash2: Optional[int]) -> int:
+    """两个感知哈希之间的汉明距离，任一为空时返回最大距离"""
+    if hash1 is None or hash2 is None:
+        return 64
+    return bin(hash1 ^ hash2).count("1")
+
 def check_screenshot_service_health() -> bool:
     """检查截图服务健康状态"""
+    import requests
     try:
         r = requests.get(f"{Config.BASE_URL}/ping", timeout=5)
         if r.status_code != 200:
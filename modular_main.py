@@ -12,9 +12,9 @@ from datetime import datetime
 sys.path.append(os.path.join(os.path.dirname(__file__), 'modular'))
 
 from modular import (
-    Config, TaskLogger, KnowledgeManager, ActionExecutor, 
+    Config, TaskLogger, TaskBudget, BUDGET_EXHAUSTED, KnowledgeManager, ActionExecutor, 
     ReflectionManager, PlanningManager, MobileAgent,
-    run_gui_task, decompose_task_to_subtasks
+    run_gui_task, decompose_task_to_subtasks, get_reflection_manager
 )
 
 def main():
@@ -32,8 +32,13 @@ def main():
     task_logger = TaskLogger(original_instruction)
     task_logger.logger.info(f"Starting task: {original_instruction}")
     
+    # 初始化任务预算（token、模型调用次数、耗时）
+    budget = TaskBudget.from_config(task_logger=task_logger)
+    budget_exhausted = False
+    
     # 任务分解并获取task_knowledge
-    subtask_list = decompose_task_to_subtasks(user_instruction=original_instruction, task_logger=task_logger)
+    subtask_list = decompose_task_to_subtasks(user_instruction=original_instruction, task_logger=task_logger,
+                                              budget=budget)
     print(subtask_list)
     
     # 获取已记录的任务知识
@@ -47,6 +52,8 @@ def main():
     actual_completed_subtasks = []  # 跟踪实际完成的子任务列表
     
     while regeneration_cycle < max_regeneration_cycles:
+        if budget_exhausted:
+            break
         if not subtask_list:
             print("没有可执行的子任务，退出")
             break
@@ -61,6 +68,10 @@ def main():
         
         # 执行所有子任务
         for i, task in enumerate(subtask_list):
+            if budget.is_exhausted():
+                print("任务预算已耗尽，停止执行")
+                budget_exhausted = True
+                break
             print(f"\n执行子任务 {task['subtask_id']}：{task['description']}")
             
             # 执行子任务
@@ -72,7 +83,8 @@ def main():
                 completed_subtasks=completed_subtasks,
                 all_subtasks=subtask_list,
                 task_logger=task_logger,
-                task_knowledge=task_knowledge
+                task_knowledge=task_knowledge,
+                budget=budget
             )
             subtask_execution_time = time.time() - subtask_start_time
             
@@ -100,6 +112,12 @@ def main():
                 )
                 # 继续执行下一个子任务
                 continue
+            elif result == BUDGET_EXHAUSTED:
+                print("任务预算已耗尽，停止执行")
+                completed_subtasks.extend([t['description'] for t in subtask_list[:i]])
+                failed_subtasks.append(task['description'])
+                budget_exhausted = True
+                break
             elif result == "FAILED":
                 print("子任务执行失败，重新生成计划也失败")
                 # 记录当前已完成的任务
@@ -138,7 +156,8 @@ def main():
                     from modular import planning_manager
                     new_subtasks = planning_manager.regenerate_plan(
                         original_instruction, reflection_data, completed_subtasks, 
-                        new_screenshot_path, task['description'], task_logger, task_knowledge)
+                        new_screenshot_path, task['description'], task_logger, task_knowledge, budget=budget,
+                        current_plan=subtask_list)
                     if new_subtasks:
                         print(f"重新生成了 {len(new_subtasks)} 个子任务")
                         subtask_list = new_subtasks
@@ -212,7 +231,8 @@ def main():
                     # 总任务完成检查基于所有保存的截图
                     from modular import reflection_manager
                     reflection_data = reflection_manager.check_total_task_completion_with_all_screenshots(
-                        original_instruction, total_task_check_prompt, completed_subtasks, subtask_list, task_logger)
+                        original_instruction, total_task_check_prompt, completed_subtasks, subtask_list, task_logger,
+                        budget=budget)
                     
                     if reflection_data.get("subtask_completed", False):
                         print("总任务已完成！")
@@ -238,7 +258,8 @@ def main():
                         from modular import planning_manager
                         new_subtasks = planning_manager.regenerate_plan(
                             original_instruction, reflection_data, completed_subtasks, 
-                            new_screenshot_path, task_logger=task_logger, task_knowledge=task_knowledge)
+                            new_screenshot_path, task_logger=task_logger, task_knowledge=task_knowledge,
+                            budget=budget, current_plan=subtask_list)
                         if new_subtasks:
                             print(f"重新生成了 {len(new_subtasks)} 个子任务")
                             subtask_list = new_subtasks
@@ -255,17 +276,27 @@ def main():
                 break
     
     # 记录任务完成状态
-    if regeneration_cycle >= max_regeneration_cycles:
+    if budget_exhausted:
+        final_status = BUDGET_EXHAUSTED
+        print(f"任务预算已耗尽，任务执行结束: {budget.get_summary()}")
+    elif regeneration_cycle >= max_regeneration_cycles:
         final_status = "MAX_REGENERATION_CYCLES_REACHED"
         print(f"达到最大重新规划次数 ({max_regeneration_cycles})，任务执行结束")
     else:
         final_status = "COMPLETED"
         print("任务执行完成")
     
-    # 记录任务完成
+    # 报告计划执行结果：顺利完成时写入新计划，否则从计划缓存中删除
+    from modular import planning_manager
+    planning_manager.report_plan_outcome(original_instruction, final_status == "COMPLETED" and not failed_subtasks,
+                                         task_logger)
+    
+    # 记录预算使用和任务完成
+    task_logger.log_budget_event("final", budget.get_summary())
     task_logger.log_task_completion(final_status, actual_completed_subtasks, failed_subtasks)
     
-    # 保存日志
+    # 保存日志（先等待后台接收中的流式反思写完）
+    get_reflection_manager().join_pending()
     task_logger.save_log()
     
     # 打印任务摘要
@@ -281,6 +312,7 @@ def main():
     print(f"总错误次数: {summary['total_errors']}")
     print(f"总截图数量: {summary['total_screenshots']}")
     print(f"最终状态: {summary['final_status']}")
+    print(f"预算使用: {summary['budget']}")
     
     print("\n=== 模型执行时间统计 ===")
     for model, exec_time in summary['model_execution_times'].items():
@@ -1,11 +1,14 @@
 from flask import Flask, request, jsonify, send_file, abort
 from flask_cors import CORS
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from PIL import Image
 import subprocess
+import threading
 import logging
+import select
 import time
 import os
+import re
 
 WAIT_TIME = 3
 RETRY_INTERVAL = 1
@@ -14,22 +17,101 @@ LOCK_TIMEOUT = 10
 # ADB_PATH = 'The Path To ADB'
 ADB_PATH = "~/software/adb/platform-tools-latest-linux/platform-tools/adb"
 SCREENSHOT_DIR = './screenshot'
+PACKAGE_INDEX_TTL = 300  # 已安装应用索引的有效期（秒），请求时可强制刷新
 os.makedirs(SCREENSHOT_DIR, exist_ok=True)
 
 app = Flask(__name__)
 CORS(app)  # 启用跨域支持
 
+# dumpsys window 中的焦点窗口，例如 mCurrentFocus=Window{... u0 com.tencent.mm/com.tencent.mm.ui.LauncherUI}
+FOCUS_RE = re.compile(r"(?:mCurrentFocus|mFocusedApp)=.*?\s([\w.]+)/([\w.$]+)")
+# dumpsys activity 中的前台Activity，例如 mResumedActivity: ActivityRecord{... u0 com.tencent.mm/.ui.LauncherUI t12}
+RESUMED_RE = re.compile(r"(?:mResumedActivity|topResumedActivity)[:=].*?\s([\w.]+)/([\w.$]+)")
+# 启动应用时允许的包名和Activity名
+PACKAGE_NAME_RE = re.compile(r"^[A-Za-z0-9_.]+$")
+ACTIVITY_NAME_RE = re.compile(r"^[A-Za-z0-9_.$/]+$")
+
+class ShellSession:
+    """常驻的 adb shell 会话，查询类命令不必每次都启动一个adb进程
+
+    读取输出依赖 select 等待管道，只在POSIX系统上可用（Windows 上 select 不支持管道）。
+    """
+
+    def __init__(self, adb_path: str):
+        self.adb_path = adb_path
+        self.proc = None
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc = None
+
+    def run(self, command: str, timeout: float = 5.0) -> str:
+        """在会话中执行命令并返回输出；任何错误（超时、会话断开、管道错误）都关闭会话并抛出异常"""
+        with self.lock:
+            try:
+                if self.proc is None or self.proc.poll() is not None:
+                    self.proc = subprocess.Popen(f"{self.adb_path} shell", shell=True, stdin=subprocess.PIPE,
+                                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                self.counter += 1
+                # 结束标记由shell拼接输出，即使会话回显输入，回显的命令中也不包含完整的标记
+                marker = f"__done_{self.counter}__".encode()
+                self.proc.stdin.write(f"{command}; echo \"__done_\"\"{self.counter}__\"\n".encode())
+                self.proc.stdin.flush()
+                fd = self.proc.stdout.fileno()
+                output = b""
+                deadline = time.time() + timeout
+                while marker not in output:
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                        raise TimeoutError(f"adb shell 命令超时: {command}")
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        raise RuntimeError("adb shell 会话已断开")
+                    output += chunk
+                return output.split(marker)[0].decode("utf-8", errors="replace")
+            except BaseException:
+                # 不关闭的话未读取的输出会留在管道里，之后的写入可能在持有锁时永久阻塞
+                self.close()
+                raise
+
+
 @dataclass
 class AndroidEnv:
     adb_path: str
     start_time: float = time.time()
+    package_index: dict = field(default_factory=dict)  # 包名 -> 启动Activity（未知时为None）
+    package_index_time: float = 0.0
+    shell_session: ShellSession = None
+    shell_session_disabled: bool = os.name == "nt"  # Windows 上不使用常驻会话；会话失败一次后也不再使用
+    package_index_lock: threading.Lock = field(default_factory=threading.Lock)
 
-    def run_command(self, command: str):
-        full_command = f"{self.adb_path} {command}"
-        result = subprocess.run(full_command, capture_output=True, text=True, shell=True)
+    def run_command(self, command):
+        """执行adb命令；command 为列表时作为参数列表直接执行，不经过shell"""
+        if isinstance(command, list):
+            full_command = [os.path.expanduser(self.adb_path)] + command
+            result = subprocess.run(full_command, capture_output=True, text=True)
+        else:
+            full_command = f"{self.adb_path} {command}"
+            result = subprocess.run(full_command, capture_output=True, text=True, shell=True)
         logging.info(f"Executed: {full_command}\n{result.stdout}\n{result.stderr}")
         return result
 
+    def run_shell(self, command: str) -> str:
+        """通过常驻会话执行shell命令，会话不可用时退回单独的adb命令"""
+        if not self.shell_session_disabled:
+            if self.shell_session is None:
+                self.shell_session = ShellSession(self.adb_path)
+            try:
+                return self.shell_session.run(command)
+            except Exception as e:
+                logging.warning(f"adb shell 会话执行失败，之后改用单独的命令: {e}")
+                self.shell_session_disabled = True
+                self.shell_session = None
+        return self.run_command(f"shell \"{command}\"").stdout
+
     def get_screenshot(self):
         self.run_command("shell screencap -p /sdcard/screenshot.png")
         time.sleep(0.5)
@@ -109,6 +191,68 @@ class AndroidEnv:
 
     def long_press(self, x, y):
         self.run_command(f"shell input swipe {x} {y} {x} {y} 1000")
+
+    def get_package_index(self, refresh=False):
+        """已安装应用及其启动Activity，超过有效期或refresh时重新读取"""
+        with self.package_index_lock:
+            if not refresh and self.package_index and time.time() - self.package_index_time < PACKAGE_INDEX_TTL:
+                return self.package_index
+            return self._load_package_index()
+
+    def _load_package_index(self):
+        index = {}
+        result = self.run_command("shell cmd package query-activities --brief --components "
+                                  "-a android.intent.action.MAIN -c android.intent.category.LAUNCHER")
+        for line in result.stdout.splitlines():
+            line = line.strip()
+            if "/" in line and " " not in line:
+                package, activity = line.split("/", 1)
+                if activity.startswith("."):
+                    activity = package + activity
+                index.setdefault(package, activity)
+        if not index:
+            # 旧版本系统没有 query-activities，只列出包名，启动时用 monkey 解析启动Activity
+            result = self.run_command("shell pm list packages")
+            for line in result.stdout.splitlines():
+                if line.startswith("package:"):
+                    index[line[len("package:"):].strip()] = None
+        self.package_index = index
+        self.package_index_time = time.time()
+        return index
+
+    def get_foreground(self):
+        """当前前台应用的包名和Activity"""
+        output = self.run_shell("dumpsys window | grep -E 'mCurrentFocus|mFocusedApp'")
+        match = FOCUS_RE.search(output)
+        if not match:
+            output = self.run_shell("dumpsys activity activities | grep -E 'mResumedActivity|topResumedActivity'")
+            match = RESUMED_RE.search(output)
+        if not match:
+            return {"package": None, "activity": None}
+        package, activity = match.groups()
+        if activity.startswith("."):
+            activity = package + activity
+        return {"package": package, "activity": activity}
+
+    def launch_app(self, package, activity=None):
+        """用 am start 启动应用并返回启动后的前台应用；包名必须是已安装的应用"""
+        if not isinstance(package, str) or not PACKAGE_NAME_RE.match(package):
+            raise ValueError(f"包名不合法: {package!r}")
+        if activity is not None and (not isinstance(activity, str) or not ACTIVITY_NAME_RE.match(activity)):
+            raise ValueError(f"Activity名不合法: {activity!r}")
+        index = self.get_package_index()
+        if package not in index:
+            index = self.get_package_index(refresh=True)
+            if package not in index:
+                raise ValueError(f"应用未安装: {package}")
+        if activity is None:
+            activity = index[package]
+        if activity:
+            self.run_command(["shell", "am", "start", "-W", "-n", f"{package}/{activity}"])
+        else:
+            self.run_command(["shell", "monkey", "-p", package, "-c", "android.intent.category.LAUNCHER", "1"])
+            time.sleep(1)
+        return self.get_foreground()
     # def back(self):
     #     self.tap(x=250, y=2300)
     #     # command = adb_path + f" shell input keyevent 4"
@@ -140,6 +284,32 @@ def screenshot():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/packages", methods=["GET"])
+def packages():
+    try:
+        refresh = request.args.get("refresh", "0") in ("1", "true")
+        index = android_env.get_package_index(refresh=refresh)
+        return jsonify({
+            "packages": [{"package": p, "activity": a} for p, a in index.items()],
+            "updated_at": android_env.package_index_time
+        })
+    except Exception as e:
+        logging.error(str(e))
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/foreground", methods=["GET"])
+def foreground():
+    try:
+        start = time.time()
+        result = android_env.get_foreground()
+        result["elapsed_ms"] = round((time.time() - start) * 1000, 1)
+        return jsonify(result)
+    except Exception as e:
+        logging.error(str(e))
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/action", methods=["POST"])
 def action_exe():
     data = request.get_json()
@@ -161,6 +331,12 @@ def action_exe():
         elif action_type == "long_press":
             x, y = data["x"], data["y"]
             android_env.long_press(x, y)
+        elif action_type == "launch":
+            try:
+                foreground = android_env.launch_app(data["package"], data.get("activity"))
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify({"status": "success", "foreground": foreground})
         else:
             return jsonify({"error": "Unknown action type"}), 400
         return jsonify({"status": "success"})